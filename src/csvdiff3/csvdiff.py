@@ -1,12 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import abc
+import array
 import binascii
+import bisect
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import copy
 import csv
+import datetime
+import decimal
 import functools
+import hashlib
+import heapq
+import importlib
+import io
+import itertools
+import json
 import logging
+import mmap
+import operator
 import os
+import pickle
+import queue
+import shutil
+import stat
 import sys
+import tempfile
+import threading
 import time
 import traceback
 import unicodedata
@@ -29,9 +52,9 @@ def show_execution_time():
             func(*args, **kwargs)
 
             elapsed_time = time.perf_counter() - start
-            print()
-            print(f'elapsed_time={elapsed_time}[sec]')
-            print()
+            output.write_line()
+            output.write_line(f'elapsed_time={elapsed_time}[sec]')
+            output.write_line()
 
         return wrapper
 
@@ -47,7 +70,7 @@ def spacing_before(number_of_lines):
         def wrapper(*args, **kwargs):
 
             for i in range(number_of_lines):
-                print('')
+                output.write_line('')
 
             func(*args, **kwargs)
 
@@ -65,14 +88,36 @@ def main():
 
     configure()
 
+    if sys.argv[1:2] == [IndexMode.COMMAND]:
+        context = index_context_from_arguments()
+        configure(context.log_level, context.log_file_path)
+        output.open()
+        try:
+            build_index_in(context)
+        finally:
+            output.close()
+        return
+
     context = context_from_arguments()
+    configure(context.log_level, context.log_file_path)
     show_context_for_debugging(context)
 
+    output.open(context.output_file_path, context.flush_interval)
     try:
-        run_in(context)
-    except IndexError as e:
-        logger.error(f'It is possible that the number of columns in the row is not aligned. Please check the csv data. If not, please file an issue. [{type(e)}, description={e}]')
-        sys.exit(1)
+        with ExitStatus.for_trouble_in(context.is_quiet):
+            try:
+                has_difference = run_in(context)
+            except IndexError as e:
+                logger.error(f'It is possible that the number of columns in the row is not aligned. Please check the csv data. If not, please file an issue. [{type(e)}, description={e}]')
+                sys.exit(1)
+            except csv.Error as e:
+                logger.error(f'The CSV data could not be parsed. Please check the csv data, or the conditions of the CSV files (see -h). [{type(e)}, description={e}]')
+                sys.exit(1)
+    finally:
+        output.close()
+
+    if context.is_quiet:
+        sys.exit(ExitStatus.DIFFERENT if has_difference else ExitStatus.SAME)
 
 
 class App(type):
@@ -81,55 +126,182 @@ class App(type):
     VERSION = '1.0.0'
 
 
+class ExitStatus(type):
+    """ For --quiet, as diff and cmp do. Otherwise, the exit status is 0, or 1 for trouble. """
+
+    SAME = 0
+    DIFFERENT = 1
+    TROUBLE = 2
+
+    @classmethod
+    @contextlib.contextmanager
+    def for_trouble_in(cls, is_quiet):
+        """
+        Trouble exits with 1 everywhere, so it is turned into TROUBLE not to be taken for DIFFERENT.
+        An unexpected exception, such as a decoding error of the CSV file, would also exit with 1 from the interpreter.
+        The reports made so far are flushed first, to be written before the messages and the traceback on the standard error.
+        """
+
+        try:
+            yield
+        except SystemExit as e:
+            output.flush()
+            if is_quiet and e.code == 1:
+                sys.exit(cls.TROUBLE)
+            raise
+        except Exception as e:
+            output.flush()
+            if not is_quiet:
+                raise
+            logger.error(f'Could not complete the diff. [{type(e)}, description={e}]')
+            sys.exit(cls.TROUBLE)
+
+
+class IndexMode(type):
+
+    COMMAND = 'index'
+
+
 class LoggingConfig(type):
 
-    # For debug, play with the CONSOLE_LEVEL or FILE_LEVEL.
+    # For debug, specify --log-level DEBUG, and --log-file to keep the log.
 
-    BASE_LEVEL = logging.DEBUG
+    LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+    DEFAULT_LEVEL = 'ERROR'
 
-    CONSOLE_LEVEL = logging.ERROR
     CONSOLE_FORMAT = '%(levelname)s: %(message)s'
-
-    FILE_LEVEL = logging.WARNING
     FILE_FORMAT = '%(asctime)s: %(levelname)s: %(message)s'
-    FILE_PATH = 'csvdiff.log'
 
 
 logger: Logger = logging.getLogger(__name__)
 
 
-def configure():
+class ReportFlushingStreamHandler(logging.StreamHandler):
+    """ Flushes the reports buffered in the output sink before a message is written to the standard error, to keep them in the order they are made. """
 
-    logging.basicConfig(level=LoggingConfig.BASE_LEVEL)
+    def emit(self, record):
+        output.flush()
+        super(ReportFlushingStreamHandler, self).emit(record)
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(LoggingConfig.CONSOLE_LEVEL)
-    stream_handler.setFormatter(logging.Formatter(LoggingConfig.CONSOLE_FORMAT))
 
-    file_handler = logging.FileHandler(filename=LoggingConfig.FILE_PATH, mode='w')
-    file_handler.setLevel(LoggingConfig.FILE_LEVEL)
-    file_handler.setFormatter(logging.Formatter(LoggingConfig.FILE_FORMAT))
+def configure(level=LoggingConfig.DEFAULT_LEVEL, file_path=None):
+    """
+    Configured with the default first to report errors in the arguments, then configured again with the arguments.
+    The level is set on the logger itself, so messages below it are discarded before any LogRecord is made.
+    """
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    logger.setLevel(level)
 
+    stream_handler = ReportFlushingStreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LoggingConfig.CONSOLE_FORMAT))
     logger.addHandler(stream_handler)
-    logger.addHandler(file_handler)
+
+    if file_path:
+        file_handler = logging.FileHandler(filename=file_path, mode='w')
+        file_handler.setFormatter(logging.Formatter(LoggingConfig.FILE_FORMAT))
+        logger.addHandler(file_handler)
 
     logger.propagate = False
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-#  Context Preparation
+#  Output
 # ----------------------------------------------------------------------------------------------------------------------
 
-def context_from_arguments():
+class OutputSink:
+    """
+    Notes
+    -----
+    All reports are written through this sink, instead of print() for each line.
+        * Lines (and pieces of a long line) are joined and encoded at once, and written to the binary buffer of the standard output (or the output file) in blocks of about BUFFER_SIZE characters
+        * The blocks are also written every flush interval in seconds if specified, and at the end
+        * The standard output is looked up on every write, since it may be replaced (e.g. by the tests capturing it)
+    """
 
-    def arg_type_matching_key_in_csv(x):
-        return list(map(MatchingKeyInfo, x.split(',')))
+    BUFFER_SIZE = 1024 * 1024
+    FILE_ENCODING = 'utf-8'
 
-    def arg_type_int_in_csv(x):
-        return list(map(int, x.split(',')))
+    def __init__(self):
+
+        self._pieces = []
+        self._size = 0
+        self._file = None
+        self._flush_interval = 0
+        self._last_flushed = time.monotonic()
+
+    def open(self, file_path=None, flush_interval=0):
+        """ Write to the file if specified, otherwise to the standard output. """
+
+        self.close()
+
+        self._file = open(file_path, mode='wb') if file_path else None
+        self._flush_interval = flush_interval
+        self._last_flushed = time.monotonic()
 
+    def write_line(self, line=''):
+        self.write(line + '\n')
 
-    parser = ArgumentParser(prog=App.NAME, formatter_class=ArgumentDefaultsHelpFormatter)
+    def write(self, text):
+
+        self._pieces.append(text)
+        self._size += len(text)
+
+        if self._size >= self.BUFFER_SIZE or (self._flush_interval and time.monotonic() - self._last_flushed >= self._flush_interval):
+            self.flush()
+
+    def flush(self):
+
+        if self._pieces:
+            self._write(''.join(self._pieces))
+
+        self._pieces.clear()
+        self._size = 0
+        self._last_flushed = time.monotonic()
+
+    def close(self):
+
+        self.flush()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, text):
+
+        if self._file is not None:
+            self._file.write(text.encode(self.FILE_ENCODING))
+            return
+
+        stream = sys.stdout
+        binary = getattr(stream, 'buffer', None)
+        if binary is None:
+            stream.write(text)
+            stream.flush()
+            return
+
+        # What has been written to the text layer goes first, and line feeds are written as the text layer does
+        stream.flush()
+        if os.linesep != '\n':
+            text = text.replace('\n', os.linesep)
+        binary.write(text.encode(stream.encoding, stream.errors))
+        binary.flush()
+
+
+output = OutputSink()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  Context Preparation
+# ----------------------------------------------------------------------------------------------------------------------
+
+def context_from_arguments(arguments=None):
+
+    parser = ArgumentParser(prog=App.NAME, formatter_class=ArgumentDefaultsHelpFormatter,
+                            epilog=f'To diff a file named "{IndexMode.COMMAND}" on the left-hand side, specify it with its directory, e.g. ./{IndexMode.COMMAND}, not to be taken for the index mode.')
 
     # Program name & Version -------------------------------------------------------------------------------------------
     parser.add_argument('--version', action='version', version=f'%(prog)s {App.VERSION}')
@@ -138,6 +310,26 @@ def context_from_arguments():
     parser.add_argument('lhs_file_name', type=str, help='Absolute/Relative path to left-hand side file.')
     parser.add_argument('rhs_file_name', type=str, help='Absolute/Relative path to right-hand side file.')
 
+    add_options_for_diff(parser)
+
+    args = parser.parse_args(arguments)
+    with ExitStatus.for_trouble_in(args.quiet):
+        return Context(args)
+
+
+def add_options_for_diff(parser):
+    """ Shared with the index mode, so that the options for the CSV file are parsed in the same way, in any order. """
+
+    def arg_type_matching_key_in_csv(x):
+        return list(map(MatchingKeyInfo, x.split(',')))
+
+    def arg_type_int_in_csv(x):
+        return list(map(int, x.split(',')))
+
+    def arg_type_str_in_csv(x):
+        return x.split(',')
+
+
     # Input CSV file encodings -----------------------------------------------------------------------------------------
     parser.add_argument('-e', '--encoding', type=str, default=None,
                         help='Encoding of the CSV files. (refer public reference named "Standard encoding") e.g.: shift_jis')
@@ -146,14 +338,44 @@ def context_from_arguments():
                         help='Encoding of the CSV file on the left side. (refer public reference named "Standard encoding") e.g.: shift_jis')
     parser.add_argument('--encoding-for-rhs', type=str, default='utf8',
                         help='Encoding of the CSV file on the right side. (refer public reference named "Standard encoding") e.g.: shift_jis')
+    parser.add_argument('--compare-bytes', default=False, action='store_true',
+                        help='Match and compare the rows on their bytes, and decode only the rows to be reported. Both CSV files should be in the same ASCII compatible encoding.'
+                             ' Non-ASCII matching keys are compared in the order of bytes.')
 
     # Matching conditions ----------------------------------------------------------------------------------------------
     parser.add_argument('-k', '--matching-keys', type=arg_type_matching_key_in_csv, default='0',
-                        help='Matching key indices(from 0) for Input CSV in CSV format. For non-fixed length numbers, specify the number of digits after ":". e.g.: 0:8,3')
+                        help='Matching key indices(from 0) for Input CSV in CSV format. For non-fixed length numbers, specify the number of digits after ":".'
+                             ' Or specify the type of the key (int, decimal, date as YYYY-MM-DD, str) after ":" to compare the keys as the type. e.g.: 0:8,3 or 0:int,3:date')
     parser.add_argument('-u', '--unique-key', default=False, action='store_true',
                         help="Specify if the matching key is unique. Then, if it detects that the matching key is not unique, an error will occur.")
     parser.add_argument('-i', '--ignore-columns', type=arg_type_int_in_csv, default=[],
                         help='Specify the index of the column to be ignored in CSV format. e.g.: 3,7')
+    parser.add_argument('--key-from', type=arg_type_str_in_csv, default=None,
+                        help='Diff only the rows whose matching keys are not less than the specified values, in CSV format in the order of -k.'
+                             ' The CSV files must be sorted by the matching keys. e.g.: key1-2,key2-1')
+    parser.add_argument('--key-to', type=arg_type_str_in_csv, default=None,
+                        help='Diff only the rows whose matching keys are not greater than the specified values, in CSV format in the order of -k.'
+                             ' The CSV files must be sorted by the matching keys. e.g.: key1-8,key2-1')
+
+    # Matching engines -------------------------------------------------------------------------------------------------
+    parser.add_argument('--matching-engine', type=str, default='sort-merge', choices=['sort-merge', 'external-sort', 'hash-join'],
+                        help='sort-merge: Match the CSV files sorted by the matching keys. external-sort: Sort the CSV files by the matching keys in advance with bounded memory, then match them.'
+                             ' hash-join: Keep the smaller CSV file in memory by the matching keys, and match the other one against it. The CSV files need not be sorted.')
+    parser.add_argument('--sort-memory-budget', type=int, default=256,
+                        help='Memory budget in MiB (1 or more) for sorting each CSV file with the external-sort engine. Rows beyond this are spilled to temporary files as sorted runs.')
+    parser.add_argument('--partitions', type=int, default=1,
+                        help='Split both sorted CSV files into the specified number of key ranges, and match them in parallel on separate worker processes. 0 means the number of CPUs.')
+    parser.add_argument('--read-ahead', type=int, default=0,
+                        help='Read each CSV file ahead on a background thread in batches of the specified number of rows, while matching the rows read so far.'
+                             ' This helps when reading is slow, such as on a network file system. 0 means reading on the matching thread.')
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help='Split each CSV file into chunks at row boundaries, and parse them on the specified number of worker processes while matching in the order of the file.'
+                             ' 0 means parsing on the matching process.')
+    parser.add_argument('--memory-map', default=False, action='store_true',
+                        help='Read the rows over the memory-mapped bytes of each CSV file, and parse the columns other than the matching keys only when the rows are compared or reported.'
+                             ' This helps when most of the rows are the same. Not available for compressed CSV files nor pipes.')
+    parser.add_argument('--temp-dir', type=str, default=None,
+                        help='Directory for temporary files such as the sorted runs of the external-sort engine. If not specified, the system default is used.')
 
     # Report styles ----------------------------------------------------------------------------------------------------
     parser.add_argument('-v', '--vertical-style', default=False, action='store_true',
@@ -167,10 +389,23 @@ def context_from_arguments():
                                help='Report the lines with the difference. Can be used with option -c. Cannot be used with option -a.')
     display_group.add_argument('-a', '--show-all-lines', action='store_true',
                                help='Report on all lines. Can be used with option -c. Cannot be used with option -d.')
+    display_group.add_argument('-q', '--quiet', default=False, action='store_true',
+                               help='Report nothing, and stop at the first difference (or at --max-differences).'
+                                    ' The exit status is 0 if the files are the same, 1 if they are different, and 2 if trouble. Cannot be used with option -d nor -a.')
+
+    parser.add_argument('--max-differences', type=int, default=0,
+                        help='Stop matching when this number of differences (lines with the difference, and lines existing only on one side) are found.'
+                             ' The horizontal report is then laid out in a single pass, not to read the whole files for the layout. 0 means no limit.')
+
+    parser.add_argument('--without-row-numbers', default=False, action='store_true',
+                        help='Report only the number of differences with option -c, without the row numbers. The row numbers are not kept in memory then.')
 
     parser.add_argument('-x', '--show-context-from-arguments', default=False, action='store_true',
                         help='Report the context generated from the arguments and CSV sniffing.')
 
+    parser.add_argument('--single-pass', default=False, action='store_true',
+                        help='Report in horizontal style without pre-scanning the whole files. The reported lines are spooled to a temporary file and laid out at the end.')
+
     # CSV analysis conditions ------------------------------------------------------------------------------------------
     parser.add_argument('-H', '--header', type=str, default=None, choices=['n', 'y'],
                         help='If specified, this specification will be enforced.')
@@ -178,6 +413,12 @@ def context_from_arguments():
     parser.add_argument('-S', '--sniffing-size', type=str, default=4096,
                         help="If csv sniffing fails, try specifying a size larger than 4096. Or Explicitly specify CSV file conditions like '--column-separator-for-lhs TAB'. Check help with -h option.")
 
+    parser.add_argument('--pre-scan-cache', default=False, action='store_true',
+                        help='Keep the result of pre-scanning for the horizontal report in a sidecar file next to each CSV file, and reuse it while the file is unchanged.')
+
+    parser.add_argument('--parallel-pre-scan', default=False, action='store_true',
+                        help='Pre-scan the left-hand side and right-hand side files for the horizontal report at the same time on separate worker processes.')
+
     parser.add_argument('-F', '--force-individual-specs', action='store_true',
                         help="If you don't want to rely on csv sniffing, specify it, and then specify --column-separator and so on separately.")
 
@@ -218,9 +459,46 @@ def context_from_arguments():
     parser.add_argument('--no-skip-space-after-column-separator-for-rhs', default=False, action='store_true',
                         help='Specify when you want to treat the space immediately after the separator as data for the CSV file on the right side.')
 
-    # ------------------------------------------------------------------------------------------------------------------
+    # Output -----------------------------------------------------------------------------------------------------------
+    parser.add_argument('--output-format', type=str, default='text', choices=['text', 'jsonl', 'csv'],
+                        help='text: Report for people in the style specified above. jsonl, csv: Report a JSON object or a CSV record for each line with the difference (or each line with -a),'
+                             ' with the DIFF-MARK (or "=" for the same lines), the row numbers, the matching key and the column indices with difference. The heading and the count are not reported.')
+    parser.add_argument('--output-file', type=str, default=None,
+                        help='Path to the file to write the report to in UTF-8. If not specified, the report is written to the standard output.')
+    parser.add_argument('--flush-interval', type=float, default=0,
+                        help='Interval in seconds to write out the buffered report, to see the progress of a long diff. 0 means writing out only when the buffer is full and at the end.')
+
+    # Logging ----------------------------------------------------------------------------------------------------------
+    parser.add_argument('--log-level', type=str, default=LoggingConfig.DEFAULT_LEVEL, choices=LoggingConfig.LEVELS,
+                        help='Level of the log messages to be reported to the standard error and the log file.')
+    parser.add_argument('--log-file', type=str, default=None,
+                        help='Path to the log file. If not specified, the log is not written to a file.')
+
+
+def index_context_from_arguments(arguments=None):
+    """ The CSV file is given as both sides to the context for the diff, so that the dialect is fixed in the same way. """
+
+    parser = ArgumentParser(prog=f'{App.NAME} {IndexMode.COMMAND}', formatter_class=ArgumentDefaultsHelpFormatter,
+                            description='Write a sparse index of the matching keys next to the CSV file sorted by the matching keys.',
+                            epilog='The options for the CSV file (e.g. -k, -e, -H) are the same as the ones for the diff.'
+                                   ' Specify the same ones when diffing, otherwise the index is not used. The options only for the report are ignored.')
+
+    parser.add_argument('file_name', type=str, help='Absolute/Relative path to the CSV file to be indexed.')
+    parser.add_argument('--index-interval', type=int, default=SparseKeyIndex.DEFAULT_INTERVAL,
+                        help='Record every N-th row in the index.')
+
+    add_options_for_diff(parser)
+
+    args = parser.parse_args(sys.argv[2:] if arguments is None else arguments)
+
+    if args.index_interval < 1:
+        logger.error(f'index interval should be 1 or more. [index_interval={args.index_interval}]')
+        sys.exit(1)
 
-    return Context(parser.parse_args())
+    args.lhs_file_name = args.rhs_file_name = args.file_name
+    context = Context(args)
+    context.index_interval = args.index_interval
+    return context
 
 
 class Context:
@@ -247,6 +525,15 @@ class Context:
         self.lhs_file_path = os.path.abspath(args.lhs_file_name)
         self.rhs_file_path = os.path.abspath(args.rhs_file_name)
 
+        # Compressed files are decompressed while being read, so byte offsets in them are not available
+        self.compression_for_lhs = CompressedFile.compression_of(self.lhs_file_path)
+        self.compression_for_rhs = CompressedFile.compression_of(self.rhs_file_path)
+        self.reads_compressed_file = self.compression_for_lhs is not None or self.compression_for_rhs is not None
+
+        # Pipes (e.g. process substitution, /dev/stdin) are read only once, except for what RewindableStream records
+        self.reads_pipe = RewindableStream.is_pipe(self.lhs_file_path) or RewindableStream.is_pipe(self.rhs_file_path)
+        self.knows_byte_offsets = not self.reads_compressed_file and not self.reads_pipe
+
         # Input CSV file encodings -------------------------------------------------------------------------------------
         if args.encoding:
             self.encoding_for_lhs = args.encoding
@@ -255,10 +542,32 @@ class Context:
             self.encoding_for_lhs = args.encoding_for_lhs
             self.encoding_for_rhs = args.encoding_for_rhs
 
+        # The files are read in the encoding for reading bytes, and the rows are decoded in the text encodings to be reported
+        self.compares_bytes = args.compare_bytes
+        self.text_encoding_for_lhs = self.encoding_for_lhs
+        self.text_encoding_for_rhs = self.encoding_for_rhs
+        if self.compares_bytes:
+            self.encoding_for_lhs = ByteComparison.ENCODING
+            self.encoding_for_rhs = ByteComparison.ENCODING
+
         # Matching conditions ------------------------------------------------------------------------------------------
         self.matching_key_codec = MatchingKeyCodec(args.matching_keys)
         self.key_should_be_unique = args.unique_key
         self.column_indices_to_ignore = args.ignore_columns
+        self.key_from = self._managed_key_for_range(args.key_from, '--key-from')
+        self.key_to = self._managed_key_for_range(args.key_to, '--key-to')
+        self.restricts_key_range = self.key_from is not None or self.key_to is not None
+
+        # Matching engines ---------------------------------------------------------------------------------------------
+        self.matching_engine = args.matching_engine
+        self.sort_memory_budget = args.sort_memory_budget * 1024 * 1024
+        self.number_of_partitions = args.partitions or os.cpu_count() or 1
+        self.read_ahead_size = args.read_ahead
+        # The chunks of the whole file do not apply to a key range, and chunks can not be read separately without byte offsets
+        self.number_of_parse_processes = args.parse_processes if not self.restricts_key_range and self.knows_byte_offsets else 0
+        # Only local files can be mapped
+        self.maps_files = args.memory_map and self.knows_byte_offsets
+        self.temp_dir = args.temp_dir
 
         # Report styles ------------------------------------------------------------------------------------------------
         self.reports_in_vertical_style = args.vertical_style
@@ -267,10 +576,24 @@ class Context:
         self.shows_count = args.show_count
         self.shows_difference_only = args.show_difference_only
         self.shows_all_lines = args.show_all_lines
+        # Records of the machine-readable formats are the details, so the lines with the difference are reported unless all lines are
+        self.output_format = args.output_format
+        self.reports_in_text = self.output_format == 'text'
+        if not self.reports_in_text and not self.shows_all_lines:
+            self.shows_difference_only = True
+
+        # Nothing is reported in quiet mode, and the exit status tells whether there is a difference
+        self.is_quiet = args.quiet
+        if self.is_quiet:
+            self.shows_count = self.shows_difference_only = self.reports_in_text = False
+        self.max_differences = args.max_differences or (1 if self.is_quiet else 0)
+
         self.shows_details = True if self.shows_difference_only or self.shows_all_lines else False
         self.shows_context_from_arguments = args.show_context_from_arguments
+        self.shows_row_numbers = not args.without_row_numbers
 
-        self.needs_size_info_for_padding = self.shows_details and self.reports_in_horizontal_style
+        self.reports_in_single_pass = self.shows_details and self.reports_in_text and self.reports_in_horizontal_style and (args.single_pass or self.number_of_partitions > 1 or self.max_differences > 0)
+        self.needs_size_info_for_padding = self.shows_details and self.reports_in_text and self.reports_in_horizontal_style and not self.reports_in_single_pass
 
         # CSV analysis conditions --------------------------------------------------------------------------------------
         self.header = args.header
@@ -278,8 +601,16 @@ class Context:
 
         self.sniffing_size = args.sniffing_size
 
+        # The pre-scanning result of the whole file does not apply to a key range, and a pipe can not be read again by another process
+        self.uses_pre_scan_cache = args.pre_scan_cache and not self.restricts_key_range and not self.reads_pipe
+        self.pre_scans_in_parallel = args.parallel_pre_scan and not self.restricts_key_range and not self.reads_pipe
+
         self.forces_individual_specs = args.force_individual_specs
 
+        # Fixed with the dialect by CsvDialectFixer
+        self.splits_rows_simply_for_lhs = False
+        self.splits_rows_simply_for_rhs = False
+
         if self.forces_individual_specs and args.column_separator:
             self.column_separator_for_lhs = self.COLUMN_SEPARATOR_s[args.column_separator]
             self.column_separator_for_rhs = self.COLUMN_SEPARATOR_s[args.column_separator]
@@ -316,11 +647,24 @@ class Context:
             self.skips_space_after_column_separator_for_rhs = True
 
 
+        # Output -------------------------------------------------------------------------------------------------------
+        self.output_file_path = os.path.abspath(args.output_file) if args.output_file else None
+        self.flush_interval = args.flush_interval
+
+        # Logging ------------------------------------------------------------------------------------------------------
+        self.log_level = args.log_level
+        self.log_file_path = os.path.abspath(args.log_file) if args.log_file else None
+
         self._validate()
         self._normalize()
 
     def _validate(self):
 
+        self._validate_file_paths()
+        self._validate_options()
+
+    def _validate_file_paths(self):
+
         if not os.path.exists(self.lhs_file_path):
             logger.error(f'lhs_file_path not exists. [lhs_file_path={self.lhs_file_path}]')
             sys.exit(1)
@@ -328,16 +672,66 @@ class Context:
             logger.error(f'rhs_file_path not exists. [rhs_file_path={self.rhs_file_path}]')
             sys.exit(1)
 
-        if not os.path.isfile(self.lhs_file_path):
-            logger.error(f'lhs_file_path is not a file. [lhs_file_path={self.lhs_file_path}]')
+        if not self._is_readable_file_type(self.lhs_file_path):
+            logger.error(f'lhs_file_path is not a file. It should be a regular file, a pipe or a character device. [lhs_file_path={self.lhs_file_path}]')
+            sys.exit(1)
+        if not self._is_readable_file_type(self.rhs_file_path):
+            logger.error(f'rhs_file_path is not a file. It should be a regular file, a pipe or a character device. [rhs_file_path={self.rhs_file_path}]')
+            sys.exit(1)
+
+    @staticmethod
+    def _is_readable_file_type(file_path):
+        """ Pipes (e.g. process substitution <(...)) and character devices (e.g. /dev/stdin on a terminal) are read as streams. Directories, sockets and block devices are not. """
+
+        mode = os.stat(file_path).st_mode
+        return stat.S_ISREG(mode) or stat.S_ISFIFO(mode) or stat.S_ISCHR(mode)
+
+    def _validate_options(self):
+
+        if self.compares_bytes and not ByteComparison.is_applicable(self.text_encoding_for_lhs, self.text_encoding_for_rhs):
+            logger.error(f'--compare-bytes is available only when both sides are in the same ASCII compatible encoding. [encoding_for_lhs={self.text_encoding_for_lhs}, encoding_for_rhs={self.text_encoding_for_rhs}]')
+            sys.exit(1)
+
+        if self.number_of_parse_processes < 0:
+            logger.error(f'--parse-processes should not be negative. [parse_processes={self.number_of_parse_processes}]')
+            sys.exit(1)
+        if self.sort_memory_budget < 1:
+            logger.error(f'--sort-memory-budget should be 1 or more. [sort_memory_budget={self.sort_memory_budget // (1024 * 1024)}]')
+            sys.exit(1)
+        if self.max_differences < 0:
+            logger.error(f'--max-differences should not be negative. [max_differences={self.max_differences}]')
+            sys.exit(1)
+        if self.read_ahead_size < 0:
+            logger.error(f'--read-ahead should not be negative. [read_ahead={self.read_ahead_size}]')
+            sys.exit(1)
+
+        if self.restricts_key_range and self.matching_engine != 'sort-merge':
+            logger.error(f'--key-from and --key-to are available only with the sort-merge engine. [matching_engine={self.matching_engine}]')
+            sys.exit(1)
+        if self.restricts_key_range and not self.knows_byte_offsets:
+            logger.error(f'--key-from and --key-to are not available for compressed CSV files nor pipes. [compression_for_lhs={self.compression_for_lhs}, compression_for_rhs={self.compression_for_rhs}, reads_pipe={self.reads_pipe}]')
             sys.exit(1)
-        if not os.path.isfile(self.rhs_file_path):
-            logger.error(f'rhs_file_path is not a file. [rhs_file_path={self.rhs_file_path}]')
+        if self.key_from is not None and self.key_to is not None and self.key_to < self.key_from:
+            logger.error(f'--key-to should not be less than --key-from. [key_from={MatchingKeyCodec.decode_key(self.key_from)}, key_to={MatchingKeyCodec.decode_key(self.key_to)}]')
+            sys.exit(1)
+
+    def _managed_key_for_range(self, key_values, option_name):
+
+        if key_values is None:
+            return None
+
+        if len(key_values) != len(self.matching_key_codec.matching_key_info_list):
+            logger.error(f'{option_name} should have as many values as the matching keys. [{option_name}={key_values}, matching-key-indices={self.matching_key_codec.matching_key_info_list}]')
             sys.exit(1)
 
+        if self.compares_bytes:
+            key_values = ByteComparison.values_as_read(key_values, self.text_encoding_for_lhs, option_name)
+
+        return self.matching_key_codec.managed_key_for_key_values(key_values)
+
     def _normalize(self):
 
-        if not any([self.shows_count, self.shows_difference_only, self.shows_all_lines]):
+        if not self.is_quiet and not any([self.shows_count, self.shows_difference_only, self.shows_all_lines]):
             self.shows_count = True
 
     def display_string_for_column_separator(self, value):
@@ -356,6 +750,9 @@ class Context:
 
 def show_context_for_debugging(cxt):
 
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
     logger.debug(f'lhs_file_name={cxt.lhs_file_name}')
     logger.debug(f'rhs_file_name={cxt.rhs_file_name}')
     logger.debug(f'lhs_file_path={cxt.lhs_file_path}')
@@ -367,6 +764,15 @@ def show_context_for_debugging(cxt):
     logger.debug(f'matching_key_codec={cxt.matching_key_codec}')
     logger.debug(f'key_should_be_unique={cxt.key_should_be_unique}')
     logger.debug(f'column_indices_to_ignore={cxt.column_indices_to_ignore}')
+    logger.debug(f'key_from={cxt.key_from}')
+    logger.debug(f'key_to={cxt.key_to}')
+    logger.debug(f'restricts_key_range={cxt.restricts_key_range}')
+
+    logger.debug(f'matching_engine={cxt.matching_engine}')
+    logger.debug(f'sort_memory_budget={cxt.sort_memory_budget}')
+    logger.debug(f'number_of_partitions={cxt.number_of_partitions}')
+    logger.debug(f'maps_files={cxt.maps_files}')
+    logger.debug(f'temp_dir={cxt.temp_dir}')
 
     logger.debug(f'reports_in_vertical_style={cxt.reports_in_vertical_style}')
     logger.debug(f'reports_in_horizontal_style={cxt.reports_in_horizontal_style}')
@@ -374,10 +780,13 @@ def show_context_for_debugging(cxt):
     logger.debug(f'shows_difference_only={cxt.shows_difference_only}')
     logger.debug(f'shows_all_lines={cxt.shows_all_lines}')
     logger.debug(f'shows_context_from_arguments={cxt.shows_context_from_arguments}')
+    logger.debug(f'reports_in_single_pass={cxt.reports_in_single_pass}')
     logger.debug(f'needs_size_info_for_padding={cxt.needs_size_info_for_padding}')
 
     logger.debug(f'first_row_is_header={cxt.first_row_is_header}')
     logger.debug(f'sniffing_size={cxt.sniffing_size}')
+    logger.debug(f'uses_pre_scan_cache={cxt.uses_pre_scan_cache}')
+    logger.debug(f'pre_scans_in_parallel={cxt.pre_scans_in_parallel}')
     logger.debug(f'force_individual_specs={cxt.forces_individual_specs}')
 
     logger.debug(f'column_separator_for_lhs={cxt.display_string_for_column_separator(cxt.column_separator_for_lhs)}')
@@ -389,6 +798,9 @@ def show_context_for_debugging(cxt):
     logger.debug(f'skips_space_after_column_separator_for_lhs={cxt.skips_space_after_column_separator_for_lhs}')
     logger.debug(f'skips_space_after_column_separator_for_rhs={cxt.skips_space_after_column_separator_for_rhs}')
 
+    logger.debug(f'log_level={cxt.log_level}')
+    logger.debug(f'log_file_path={cxt.log_file_path}')
+
     logger.debug(f'MatchingKeyCodec#END_of_KEY={MatchingKeyCodec.END_of_KEY}')
 
 
@@ -398,6 +810,8 @@ def show_context_for_debugging(cxt):
 
 class MatchingKeyInfo:
 
+    TYPES = ('int', 'decimal', 'date', 'str')
+
     def __init__(self, specified_string):
 
         elements = list(filter(lambda x: x != '', specified_string.split(':')))
@@ -405,10 +819,18 @@ class MatchingKeyInfo:
         index = elements.pop(0)
         self.index = self._transform_into_numeric(index, 'index')
 
+        self.key_type = elements.pop(0) if elements and elements[0] in self.TYPES else None
+
         max_length = elements.pop(0) if elements else '0'
         self.max_length = self._transform_into_numeric(max_length, 'max_length')
 
+        if elements:
+            logger.error(f'MATCHING_KEY_INDICES should be INDEX[:TYPE][:MAX_LENGTH], where TYPE is one of {"/".join(self.TYPES)}. See also help. [specified={specified_string}, unknown parts={":".join(elements)}]')
+            exit(1)
+
     def __repr__(self):
+        if self.key_type:
+            return f"{self.__class__.__name__}({self.index!r}, {self.key_type!r})"
         return f"{self.__class__.__name__}({self.index!r}, {(self.max_length if self.max_length > 0 else '<not specified>')!r})"
 
     @classmethod
@@ -423,27 +845,137 @@ class MatchingKeyInfo:
     def key_for(self, row):
         return row[self.index].rjust(self.max_length, '0')
 
+    def typed_key_function(self):
+        """ Function from a row to the key part compared as the type. Without a type, it is the padded string. """
+
+        if self.key_type is None:
+            return self.key_for if self.max_length > 0 else operator.itemgetter(self.index)
+
+        converter = {
+            'int': int,
+            'decimal': self._decimal_of,
+            'date': self._date_of,
+            'str': str,
+        }[self.key_type]
+        index = self.index
+
+        return lambda row: converter(row[index])
+
+    @staticmethod
+    def _decimal_of(value):
+        """ NaN and Infinity are rejected, since NaN can not be ordered (the comparison raises decimal.InvalidOperation). """
+
+        number = decimal.Decimal(value)
+        if not number.is_finite():
+            raise ValueError(f'the decimal key should be a finite number. [value={value}]')
+
+        return number
+
+    @staticmethod
+    def _date_of(value):
+        return datetime.datetime.strptime(value.strip(), '%Y-%m-%d').date()
+
 
 class MatchingKeyCodec:
+    """
+    Notes
+    -----
+    Managed key is
+        * a string like '..key1..key2..' (padded as specified), if no type is specified for the matching keys
+        * a tuple of the key parts converted into each type, if a type is specified for any of the matching keys
+
+    END_of_KEY is greater than any managed key.
+    """
+
+    class EndOfKey:
+
+        def __eq__(self, other):
+            return self is other
+
+        def __ne__(self, other):
+            return self is not other
+
+        def __lt__(self, other):
+            return False
+
+        def __le__(self, other):
+            return self is other
+
+        def __gt__(self, other):
+            return self is not other
 
-    END_of_KEY = 'ZZZ'
+        def __ge__(self, other):
+            return True
+
+        def __hash__(self):
+            return id(self)
+
+        def __repr__(self):
+            return 'END_of_KEY'
+
+
+    END_of_KEY = EndOfKey()
     SEPARATOR = '..'
 
     def __init__(self, matching_key_info_list):
+
         self.matching_key_info_list = matching_key_info_list
+        self.is_typed = any(matching_key_info.key_type for matching_key_info in matching_key_info_list)
+        self._managed_key_function = self._typed_key_function() if self.is_typed else self._string_key_function()
 
     def __repr__(self):
         return f'{self.__class__.__name__}({self.matching_key_info_list!r})'
 
-    def managed_key_for(self, row):
+    def __getstate__(self):
+        """ The key function is not picklable, so build it again in a worker process. """
+        return {'matching_key_info_list': self.matching_key_info_list}
+
+    def __setstate__(self, state):
+        self.__init__(state['matching_key_info_list'])
+
+    def _string_key_function(self):
+
+        separator = self.SEPARATOR
+        key_part_functions = [matching_key_info.typed_key_function() for matching_key_info in self.matching_key_info_list]
+
+        if len(key_part_functions) == 1:
+            key_part_function = key_part_functions[0]
+            return lambda row: separator + key_part_function(row) + separator
+
+        return lambda row: separator + separator.join([key_part_function(row) for key_part_function in key_part_functions]) + separator
+
+    def _typed_key_function(self):
+
+        key_part_functions = [matching_key_info.typed_key_function() for matching_key_info in self.matching_key_info_list]
+        return lambda row: tuple([key_part_function(row) for key_part_function in key_part_functions])
+
+    def managed_key_for(self, row, row_number=None):
+        """ The row number is reported with the errors, if it is given. """
 
         try:
-            return functools.reduce(lambda making, matching_key: making + matching_key.key_for(row) + self.SEPARATOR,
-                                    self.matching_key_info_list, self.SEPARATOR)
+            return self._managed_key_function(row)
         except IndexError:
-            logger.error(f'one of the indices specified for MATCHING_KEY_INDICES is out of range [MATCHING_KEY_INDICES={self.matching_key_info_list}, number of columns = {len(row)}, row={row}]')
+            logger.error(f'one of the indices specified for MATCHING_KEY_INDICES is out of range [MATCHING_KEY_INDICES={self.matching_key_info_list}, number of columns = {len(row)},{self._row_number_string(row_number)} row={row}]')
+            exit(1)
+        except (ValueError, ArithmeticError) as e:
+            logger.error(f'one of the matching keys can not be converted into the specified type [MATCHING_KEY_INDICES={self.matching_key_info_list},{self._row_number_string(row_number)} row={row}, description={e}]')
             exit(1)
 
+    @staticmethod
+    def _row_number_string(row_number):
+        return f' row_number={row_number},' if row_number is not None else ''
+
+    def managed_key_for_key_values(self, key_values):
+        """ Managed key from the values of the matching key columns in the order of the matching keys. """
+
+        matching_key_indices = self.matching_key_indices
+
+        key_row = [''] * (max(matching_key_indices) + 1)
+        for index, value in zip(matching_key_indices, key_values):
+            key_row[index] = value
+
+        return self.managed_key_for(key_row)
+
     @property
     def matching_key_indices(self):
         return list(map(lambda matching_key_info: matching_key_info.index, self.matching_key_info_list))
@@ -451,6 +983,10 @@ class MatchingKeyCodec:
     @classmethod
     def decode_key(cls, key):
         """ Leave the padding as it is. """
+
+        if isinstance(key, tuple):
+            return list(map(str, key))
+
         return key.strip(cls.SEPARATOR).split(cls.SEPARATOR)
 
 
@@ -461,837 +997,3313 @@ class MatchingKeyCodec:
 
 def run_in(context):
 
-    with open(context.lhs_file_path, mode='r', encoding=context.encoding_for_lhs) as lhs_csv,\
-         open(context.rhs_file_path, mode='r', encoding=context.encoding_for_rhs) as rhs_csv:
+    with CompressedFile.open_text(context.lhs_file_path, context.encoding_for_lhs) as lhs_csv, \
+         CompressedFile.open_text(context.rhs_file_path, context.encoding_for_rhs) as rhs_csv:
+
+        lhs_csv = RewindableStream.of(lhs_csv, context.temp_dir)
+        rhs_csv = RewindableStream.of(rhs_csv, context.temp_dir)
 
         lhs_dialect, adjusted_context = CsvDialectFixer.fixed_dialect(context, lhs_csv, FileArrangement.LHS)
         rhs_dialect, adjusted_context = CsvDialectFixer.fixed_dialect(adjusted_context, rhs_csv, FileArrangement.RHS)
 
-        csv_reader = CsvReader(lhs_csv, rhs_csv, lhs_dialect, rhs_dialect, adjusted_context)
-        pre_scan_result = PreScanner.scan(adjusted_context, csv_reader)
-        csv_reader.reset()
+        if adjusted_context.compares_bytes:
+            ByteComparison.verify_dialect(lhs_dialect, adjusted_context.lhs_file_name)
+            ByteComparison.verify_dialect(rhs_dialect, adjusted_context.rhs_file_name)
+
+        with contextlib.ExitStack() as stack:
 
-        detect_diff(adjusted_context, csv_reader, pre_scan_result)
+            if adjusted_context.restricts_key_range:
+                key_range = KeyRange.in_files_of(adjusted_context, lhs_dialect, rhs_dialect)
+                lhs_csv = stack.enter_context(ByteRange.text_stream(adjusted_context.lhs_file_path, 0, key_range.lhs_end, adjusted_context.encoding_for_lhs))
+                rhs_csv = stack.enter_context(ByteRange.text_stream(adjusted_context.rhs_file_path, 0, key_range.rhs_end, adjusted_context.encoding_for_rhs))
+
+            csv_reader = CsvReader(lhs_csv, rhs_csv, lhs_dialect, rhs_dialect, adjusted_context)
+            try:
+                if adjusted_context.restricts_key_range:
+                    csv_reader.lhs_csv_state.open_at(key_range.lhs_start, key_range.lhs_row_number, key_range.lhs_end)
+                    csv_reader.rhs_csv_state.open_at(key_range.rhs_start, key_range.rhs_row_number, key_range.rhs_end)
+
+                pre_scan_result = PreScanner.scan(adjusted_context, csv_reader)
+                csv_reader.reset()
+                RewindableStream.stop_recording_of(lhs_csv)
+                RewindableStream.stop_recording_of(rhs_csv)
+
+                return detect_diff(adjusted_context, csv_reader, pre_scan_result)
+            finally:
+                csv_reader.close()
+
+
+class StopMatching(Exception):
+    """ Raised from the callbacks of matching to stop it, when --max-differences are found. """
+    pass
 
 
 def detect_diff(context, csv_reader, pre_scan_result):
+    """ Returns True if there is any difference. """
 
     value_difference_detector = ValueDifferenceDetector(pre_scan_result.number_of_columns,
                                                         context.matching_key_codec.matching_key_indices,
-                                                        context.column_indices_to_ignore)
+                                                        context.column_indices_to_ignore,
+                                                        csv_reader.keeps_raw_records)
 
     heading_reporter = HeadingReporter(context)
     detail_reporter = DetailReporter.Factory.reporter_for(context, pre_scan_result)
-    count_reporter = CountReporter(context.shows_count)
+    count_reporter = CountReporter(context.shows_count, context.shows_row_numbers)
     counter = count_reporter.counter
 
     heading_reporter.report_heading()
     detail_reporter.report_detail_heading()
 
+    existed_only_on_lhs, existed_on_both_sides, existed_only_on_rhs = reporting_callbacks_for(context, csv_reader, value_difference_detector, counter, detail_reporter)
+    perform_matching = matching_function_for(context, csv_reader, pre_scan_result.number_of_columns)
+
+    try:
+        same_lines_found = perform_matching(existed_only_on_lhs, existed_on_both_sides, existed_only_on_rhs)
+        if same_lines_found is not None:
+            number_of_same_lines, size_info_for_padding = same_lines_found
+            counter.count_for_cases_of_same_lines(number_of_same_lines)
+            detail_reporter.consider_size_info_for_padding(size_info_for_padding)
+    except StopMatching:
+        logger.info(f'matching stopped at {context.max_differences} differences.')
+
+    detail_reporter.report_detail_ending()
+
+    if context.reports_in_text:
+        count_reporter.report_count()
+
+    return counter.number_of_all_differences > 0
+
+
+def reporting_callbacks_for(context, csv_reader, value_difference_detector, counter, detail_reporter):
+    """ Callbacks of the key matching to count and report the rows existed only on lhs, on both sides and only on rhs. StopMatching is raised at --max-differences. """
+
+    # The same lines are passed to the detail reporter only when they are reported, or measured for the layout of the single pass
+    reports_same_lines = context.shows_all_lines or context.reports_in_single_pass
+
+    max_differences = context.max_differences
+
+    def stop_if_enough_differences():
+        if max_differences and counter.number_of_all_differences >= max_differences:
+            raise StopMatching()
 
     def existed_only_on_lhs(lhs_fact):
         counter.count_for_case_of_existed_only_on_lhs(lhs_fact.lhs_row_number)
-        detail_reporter.report_case_of_existed_only_on_lhs(lhs_fact)
+        if context.shows_details:
+            detail_reporter.report_case_of_existed_only_on_lhs(csv_reader.decoded_lhs_fact(lhs_fact))
+        stop_if_enough_differences()
 
     def existed_on_both_sides(lhs_fact, rhs_fact):
-        value_difference_result = value_difference_detector.detect_difference_between(lhs_fact.lhs_row, rhs_fact.rhs_row)
+        value_difference_result = value_difference_detector.detect_difference_between_facts(lhs_fact, rhs_fact)
         counter.count_for_case_of_existed_on_both_sides(lhs_fact, rhs_fact, value_difference_result)
-        detail_reporter.report_case_of_existed_on_both_sides(lhs_fact, rhs_fact, value_difference_result)
+        if context.shows_details and (value_difference_result.has_difference or reports_same_lines):
+            detail_reporter.report_case_of_existed_on_both_sides(csv_reader.decoded_lhs_fact(lhs_fact), csv_reader.decoded_rhs_fact(rhs_fact), value_difference_result)
+        if value_difference_result.has_difference:
+            stop_if_enough_differences()
 
     def existed_only_on_rhs(rhs_fact):
         counter.count_for_case_of_existed_only_on_rhs(rhs_fact.rhs_row_number)
-        detail_reporter.report_case_of_existed_only_on_rhs(rhs_fact)
+        if context.shows_details:
+            detail_reporter.report_case_of_existed_only_on_rhs(csv_reader.decoded_rhs_fact(rhs_fact))
+        stop_if_enough_differences()
+
+    return existed_only_on_lhs, existed_on_both_sides, existed_only_on_rhs
 
-    perform_key_matching(csv_reader, existed_only_on_lhs, existed_on_both_sides, existed_only_on_rhs)
 
+def matching_function_for(context, csv_reader, number_of_columns):
+    """
+    Function performing the key matching of the engine for the context, called with the callbacks as perform_key_matching() is.
+    The partitioned key matching counts the same lines in the partitions without calling back for them,
+    so it returns the number of same lines and the size info for padding. The others return None.
+    """
 
-    count_reporter.report_count()
+    if context.matching_engine == 'hash-join':
+        def perform_matching(callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+            perform_key_matching_by_hash_join(context, csv_reader, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only)
+
+    elif context.number_of_partitions > 1 and KeyRangePartitioner.is_applicable(context, csv_reader):
+        def perform_matching(callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+            return perform_partitioned_key_matching(context, csv_reader, number_of_columns, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only)
+
+    elif context.read_ahead_size > 0:
+        def perform_matching(callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+            with ReadAhead(csv_reader, context.read_ahead_size) as read_ahead:
+                perform_key_matching(read_ahead, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only)
+
+    else:
+        def perform_matching(callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+            perform_key_matching(csv_reader, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only)
+
+    return perform_matching
 
 
 def perform_key_matching(csv_reader, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+    """
+    Keys and functions used for every row are held in local variables, and END_of_KEY is detected by identity.
+    Each side reads the rows into the same fact over and over (refill_lhs() and refill_rhs()), not to allocate a fact for each row,
+    so the callbacks should not keep the facts after they return.
+    """
 
-    lhs_fact = csv_reader.read_lhs()
-    rhs_fact = csv_reader.read_rhs()
+    refill_lhs = csv_reader.refill_lhs
+    refill_rhs = csv_reader.refill_rhs
+    end_of_key = MatchingKeyCodec.END_of_KEY
 
-    while lhs_fact.lhs_key != MatchingKeyCodec.END_of_KEY or rhs_fact.rhs_key != MatchingKeyCodec.END_of_KEY:
+    lhs_fact = refill_lhs(LhsFact(0, None, None))
+    rhs_fact = refill_rhs(RhsFact(0, None, None))
+    lhs_key = lhs_fact.lhs_key
+    rhs_key = rhs_fact.rhs_key
 
-        if lhs_fact.lhs_key < rhs_fact.rhs_key:
+    while lhs_key is not end_of_key or rhs_key is not end_of_key:
+
+        if lhs_key < rhs_key:
             callback_for_lhs_only(lhs_fact)
-            lhs_fact = csv_reader.read_lhs()
+            lhs_fact = refill_lhs(lhs_fact)
+            lhs_key = lhs_fact.lhs_key
 
-        elif lhs_fact.lhs_key == rhs_fact.rhs_key:
+        elif lhs_key == rhs_key:
             callback_for_both_sides(lhs_fact, rhs_fact)
-            lhs_fact = csv_reader.read_lhs()
-            rhs_fact = csv_reader.read_rhs()
+            lhs_fact = refill_lhs(lhs_fact)
+            rhs_fact = refill_rhs(rhs_fact)
+            lhs_key = lhs_fact.lhs_key
+            rhs_key = rhs_fact.rhs_key
 
-        elif lhs_fact.lhs_key > rhs_fact.rhs_key:
+        else:
             callback_for_rhs_only(rhs_fact)
-            rhs_fact = csv_reader.read_rhs()
+            rhs_fact = refill_rhs(rhs_fact)
+            rhs_key = rhs_fact.rhs_key
 
 
-# ----------------------------------------------------------------------------------------------------------------------
-#  Value-Difference Detection
-# ----------------------------------------------------------------------------------------------------------------------
+def perform_key_matching_by_hash_join(context, csv_reader, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+    """
+    Notes
+    -----
+    Hash join for unsorted files that fit in memory.
+        * Facts of the smaller file are kept in a hash table by the matching key
+        * Facts of the other file are streamed against the hash table
+        * Facts left in the hash table existed only on the smaller side, and are called back in the order of row numbers
 
-class ValueDifferenceDetector:
+    Facts with the same matching key are paired in the order of appearance, as the sort-merge does.
+    """
 
-    class ValueDifferenceResult:
+    if os.path.getsize(context.lhs_file_path) <= os.path.getsize(context.rhs_file_path):
 
-        def __init__(self, different_column_indices):
+        hash_table = _hash_table_from(context, csv_reader.read_lhs, 'lhs_key', csv_reader.lhs_csv_state.file_name)
+        verify_unique = _unique_key_verifier_for(context, csv_reader.rhs_csv_state.file_name)
 
-            self.different_column_indices = different_column_indices
+        rhs_fact = csv_reader.read_rhs()
+        while rhs_fact.rhs_key != MatchingKeyCodec.END_of_KEY:
 
-        @property
-        def has_difference(self):
-            return True if self.different_column_indices else False
+            verify_unique(rhs_fact.rhs_key)
+            lhs_facts = hash_table.get(rhs_fact.rhs_key)
+            if lhs_facts:
+                callback_for_both_sides(lhs_facts.popleft(), rhs_fact)
+            else:
+                callback_for_rhs_only(rhs_fact)
 
+            rhs_fact = csv_reader.read_rhs()
 
-    def __init__(self, number_of_columns, matching_key_indices, ignore_column_indices):
+        for lhs_fact in _facts_left_in(hash_table, 'lhs_row_number'):
+            callback_for_lhs_only(lhs_fact)
 
-        self.column_indices = range(0, number_of_columns)
-        logger.debug(f'column_indices={self.column_indices}')
+    else:
 
-        self.target_column_indices = set(self.column_indices) - set(matching_key_indices) - set(ignore_column_indices)
-        logger.debug(f'target_column_indices={self.target_column_indices}')
+        hash_table = _hash_table_from(context, csv_reader.read_rhs, 'rhs_key', csv_reader.rhs_csv_state.file_name)
+        verify_unique = _unique_key_verifier_for(context, csv_reader.lhs_csv_state.file_name)
 
-    def detect_difference_between(self, lhs_row, rhs_row):
+        lhs_fact = csv_reader.read_lhs()
+        while lhs_fact.lhs_key != MatchingKeyCodec.END_of_KEY:
 
-        different_column_indices = [index for index in self.target_column_indices if lhs_row[index] != rhs_row[index]]
-        logger.debug(f'different_column_indices={different_column_indices}')
-        return self.ValueDifferenceResult(different_column_indices)
+            verify_unique(lhs_fact.lhs_key)
+            rhs_facts = hash_table.get(lhs_fact.lhs_key)
+            if rhs_facts:
+                callback_for_both_sides(lhs_fact, rhs_facts.popleft())
+            else:
+                callback_for_lhs_only(lhs_fact)
 
+            lhs_fact = csv_reader.read_lhs()
 
+        for rhs_fact in _facts_left_in(hash_table, 'rhs_row_number'):
+            callback_for_rhs_only(rhs_fact)
 
-# ----------------------------------------------------------------------------------------------------------------------
-#  Reporting
-# ----------------------------------------------------------------------------------------------------------------------
 
-class PreScanner:
+def _hash_table_from(context, read, key_name, file_name):
 
-    class ScanResult:
+    hash_table = {}
+    verify_unique = _unique_key_verifier_for(context, file_name)
 
-        def __init__(self, number_of_columns, size_info_for_padding):
-            self.number_of_columns = number_of_columns
-            self.size_info_for_padding = size_info_for_padding
+    fact = read()
+    while getattr(fact, key_name) != MatchingKeyCodec.END_of_KEY:
 
-        @classmethod
-        def for_lightly(cls, number_of_columns):
-            return PreScanner.ScanResult(number_of_columns, None)
+        key = getattr(fact, key_name)
+        verify_unique(key)
+        hash_table.setdefault(key, collections.deque()).append(fact)
 
-        @classmethod
-        def for_deeply(cls, number_of_columns, lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length):
-            size_info_for_padding = cls.SizeInfoForPadding(lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length)
-            return PreScanner.ScanResult(number_of_columns, size_info_for_padding)
+        fact = read()
 
+    logger.debug(f'hash table of {file_name}: number_of_keys={len(hash_table)}')
+    return hash_table
 
-        class SizeInfoForPadding:
+def _facts_left_in(hash_table, row_number_name):
+    return sorted((fact for facts in hash_table.values() for fact in facts), key=lambda fact: getattr(fact, row_number_name))
 
-            def __init__(self, lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length):
-                self.lhs_max_row_number = lhs_max_row_number
-                self.lhs_max_row_length = lhs_max_row_length
-                self.rhs_max_row_number = rhs_max_row_number
-                self.rhs_max_row_length = rhs_max_row_length
+def _unique_key_verifier_for(context, file_name):
+    """ Without sorting, the uniqueness of matching keys can not be verified between adjacent rows. So remember all the keys. """
 
+    if not context.key_should_be_unique:
+        return lambda key: None
 
-    def __init__(self):
-        pass
+    seen_keys = set()
 
-    @classmethod
-    def scan(cls, context, csv_reader):
+    def verify_unique(key):
 
-        if context.needs_size_info_for_padding:
-            return PreScanner._scan_deeply(csv_reader)
-        else:
-            return PreScanner._scan_lightly(csv_reader)
+        if key in seen_keys:
+            logger.error(f'matching keys in {file_name} are not unique.'
+                         f' [current_key={MatchingKeyCodec.decode_key(key)}, matching-key-indices={context.matching_key_codec.matching_key_info_list}]')
+            exit(1)
 
+        seen_keys.add(key)
 
-    @classmethod
-    def _scan_deeply(cls, csv_reader):
-        """
-        Notes
-        -----
-        Purpose of deep pre-scanning
-            * Determine the number of columns for value difference detection
-            * Get size information to format the horizontal report
-        """
+    return verify_unique
 
-        start_ = time.perf_counter()
 
-        lhs_max_row_length, rhs_max_row_length = 0, 0
+# ----------------------------------------------------------------------------------------------------------------------
+#  Read-Ahead
+# ----------------------------------------------------------------------------------------------------------------------
 
-        lhs_fact = csv_reader.read_lhs()
-        rhs_fact = csv_reader.read_rhs()
+class ReadAhead:
+    """
+    Notes
+    -----
+    Read each side ahead on a background thread, in place of read_lhs() and read_rhs() of CsvReader.
+        * Reading, decoding and parsing rows and building keys overlap with the matching, and with waiting for I/O of the other side
+        * Facts are handed over in batches through a queue of a bounded number of batches, so memory consumption stays bounded
+          even if the matching is slower than reading
+        * An exception on the background thread (including SystemExit on a key violation) is raised again on the matching thread
+        * Once END_of_KEY is read, it is returned on every subsequent read
 
-        number_of_columns = cls._determine_number_of_columns_from(lhs_fact, rhs_fact)
+    CPU-bound parsing still shares the GIL with the matching, so this pays off mainly when reading waits for I/O.
+    """
 
-        while lhs_fact.lhs_key != MatchingKeyCodec.END_of_KEY:
-            lhs_max_row_length = max(lhs_max_row_length, UnicodeSupport.string_length_considering_east_asian_characters_of(str(lhs_fact.lhs_row)))
-            lhs_fact = csv_reader.read_lhs()
+    NUMBER_OF_BATCHES = 4
+    PUT_TIMEOUT_SECONDS = 0.1
+
+    def __init__(self, csv_reader, batch_size):
+
+        self._batch_size = batch_size
+        self._stopped = threading.Event()
+        self._threads = []
+
+        self.read_lhs = self._start(csv_reader.read_lhs, 'lhs_key')
+        self.read_rhs = self._start(csv_reader.read_rhs, 'rhs_key')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    def close(self):
+
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+
+    def refill_lhs(self, _):
+        """ The facts read ahead are handed over as they are, since the fact given can not be read into while the next ones are queued. """
+        return self.read_lhs()
+
+    def refill_rhs(self, _):
+        """ The facts read ahead are handed over as they are, since the fact given can not be read into while the next ones are queued. """
+        return self.read_rhs()
+
+    def _start(self, read, key_name):
+
+        batches = queue.Queue(maxsize=self.NUMBER_OF_BATCHES)
+
+        thread = threading.Thread(target=self._read_ahead, args=(read, key_name, batches), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+        return functools.partial(next, self._facts_in(batches))
+
+    def _read_ahead(self, read, key_name, batches):
+
+        try:
+            batch = []
+            while True:
+
+                fact = read()
+                batch.append(fact)
+
+                if getattr(fact, key_name) is MatchingKeyCodec.END_of_KEY:
+                    self._put(batches, (batch, True))
+                    return
+
+                if len(batch) >= self._batch_size:
+                    if not self._put(batches, (batch, False)):
+                        return
+                    batch = []
+
+        except BaseException as e:
+            self._put(batches, (e, True))
+
+    def _put(self, batches, item):
+        """ Returns False if stopped before the item is put, so that the thread does not wait for the matching that has gone. """
+
+        while not self._stopped.is_set():
+            try:
+                batches.put(item, timeout=self.PUT_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    @staticmethod
+    def _facts_in(batches):
+
+        is_last = False
+        while not is_last:
+
+            batch, is_last = batches.get()
+            if isinstance(batch, BaseException):
+                raise batch
+
+            yield from batch
+
+        end_fact = batch[-1]
+        while True:
+            yield end_fact
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  Key-Range Partitioning
+# ----------------------------------------------------------------------------------------------------------------------
+
+def perform_partitioned_key_matching(context, csv_reader, number_of_columns, callback_for_lhs_only, callback_for_both_sides, callback_for_rhs_only):
+    """
+    Notes
+    -----
+    Match the key ranges of both sorted files in parallel on worker processes, then call back in the order of the key ranges.
+        * Each worker matches its key range with perform_key_matching, and spools the facts to be called back
+        * Each worker counts the same lines without spooling them, unless all lines are to be reported
+        * Row numbers in the worker are local to the key range, so they are offset by the number of rows in the preceding key ranges
+
+    Returns the number of the same lines that were not called back, and the size information for padding.
+    """
+
+    lhs_dialect = csv_reader.lhs_csv_state.dialect
+    rhs_dialect = csv_reader.rhs_csv_state.dialect
+
+    with RowBoundary(context.lhs_file_path, context.encoding_for_lhs, lhs_dialect, context.first_row_is_header, context.matching_key_codec) as lhs_boundary, \
+         RowBoundary(context.rhs_file_path, context.encoding_for_rhs, rhs_dialect, context.first_row_is_header, context.matching_key_codec) as rhs_boundary:
+        partitions = KeyRangePartitioner(lhs_boundary, rhs_boundary).partitions(context.number_of_partitions)
+    logger.debug(f'partitions={partitions}')
+
+    work_dir = tempfile.mkdtemp(prefix='csvdiff3-partition-', dir=context.temp_dir)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(partitions), os.cpu_count() or 1)) as executor:
+
+            futures = [executor.submit(diff_one_partition, context,
+                                       CsvDialectFixer.picklable_dialect(lhs_dialect), CsvDialectFixer.picklable_dialect(rhs_dialect),
+                                       number_of_columns, partition, os.path.join(work_dir, f'partition-{number}'))
+                       for number, partition in enumerate(partitions)]
+
+            lhs_row_number_base = rhs_row_number_base = 1 if context.first_row_is_header else 0
+            number_of_same_lines, lhs_max_row_length, rhs_max_row_length = 0, 0, 0
+
+            # The partitions not started yet are cancelled when the matching is stopped
+            try:
+                for future in futures:
+
+                    partition_result = future.result()
+
+                    for lhs_row_number, lhs_row, rhs_row_number, rhs_row in _spooled_facts_of(partition_result.spool_path):
+                        if rhs_row_number is None:
+                            callback_for_lhs_only(LhsFact(lhs_row_number_base + lhs_row_number, lhs_row, None))
+                        elif lhs_row_number is None:
+                            callback_for_rhs_only(RhsFact(rhs_row_number_base + rhs_row_number, rhs_row, None))
+                        else:
+                            callback_for_both_sides(LhsFact(lhs_row_number_base + lhs_row_number, lhs_row, None),
+                                                    RhsFact(rhs_row_number_base + rhs_row_number, rhs_row, None))
+
+                    lhs_row_number_base += partition_result.number_of_lhs_rows
+                    rhs_row_number_base += partition_result.number_of_rhs_rows
+                    number_of_same_lines += partition_result.number_of_same_lines
+                    lhs_max_row_length = max(lhs_max_row_length, partition_result.lhs_max_row_length)
+                    rhs_max_row_length = max(rhs_max_row_length, partition_result.rhs_max_row_length)
+            except StopMatching:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    size_info_for_padding = PreScanner.ScanResult.SizeInfoForPadding(lhs_row_number_base, lhs_max_row_length, rhs_row_number_base, rhs_max_row_length)
+    return number_of_same_lines, size_info_for_padding
+
+
+def _spooled_facts_of(spool_path):
+
+    with open(spool_path, mode='rb') as spool:
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
+
+
+class Partition:
+
+    def __init__(self, lhs_start, lhs_end, rhs_start, rhs_end):
+        self.lhs_start = lhs_start
+        self.lhs_end = lhs_end
+        self.rhs_start = rhs_start
+        self.rhs_end = rhs_end
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(lhs=[{self.lhs_start}, {self.lhs_end}), rhs=[{self.rhs_start}, {self.rhs_end}))'
+
+
+class PartitionResult:
+
+    def __init__(self, spool_path, number_of_lhs_rows, number_of_rhs_rows, number_of_same_lines, lhs_max_row_length, rhs_max_row_length):
+        self.spool_path = spool_path
+        self.number_of_lhs_rows = number_of_lhs_rows
+        self.number_of_rhs_rows = number_of_rhs_rows
+        self.number_of_same_lines = number_of_same_lines
+        self.lhs_max_row_length = lhs_max_row_length
+        self.rhs_max_row_length = rhs_max_row_length
+
+
+def diff_one_partition(context, lhs_dialect, rhs_dialect, number_of_columns, partition, spool_path):
+    """ Entry point of a worker process of the partitioned matching. Row numbers are local to the partition. """
+
+    partition_context = copy.copy(context)
+    partition_context.first_row_is_header = False
+    partition_context.number_of_parse_processes = 0
+    partition_context.maps_files = False
+
+    measures_row_length = context.reports_in_single_pass
+    result = PartitionResult(spool_path, 0, 0, 0, 0, 0)
+
+    with ByteRange.text_stream(context.lhs_file_path, partition.lhs_start, partition.lhs_end, context.encoding_for_lhs) as lhs_csv, \
+         ByteRange.text_stream(context.rhs_file_path, partition.rhs_start, partition.rhs_end, context.encoding_for_rhs) as rhs_csv, \
+         open(spool_path, mode='wb') as spool:
+
+        csv_reader = CsvReader(lhs_csv, rhs_csv, lhs_dialect, rhs_dialect, partition_context)
+        value_difference_detector = ValueDifferenceDetector(number_of_columns,
+                                                            context.matching_key_codec.matching_key_indices,
+                                                            context.column_indices_to_ignore,
+                                                            csv_reader.keeps_raw_records)
+
+        def measure_lhs(lhs_fact):
+            if measures_row_length:
+                result.lhs_max_row_length = max(result.lhs_max_row_length, UnicodeSupport.string_length_considering_east_asian_characters_of(str(csv_reader.decode_lhs_row(lhs_fact.lhs_row))))
+
+        def measure_rhs(rhs_fact):
+            if measures_row_length:
+                result.rhs_max_row_length = max(result.rhs_max_row_length, UnicodeSupport.string_length_considering_east_asian_characters_of(str(csv_reader.decode_rhs_row(rhs_fact.rhs_row))))
+
+        def existed_only_on_lhs(lhs_fact):
+            measure_lhs(lhs_fact)
+            pickle.dump((lhs_fact.lhs_row_number, lhs_fact.lhs_row, None, None), spool, pickle.HIGHEST_PROTOCOL)
+
+        def existed_on_both_sides(lhs_fact, rhs_fact):
+            measure_lhs(lhs_fact)
+            measure_rhs(rhs_fact)
+            if context.shows_all_lines or value_difference_detector.detect_difference_between_facts(lhs_fact, rhs_fact).has_difference:
+                pickle.dump((lhs_fact.lhs_row_number, lhs_fact.lhs_row, rhs_fact.rhs_row_number, rhs_fact.rhs_row), spool, pickle.HIGHEST_PROTOCOL)
+            else:
+                result.number_of_same_lines += 1
+
+        def existed_only_on_rhs(rhs_fact):
+            measure_rhs(rhs_fact)
+            pickle.dump((None, None, rhs_fact.rhs_row_number, rhs_fact.rhs_row), spool, pickle.HIGHEST_PROTOCOL)
+
+        perform_key_matching(csv_reader, existed_only_on_lhs, existed_on_both_sides, existed_only_on_rhs)
+
+        result.number_of_lhs_rows = csv_reader.lhs_csv_state.row_number
+        result.number_of_rhs_rows = csv_reader.rhs_csv_state.row_number
+
+    return result
+
+
+class KeyRangePartitioner:
+    """
+    Notes
+    -----
+    Split both sorted files into key ranges at aligned byte offsets.
+        * Matching keys are sampled at evenly spaced byte offsets of both files, after resynchronizing to the next row start
+        * Split keys are chosen from the sorted samples
+        * For each split key, the first row whose key is not less than it is found by binary search on each file
+    So the rows with the same matching key are in the same partition on both sides.
+    """
+
+    MIN_PARTITION_SIZE = 1024 * 1024
+    SAMPLES_PER_PARTITION = 8
+
+    def __init__(self, lhs_boundary, rhs_boundary):
+        self.lhs_boundary = lhs_boundary
+        self.rhs_boundary = rhs_boundary
+
+    @classmethod
+    def is_applicable(cls, context, csv_reader):
+
+        if context.matching_engine != 'sort-merge':
+            logger.warning(f'partitioned matching is available only with the sort-merge engine. Matching without partitions. [matching_engine={context.matching_engine}]')
+            return False
+
+        if context.restricts_key_range:
+            logger.warning('partitioned matching is not available with --key-from or --key-to. Matching without partitions.')
+            return False
+
+        if not context.knows_byte_offsets:
+            logger.warning('partitioned matching is not available for compressed CSV files nor pipes. Matching without partitions.')
+            return False
+
+        finds_lhs_rows = RowBoundary.is_applicable(context.encoding_for_lhs, csv_reader.lhs_csv_state.dialect)
+        finds_rhs_rows = RowBoundary.is_applicable(context.encoding_for_rhs, csv_reader.rhs_csv_state.dialect)
+        if not (finds_lhs_rows and finds_rhs_rows):
+            logger.warning('partitioned matching is available only with ASCII compatible encodings and dialects without escapechar. Matching without partitions.')
+            return False
+
+        return True
+
+    def partitions(self, number_of_partitions):
+
+        total_size = self.lhs_boundary.size + self.rhs_boundary.size
+        number_of_partitions = max(1, min(number_of_partitions, total_size // self.MIN_PARTITION_SIZE))
+
+        split_keys = self._split_keys(number_of_partitions)
+
+        lhs_offsets = [self.lhs_boundary.data_start] + [self.lhs_boundary.lower_bound(key) for key in split_keys] + [self.lhs_boundary.size]
+        rhs_offsets = [self.rhs_boundary.data_start] + [self.rhs_boundary.lower_bound(key) for key in split_keys] + [self.rhs_boundary.size]
+
+        return [Partition(lhs_offsets[i], lhs_offsets[i + 1], rhs_offsets[i], rhs_offsets[i + 1]) for i in range(len(split_keys) + 1)]
+
+    def _split_keys(self, number_of_partitions):
+
+        if number_of_partitions <= 1:
+            return []
+
+        number_of_samples = number_of_partitions * self.SAMPLES_PER_PARTITION
+        samples = sorted(self.lhs_boundary.sampled_keys(number_of_samples) + self.rhs_boundary.sampled_keys(number_of_samples))
+        if not samples:
+            return []
+
+        split_keys = []
+        for i in range(1, number_of_partitions):
+            key = samples[len(samples) * i // number_of_partitions]
+            if not split_keys or split_keys[-1] < key:
+                split_keys.append(key)
+
+        return split_keys
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  Key-Range Restriction
+# ----------------------------------------------------------------------------------------------------------------------
+
+class KeyRange:
+    """
+    Notes
+    -----
+    Byte ranges of both sorted files for the rows whose matching keys are in [--key-from, --key-to].
+        * The bounds are found by binary search on byte offsets with RowBoundary, so the cost scales with the range rather than the file
+        * The binary search starts from the nearest entry of SparseKeyIndex, if the file is indexed with the same conditions
+        * The row number at the lower bound is counted from the nearest entry of SparseKeyIndex, or from the data start without index
+    """
+
+    def __init__(self, lhs_start, lhs_end, lhs_row_number, rhs_start, rhs_end, rhs_row_number):
+        self.lhs_start = lhs_start
+        self.lhs_end = lhs_end
+        self.lhs_row_number = lhs_row_number
+        self.rhs_start = rhs_start
+        self.rhs_end = rhs_end
+        self.rhs_row_number = rhs_row_number
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(lhs=[{self.lhs_start}, {self.lhs_end}) from row {self.lhs_row_number},'
+                f' rhs=[{self.rhs_start}, {self.rhs_end}) from row {self.rhs_row_number})')
+
+    @classmethod
+    def in_files_of(cls, context, lhs_dialect, rhs_dialect):
+
+        lhs_start, lhs_end, lhs_row_number = cls._byte_range_in(context, context.lhs_file_path, context.encoding_for_lhs, lhs_dialect)
+        rhs_start, rhs_end, rhs_row_number = cls._byte_range_in(context, context.rhs_file_path, context.encoding_for_rhs, rhs_dialect)
+
+        key_range = cls(lhs_start, lhs_end, lhs_row_number, rhs_start, rhs_end, rhs_row_number)
+        logger.debug(f'key_range={key_range}')
+        return key_range
+
+    @classmethod
+    def _byte_range_in(cls, context, file_path, encoding, dialect):
+
+        if not RowBoundary.is_applicable(encoding, dialect):
+            logger.error(f'--key-from and --key-to are available only with ASCII compatible encodings and dialects without escapechar. [file_path={file_path}, encoding={encoding}]')
+            sys.exit(1)
+
+        matching_key_codec = context.matching_key_codec
+        sparse_key_index = SparseKeyIndex.load(file_path, encoding, dialect, context.first_row_is_header, matching_key_codec)
+
+        def entry_before(key):
+            return sparse_key_index.entry_before(key) if sparse_key_index is not None else None
+
+        with RowBoundary(file_path, encoding, dialect, context.first_row_is_header, matching_key_codec) as row_boundary:
+
+            row_number_at_data_start = 2 if context.first_row_is_header else 1
+            start_entry = entry_before(context.key_from) if context.key_from is not None else None
+            known_row_number, known_offset = start_entry or (row_number_at_data_start, row_boundary.data_start)
+
+            start = row_boundary.lower_bound(context.key_from, known_offset) if context.key_from is not None else row_boundary.data_start
+
+            if context.key_to is not None:
+                end_entry = entry_before(context.key_to)
+                end = row_boundary.upper_bound(context.key_to, max(start, end_entry[1] if end_entry else start))
+            else:
+                end = row_boundary.size
+
+            row_number = known_row_number + row_boundary.number_of_records_between(known_offset, start)
+
+        return start, end, row_number
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  Sparse Key Index
+# ----------------------------------------------------------------------------------------------------------------------
+
+def build_index_in(context):
+
+    if not context.knows_byte_offsets:
+        logger.error(f'index is not available for compressed CSV files nor pipes, since reading can not start in the middle of them. [file_path={context.lhs_file_path}]')
+        sys.exit(1)
+
+    with open(context.lhs_file_path, mode='r', encoding=context.encoding_for_lhs) as csv_file:
+        dialect, adjusted_context = CsvDialectFixer.fixed_dialect(context, csv_file, FileArrangement.LHS)
+
+    if not RowBoundary.is_applicable(adjusted_context.encoding_for_lhs, dialect):
+        logger.error(f'index is available only with ASCII compatible encodings and dialects without escapechar. [encoding={adjusted_context.encoding_for_lhs}, escapechar={dialect.escapechar}]')
+        sys.exit(1)
+
+    sparse_key_index = SparseKeyIndex.build(adjusted_context.lhs_file_path, adjusted_context.encoding_for_lhs, dialect,
+                                            adjusted_context.first_row_is_header, adjusted_context.matching_key_codec, adjusted_context.index_interval)
+
+    output.write_line(f'{len(sparse_key_index)} entries of every {adjusted_context.index_interval} rows were written to {SparseKeyIndex.index_path_of(adjusted_context.lhs_file_path)}')
+
+
+class SparseKeyIndex:
+    """
+    Notes
+    -----
+    Sidecar file next to the CSV file sorted by the matching keys, written by the index mode (csvdiff3 index FILE).
+        * It keeps the row number, the byte offset of the row start and the matching key values of every N-th row
+        * It is valid as long as the file identity (path, size, mtime, hash of the head and tail) is unchanged
+        * It is also tied to the encoding, the dialect, the header condition and the matching keys it was built with
+
+    The entries are in the order of the matching keys, so the nearest entry before a key is found by binary search.
+    """
+
+    VERSION = 1
+    SUFFIX = '.csvdiff3-index'
+    DEFAULT_INTERVAL = 1000
+
+    def __init__(self, managed_keys, row_numbers, offsets):
+        self.managed_keys = managed_keys
+        self.row_numbers = row_numbers
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def index_path_of(cls, file_path):
+        return file_path + cls.SUFFIX
+
+    @classmethod
+    def build(cls, file_path, encoding, dialect, first_row_is_header, matching_key_codec, interval):
+
+        number_of_header_rows = 1 if first_row_is_header else 0
+
+        entries = []
+        previous_key = None
+        with RowBoundary(file_path, encoding, dialect, first_row_is_header, matching_key_codec, access='sequential') as row_boundary:
+            for i, (start, _, row) in enumerate(row_boundary.records_from(row_boundary.data_start)):
+
+                managed_key = matching_key_codec.managed_key_for(row, number_of_header_rows + i + 1)
+                if previous_key is not None and managed_key < previous_key:
+                    logger.error(f'matching keys in {file_path} are not sorted, so it can not be indexed.'
+                                 f' [current_key={MatchingKeyCodec.decode_key(managed_key)}, previous_key={MatchingKeyCodec.decode_key(previous_key)}, matching-key-indices={matching_key_codec.matching_key_info_list}]')
+                    sys.exit(1)
+                previous_key = managed_key
+
+                if i % interval == 0:
+                    entries.append([number_of_header_rows + i + 1, start, [row[index] for index in matching_key_codec.matching_key_indices]])
+
+        indexed = {
+            'version': cls.VERSION,
+            'identity': PreScanCache.identity_of(file_path),
+            'conditions': cls._conditions_of(encoding, dialect, first_row_is_header, matching_key_codec),
+            'interval': interval,
+            'entries': entries,
+        }
+
+        with open(cls.index_path_of(file_path), mode='w', encoding='utf8') as index_file:
+            json.dump(indexed, index_file)
+
+        return cls._from_entries(entries, matching_key_codec)
+
+    @classmethod
+    def load(cls, file_path, encoding, dialect, first_row_is_header, matching_key_codec):
+        """ It is None if there is no index, or the index is stale or built with other conditions. """
+
+        index_path = cls.index_path_of(file_path)
+        if not os.path.isfile(index_path):
+            return None
+
+        try:
+            with open(index_path, mode='r', encoding='utf8') as index_file:
+                indexed = json.load(index_file)
+
+            if indexed.get('version') != cls.VERSION \
+                    or indexed.get('identity') != PreScanCache.identity_of(file_path) \
+                    or indexed.get('conditions') != cls._conditions_of(encoding, dialect, first_row_is_header, matching_key_codec):
+                logger.warning(f'index is stale or built with other conditions, so it is not used. [index_path={index_path}]')
+                return None
+
+            logger.debug(f'index is used. [index_path={index_path}]')
+            return cls._from_entries(indexed['entries'], matching_key_codec)
+
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'index could not be loaded. [index_path={index_path}, type={type(e)}, description={e}]')
+            return None
+
+    @classmethod
+    def _conditions_of(cls, encoding, dialect, first_row_is_header, matching_key_codec):
+
+        return {
+            'encoding': encoding,
+            'first_row_is_header': bool(first_row_is_header),
+            'dialect': {name: getattr(dialect, name) for name in CsvDialectFixer.DIALECT_ATTRIBUTES},
+            'matching_keys': [repr(matching_key_info) for matching_key_info in matching_key_codec.matching_key_info_list],
+        }
+
+    @classmethod
+    def _from_entries(cls, entries, matching_key_codec):
+        """ Managed keys are made again from the key values, because typed keys can not be kept in JSON. """
+
+        managed_keys, row_numbers, offsets = [], [], []
+        for row_number, offset, key_values in entries:
+            managed_keys.append(matching_key_codec.managed_key_for_key_values(key_values))
+            row_numbers.append(row_number)
+            offsets.append(offset)
+
+        return cls(managed_keys, row_numbers, offsets)
+
+    def entry_before(self, key):
+        """ (row number, offset) of the last entry whose matching key is less than key. It is None if there is no such entry. """
+
+        position = bisect.bisect_left(self.managed_keys, key)
+        if position == 0:
+            return None
+
+        return self.row_numbers[position - 1], self.offsets[position - 1]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  Value-Difference Detection
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ValueDifferenceDetector:
+
+    class ValueDifferenceResult:
+
+        __slots__ = ('different_column_indices',)
+
+        def __init__(self, different_column_indices):
+
+            self.different_column_indices = different_column_indices
+
+        @property
+        def has_difference(self):
+            return True if self.different_column_indices else False
+
+
+    NO_DIFFERENCE = ValueDifferenceResult([])
+
+    def __init__(self, number_of_columns, matching_key_indices, ignore_column_indices, compares_raw_records=False):
+
+        self.number_of_columns = number_of_columns
+        self.compares_raw_records = compares_raw_records
+
+        self.column_indices = range(0, number_of_columns)
+        logger.debug(f'column_indices={self.column_indices}')
+
+        self.target_column_indices = tuple(sorted(set(self.column_indices) - set(matching_key_indices) - set(ignore_column_indices)))
+        logger.debug(f'target_column_indices={self.target_column_indices}')
+
+        self._target_values_of = self._target_values_function(self.target_column_indices)
+
+    @staticmethod
+    def _target_values_function(target_column_indices):
+        """ Function from a row to the values of the target columns, compared at once in C. """
+
+        if not target_column_indices:
+            return lambda row: ()
+
+        return operator.itemgetter(*target_column_indices)
+
+    def detect_difference_between(self, lhs_row, rhs_row):
+        """
+        Allocate nothing if the rows are the same as a whole, which is the most common case.
+        Otherwise the target columns are compared at once, before looking for the different ones.
+        """
+
+        if lhs_row == rhs_row and len(lhs_row) >= self.number_of_columns:
+            return self.NO_DIFFERENCE
+
+        target_values_of = self._target_values_of
+        if target_values_of(lhs_row) == target_values_of(rhs_row):
+            return self.NO_DIFFERENCE
+
+        different_column_indices = [index for index in self.target_column_indices if lhs_row[index] != rhs_row[index]]
+        return self.ValueDifferenceResult(different_column_indices)
+
+    def detect_difference_between_facts(self, lhs_fact, rhs_fact):
+        """
+        If the raw records are the same text, the rows are the same without comparing the columns.
+        Rows lacking columns are left to the comparison, to be detected as the number of columns not aligned.
+        """
+
+        if self.compares_raw_records and lhs_fact.lhs_raw_record is not None and lhs_fact.lhs_raw_record == rhs_fact.rhs_raw_record \
+                and lhs_fact.number_of_lhs_columns >= self.number_of_columns:
+            return self.NO_DIFFERENCE
+
+        return self.detect_difference_between(lhs_fact.lhs_row, rhs_fact.rhs_row)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  Reporting
+# ----------------------------------------------------------------------------------------------------------------------
+
+class PreScanner:
+
+    class ScanResult:
+
+        def __init__(self, number_of_columns, size_info_for_padding):
+            self.number_of_columns = number_of_columns
+            self.size_info_for_padding = size_info_for_padding
+
+        @classmethod
+        def for_lightly(cls, number_of_columns):
+            return PreScanner.ScanResult(number_of_columns, None)
+
+        @classmethod
+        def for_deeply(cls, number_of_columns, lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length):
+            size_info_for_padding = cls.SizeInfoForPadding(lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length)
+            return PreScanner.ScanResult(number_of_columns, size_info_for_padding)
+
+
+        class SizeInfoForPadding:
+
+            def __init__(self, lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length):
+                self.lhs_max_row_number = lhs_max_row_number
+                self.lhs_max_row_length = lhs_max_row_length
+                self.rhs_max_row_number = rhs_max_row_number
+                self.rhs_max_row_length = rhs_max_row_length
+
+
+    class SideScanResult:
+        """ Deep pre-scanning result of one side. number_of_columns is that of the first row (0 if there is no row). """
+
+        def __init__(self, number_of_columns, max_row_number, max_row_length):
+            self.number_of_columns = number_of_columns
+            self.max_row_number = max_row_number
+            self.max_row_length = max_row_length
+
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def scan(cls, context, csv_reader):
+
+        if context.needs_size_info_for_padding:
+            return PreScanner._scan_deeply(context, csv_reader)
+        else:
+            return PreScanner._scan_lightly(csv_reader)
+
+
+    @classmethod
+    def _scan_deeply(cls, context, csv_reader):
+        """
+        Notes
+        -----
+        Purpose of deep pre-scanning
+            * Determine the number of columns for value difference detection
+            * Get size information to format the horizontal report
+
+        With the pre-scan cache, a side whose file is unchanged since the last run is not scanned.
+        In parallel, both sides are scanned at the same time on separate worker processes, each with its own reader.
+        """
+
+        start_ = time.perf_counter()
+
+        lhs_cache = PreScanCache.for_side(context, csv_reader.lhs_csv_state, FileArrangement.LHS)
+        rhs_cache = PreScanCache.for_side(context, csv_reader.rhs_csv_state, FileArrangement.RHS)
+
+        lhs_result = lhs_cache.load()
+        rhs_result = rhs_cache.load()
+
+        if context.pre_scans_in_parallel and lhs_result is None and rhs_result is None:
+            lhs_result, rhs_result = cls._scan_both_sides_in_parallel(context, csv_reader)
+            lhs_cache.save(lhs_result)
+            rhs_cache.save(rhs_result)
+
+        lhs_result = lhs_result or lhs_cache.save(cls._scan_lhs_deeply(csv_reader))
+        rhs_result = rhs_result or rhs_cache.save(cls._scan_rhs_deeply(csv_reader))
+
+        number_of_columns = lhs_result.number_of_columns or rhs_result.number_of_columns
+
+        logger.debug(f'lhs_max_row_number={lhs_result.max_row_number}')
+        logger.debug(f'rhs_max_row_number={rhs_result.max_row_number}')
+
+        elapsed_time_ = time.perf_counter() - start_
+        logger.debug(f'PreScanner#scan() elapsed_time:{elapsed_time_}[sec]')
+        return PreScanner.ScanResult.for_deeply(number_of_columns,
+                                                lhs_result.max_row_number, lhs_result.max_row_length,
+                                                rhs_result.max_row_number, rhs_result.max_row_length)
+
+    @classmethod
+    def _scan_both_sides_in_parallel(cls, context, csv_reader):
+
+        lhs_dialect = CsvDialectFixer.picklable_dialect(csv_reader.lhs_csv_state.dialect)
+        rhs_dialect = CsvDialectFixer.picklable_dialect(csv_reader.rhs_csv_state.dialect)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            lhs_future = executor.submit(scan_one_side_deeply, context, FileArrangement.LHS, lhs_dialect)
+            rhs_future = executor.submit(scan_one_side_deeply, context, FileArrangement.RHS, rhs_dialect)
+
+            return cls.SideScanResult(*lhs_future.result()), cls.SideScanResult(*rhs_future.result())
+
+    @classmethod
+    def _scan_lhs_deeply(cls, csv_reader):
+
+        lhs_max_row_length = 0
+
+        lhs_fact = csv_reader.read_lhs()
+        number_of_columns = len(lhs_fact.lhs_row)
+
+        while lhs_fact.lhs_key != MatchingKeyCodec.END_of_KEY:
+            lhs_max_row_length = max(lhs_max_row_length, UnicodeSupport.string_length_considering_east_asian_characters_of(str(csv_reader.decode_lhs_row(lhs_fact.lhs_row))))
+            lhs_fact = csv_reader.read_lhs()
+
+        return cls.SideScanResult(number_of_columns, csv_reader.lhs_csv_state.row_number, lhs_max_row_length)
+
+    @classmethod
+    def _scan_rhs_deeply(cls, csv_reader):
+
+        rhs_max_row_length = 0
+
+        rhs_fact = csv_reader.read_rhs()
+        number_of_columns = len(rhs_fact.rhs_row)
 
         while rhs_fact.rhs_key != MatchingKeyCodec.END_of_KEY:
-            rhs_max_row_length = max(rhs_max_row_length, UnicodeSupport.string_length_considering_east_asian_characters_of(str(rhs_fact.rhs_row)))
+            rhs_max_row_length = max(rhs_max_row_length, UnicodeSupport.string_length_considering_east_asian_characters_of(str(csv_reader.decode_rhs_row(rhs_fact.rhs_row))))
             rhs_fact = csv_reader.read_rhs()
 
-        lhs_max_row_number = csv_reader.lhs_csv_state.row_number
-        rhs_max_row_number = csv_reader.rhs_csv_state.row_number
-        logger.debug(f'lhs_max_row_number={lhs_max_row_number}')
-        logger.debug(f'rhs_max_row_number={rhs_max_row_number}')
+        return cls.SideScanResult(number_of_columns, csv_reader.rhs_csv_state.row_number, rhs_max_row_length)
+
+    @classmethod
+    def _scan_lightly(cls, csv_reader):
+        """
+        Notes
+        -----
+        Purpose of light pre-scanning
+            * Determine the number of columns for value difference detection
+
+        Vertical reports do not require size information for formatting.
+        """
+
+        lhs_fact = csv_reader.read_lhs()
+        rhs_fact = csv_reader.read_rhs()
+
+        return PreScanner.ScanResult.for_lightly(cls._determine_number_of_columns_from(lhs_fact, rhs_fact))
+
+    @classmethod
+    def _determine_number_of_columns_from(cls, lhs_fact, rhs_fact):
+
+        number_of_columns = 0
+        if lhs_fact.lhs_row:
+            number_of_columns = len(lhs_fact.lhs_row)
+        elif rhs_fact.rhs_row:
+            number_of_columns = len(rhs_fact.rhs_row)
+
+        return number_of_columns
+
+
+def scan_one_side_deeply(context, file_arrangement, dialect):
+    """ Entry point of a worker process of PreScanner. Scan one side deeply with its own reader, which parses on this process. """
+
+    context = copy.copy(context)
+    context.number_of_parse_processes = 0
+    context.maps_files = False
+
+    if file_arrangement == FileArrangement.LHS:
+        with CompressedFile.open_text(context.lhs_file_path, context.encoding_for_lhs) as lhs_csv:
+            csv_reader = CsvReader(lhs_csv, io.StringIO(), dialect, dialect, context)
+            try:
+                result = PreScanner._scan_lhs_deeply(csv_reader)
+            finally:
+                csv_reader.close()
+    else:
+        with CompressedFile.open_text(context.rhs_file_path, context.encoding_for_rhs) as rhs_csv:
+            csv_reader = CsvReader(io.StringIO(), rhs_csv, dialect, dialect, context)
+            try:
+                result = PreScanner._scan_rhs_deeply(csv_reader)
+            finally:
+                csv_reader.close()
+
+    return result.number_of_columns, result.max_row_number, result.max_row_length
+
+
+class PreScanCache:
+    """
+    Notes
+    -----
+    Sidecar file next to the CSV file that keeps the deep pre-scanning result of that side.
+        * It is valid as long as the file identity (path, size, mtime, hash of the head and tail) is unchanged
+        * It is also tied to the encoding, the dialect and the header condition the result was scanned with
+
+    It is used only when --pre-scan-cache is specified. Otherwise load() always misses and save() writes nothing.
+    """
+
+    VERSION = 1
+    SUFFIX = '.csvdiff3-prescan'
+    HASHED_SIZE = 64 * 1024
+
+    def __init__(self, enabled, file_path, conditions):
+        self.enabled = enabled
+        self.file_path = file_path
+        self.cache_path = file_path + self.SUFFIX
+        self.conditions = conditions
+
+    @classmethod
+    def for_side(cls, context, csv_state, file_arrangement):
+
+        dialect = csv_state.dialect
+        # With --compare-bytes, the file is read in latin-1 whatever its text encoding is, while the widths are measured in the text encoding
+        conditions = {
+            'encoding': getattr(context, "encoding" + file_arrangement),
+            'text_encoding': getattr(context, "text_encoding" + file_arrangement),
+            'first_row_is_header': bool(context.first_row_is_header),
+            'dialect': {name: getattr(dialect, name) for name in CsvDialectFixer.DIALECT_ATTRIBUTES},
+        }
+        file_path = context.lhs_file_path if file_arrangement == FileArrangement.LHS else context.rhs_file_path
+        return cls(context.uses_pre_scan_cache, file_path, conditions)
+
+    def load(self):
+
+        if not self.enabled or not os.path.isfile(self.cache_path):
+            return None
+
+        try:
+            with open(self.cache_path, mode='r', encoding='utf8') as cache_file:
+                cached = json.load(cache_file)
+
+            if cached.get('version') != self.VERSION or cached.get('identity') != self.identity_of(self.file_path) or cached.get('conditions') != self.conditions:
+                logger.debug(f'pre-scan cache is stale. [cache_path={self.cache_path}]')
+                return None
+
+            logger.debug(f'pre-scan cache is used. [cache_path={self.cache_path}]')
+            return PreScanner.SideScanResult(**cached['result'])
+
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'pre-scan cache could not be loaded. [cache_path={self.cache_path}, type={type(e)}, description={e}]')
+            return None
+
+    def save(self, side_scan_result):
+
+        if not self.enabled:
+            return side_scan_result
+
+        cached = {
+            'version': self.VERSION,
+            'identity': self.identity_of(self.file_path),
+            'conditions': self.conditions,
+            'result': vars(side_scan_result),
+        }
+
+        try:
+            with open(self.cache_path, mode='w', encoding='utf8') as cache_file:
+                json.dump(cached, cache_file)
+        except OSError as e:
+            logger.warning(f'pre-scan cache could not be saved. [cache_path={self.cache_path}, type={type(e)}, description={e}]')
+
+        return side_scan_result
+
+    @classmethod
+    def identity_of(cls, file_path):
+
+        stat = os.stat(file_path)
+
+        digest = hashlib.sha1()
+        with open(file_path, mode='rb') as csv_file:
+            digest.update(csv_file.read(cls.HASHED_SIZE))
+            csv_file.seek(max(stat.st_size - cls.HASHED_SIZE, 0))
+            digest.update(csv_file.read(cls.HASHED_SIZE))
+
+        return {
+            'path': file_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'head_tail_sha1': digest.hexdigest(),
+        }
+
+
+
+class Mark(type):
+
+    LHS_ONLY = '<'
+    RHS_ONLY = '>'
+    HAS_DIFF = '!'
+    NON_DIFF = ' '
+    NON_DIFF_EXPRESSLY = '='
+
+
+class HeadingReporter:
+
+    def __init__(self, context):
+        self.cxt = context
+
+
+    def report_heading(self):
+
+        if not self.cxt.reports_in_text:
+            return
+
+        self._report_title()
+
+        if self.cxt.shows_context_from_arguments:
+            self._report_context()
+
+    @classmethod
+    @spacing_before(1)
+    def _report_title(cls):
+        output.write_line('============ Report ============')
+
+    @spacing_before(1)
+    def _report_context(self):
+
+        output.write_line('● Context')
+        output.write_line(f'File Path on the Left-Hand Side: {self.cxt.lhs_file_path}')
+        output.write_line(f'File Path on the Right-Hand Side : {self.cxt.rhs_file_path}')
+        output.write_line(f'Matching Key Indices: {self.cxt.matching_key_codec.matching_key_info_list}')
+        output.write_line(f'Matching Key Is Unique?: {self.cxt.key_should_be_unique}')
+        output.write_line(f'Column Indices to Ignore: {self.cxt.column_indices_to_ignore}')
+        output.write_line(f'with Header?: {self.cxt.first_row_is_header}')
+        output.write_line(f'Report Style: {"Vertical" if self.cxt.reports_in_vertical_style else "Two facing (Horizontal)"}')
+        output.write_line(f'Show Count?: {self.cxt.shows_count}')
+        output.write_line(f'Show Difference Only?: {self.cxt.shows_difference_only}')
+        output.write_line(f'Show All?: {self.cxt.shows_all_lines}')
+        output.write_line(f'Show Context?: {self.cxt.shows_context_from_arguments}')
+        output.write_line(f'File Encoding for Left-Hand Side: {self.cxt.text_encoding_for_lhs}')
+        output.write_line(f'File Encoding for Right-Hand Side: {self.cxt.text_encoding_for_rhs}')
+        output.write_line(f'CSV Sniffing Size: {self.cxt.sniffing_size}')
+        output.write_line('--- csv analysis conditions ---')
+        output.write_line(f'Forces Individual Specified Conditions?: {self.cxt.forces_individual_specs}')
+        output.write_line(f'column_separator_for_lhs: {self.cxt.display_string_for_column_separator(self.cxt.column_separator_for_lhs)}')
+        output.write_line(f'column_separator_for_rhs: {self.cxt.display_string_for_column_separator(self.cxt.column_separator_for_rhs)}')
+        output.write_line(f'line_separator_for_lhs: {self.cxt.display_string_for_line_separator(self.cxt.line_separator_for_lhs, FileArrangement.LHS)}')
+        output.write_line(f'line_separator_for_rhs: {self.cxt.display_string_for_line_separator(self.cxt.line_separator_for_rhs, FileArrangement.RHS)}')
+        output.write_line(f'quote_char_for_lhs: {self.cxt.quote_char_for_lhs}')
+        output.write_line(f'quote_char_for_rhs: {self.cxt.quote_char_for_rhs}')
+        output.write_line(f'skips_space_after_column_separator_for_lhs: {self.cxt.skips_space_after_column_separator_for_lhs}')
+        output.write_line(f'skips_space_after_column_separator_for_rhs: {self.cxt.skips_space_after_column_separator_for_rhs}')
+
+
+class DetailReporter:
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, context):
+        self.cxt = context
+
+
+    def report_detail_heading(self):
+
+        if not self.cxt.shows_details:
+            return
+
+        self._report_content_heading()
+        self._report_file_name()
+
+    @spacing_before(1)
+    def _report_content_heading(self):
+        if self.cxt.shows_difference_only:
+            output.write_line('● Differences')
+        elif self.cxt.shows_all_lines:
+            output.write_line('● All')
+        else:
+            pass
+
+    @abc.abstractmethod
+    def _report_file_name(self):
+        raise NotImplementedError()
+
+    def report_detail_ending(self):
+        pass
+
+    def consider_size_info_for_padding(self, size_info_for_padding):
+        pass
+
+
+    @abc.abstractmethod
+    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+        raise NotImplementedError()
+
+
+    class Factory:
+
+        def __init__(self):
+            pass
+
+        @staticmethod
+        def reporter_for(context, scan_result):
+
+            if context.output_format == 'jsonl':
+                return JsonLinesReporter(context, scan_result)
+            elif context.output_format == 'csv':
+                return CsvRecordReporter(context, scan_result)
+            elif context.reports_in_vertical_style:
+                return VerticalReporter(context, scan_result)
+            elif context.reports_in_single_pass:
+                return SpoolingHorizontalReporter(context, scan_result)
+            else:
+                return HorizontalReporter(context, scan_result)
+
+
+class HorizontalReporter(DetailReporter):
+
+    class Template:
+
+        DIFFERENT_COLUMN_GUIDE = 'Column indices with difference'
+        PREFIX_of_DIFF_COLUMNS = '  @ '
+
+        def __init__(self, lhs_max_row_number_length, lhs_max_row_length, rhs_max_row_number_length, rhs_max_row_length):
+
+            self.lhs_max_row_number_length = lhs_max_row_number_length
+            self.lhs_filler_length = 1
+            self.lhs_max_row_length = lhs_max_row_length
+            self.diff_mark_filler_length_in_front = 2
+            self.diff_mark_length = 1
+            self.diff_mark_filler_length_in_rear = 2
+            self.rhs_max_row_number_length = rhs_max_row_number_length
+            self.rhs_filler_length = 1
+            self.rhs_max_row_length = rhs_max_row_length
+            self.prefix_length_for_diff_columns_displays = len(self.PREFIX_of_DIFF_COLUMNS)
+
+            self.lhs_length = self.lhs_max_row_number_length + self.lhs_filler_length + self.lhs_max_row_length
+            self.diff_mark_length = self.diff_mark_filler_length_in_front + self.diff_mark_length + self.diff_mark_filler_length_in_rear
+            self.rhs_length = self.rhs_max_row_number_length + self.rhs_filler_length + self.rhs_max_row_length
+
+
+        # --- heading-related description ---
+
+        def division_string(self):
+            return '-' * (self.lhs_length + self.diff_mark_length + self.rhs_length + self.prefix_length_for_diff_columns_displays + len(self.DIFFERENT_COLUMN_GUIDE))
+
+        def file_name_description(self, lhs_file_name, rhs_file_name):
+
+            lhs_file_name = UnicodeSupport.left_justified(lhs_file_name, self.lhs_length)
+            diff_mark_spacing = ' ' * self.diff_mark_length
+            rhs_file_name = UnicodeSupport.left_justified(rhs_file_name, self.rhs_length)
+            prefix_length_spacing = ' ' * self.prefix_length_for_diff_columns_displays
+            return f'{lhs_file_name}{diff_mark_spacing}{rhs_file_name}{prefix_length_spacing}{self.DIFFERENT_COLUMN_GUIDE}'
+
+
+        # --- left-hand side related description ---
+
+        def lhs_only_description(self, lhs_fact, lhs_row_width=None):
+
+            lhs = self._lhs_description(lhs_fact, lhs_row_width)
+            diff_mark_area = (' ' * self.diff_mark_filler_length_in_front) + Mark.LHS_ONLY + (' ' * self.diff_mark_filler_length_in_rear)
+            return f'{lhs}{diff_mark_area}'
+
+        def _lhs_description(self, lhs_fact, lhs_row_width=None):
+
+            lhs_row_number = UnicodeSupport.right_justified(str(lhs_fact.lhs_row_number), self.lhs_max_row_number_length)
+            spacing = ' ' * self.lhs_filler_length
+            lhs_row = UnicodeSupport.left_justified(str(lhs_fact.lhs_row), self.lhs_max_row_length, lhs_row_width)
+            return f'{lhs_row_number}{spacing}{lhs_row}'
+
+        def _lhs_empty_description(self):
+            return ' ' * (self.lhs_max_row_number_length + self.lhs_filler_length + self.lhs_max_row_length)
+
+
+        # --- right-hand side related description ---
+
+        def rhs_only_description(self, rhs_fact, rhs_row_width=None):
+
+            empty_lhs = self._lhs_empty_description()
+            diff_mark_area = (' ' * self.diff_mark_filler_length_in_front) + Mark.RHS_ONLY + (' ' * self.diff_mark_filler_length_in_rear)
+            rhs = self._rhs_description(rhs_fact, rhs_row_width)
+            return f'{empty_lhs}{diff_mark_area}{rhs}'
+
+        def _rhs_description(self, rhs_fact, rhs_row_width=None):
+
+            rhs_row_number = UnicodeSupport.right_justified(str(rhs_fact.rhs_row_number), self.rhs_max_row_number_length)
+            spacing = ' ' * self.rhs_filler_length
+            rhs_row = UnicodeSupport.left_justified(str(rhs_fact.rhs_row), self.rhs_max_row_length, rhs_row_width)
+            return f'{rhs_row_number}{spacing}{rhs_row}'
+
+
+        # --- both sides related description ---
+
+        def both_description(self, lhs_fact, rhs_fact, value_difference_result, lhs_row_width=None, rhs_row_width=None):
+
+            lhs = self._lhs_description(lhs_fact, lhs_row_width)
+            diff_mark = Mark.HAS_DIFF if value_difference_result.has_difference else Mark.NON_DIFF
+            diff_mark_area = (' ' * self.diff_mark_filler_length_in_front) + diff_mark + (' ' * self.diff_mark_filler_length_in_rear)
+            rhs = self._rhs_description(rhs_fact, rhs_row_width)
+            prefix_of_diff_columns = self.PREFIX_of_DIFF_COLUMNS if value_difference_result.has_difference else ''
+            different_columns = str(value_difference_result.different_column_indices) if value_difference_result.has_difference else ''
+            return f'{lhs}{diff_mark_area}{rhs}{prefix_of_diff_columns}{different_columns}'
+
+
+    def __init__(self, context, scan_result):
+
+        super(HorizontalReporter, self).__init__(context)
+        self.cxt = context
+
+        if context.needs_size_info_for_padding:
+            size_info = scan_result.size_info_for_padding
+            self.template = HorizontalReporter.Template(len(str(size_info.lhs_max_row_number)),
+                                                        size_info.lhs_max_row_length,
+                                                        len(str(size_info.rhs_max_row_number)),
+                                                        size_info.rhs_max_row_length)
+        else:
+            self.template = None
+
+
+    # --- report heading related ---
+
+    def _report_file_name(self):
+
+        output.write_line(self.template.division_string())
+        output.write_line(self.template.file_name_description(os.path.basename(self.cxt.lhs_file_name), os.path.basename(self.cxt.rhs_file_name)))
+        output.write_line(self.template.division_string())
+
+
+    # --- report each cases ---
+
+    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+
+        if self.cxt.shows_details:
+            output.write_line(self.template.lhs_only_description(lhs_fact))
+
+    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+
+        if (self.cxt.shows_difference_only and value_difference_result.has_difference) or self.cxt.shows_all_lines:
+            output.write_line(self.template.both_description(lhs_fact, rhs_fact, value_difference_result))
+
+    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+
+        if self.cxt.shows_details:
+            output.write_line(self.template.rhs_only_description(rhs_fact))
+
+
+class SpoolingHorizontalReporter(HorizontalReporter):
+    """
+    Notes
+    -----
+    Horizontal report without deep pre-scanning.
+        * The size information for padding is collected while matching, from every row as the deep pre-scan does
+        * Only the lines to be reported are spooled to a temporary file, as the strings of the rows with their widths measured
+        * The heading and the spooled lines are laid out with HorizontalReporter.Template at the end
+    """
+
+    def __init__(self, context, scan_result):
+
+        super(SpoolingHorizontalReporter, self).__init__(context, scan_result)
+
+        self.lhs_max_row_number = 0
+        self.lhs_max_row_length = 0
+        self.rhs_max_row_number = 0
+        self.rhs_max_row_length = 0
+
+        self._spool = tempfile.TemporaryFile()
+
+
+    # --- report heading related ---
+
+    def report_detail_heading(self):
+        """ Deferred until report_detail_ending(), because the padding is not yet known. """
+        pass
+
+    def report_detail_ending(self):
+
+        self.template = HorizontalReporter.Template(len(str(self.lhs_max_row_number)),
+                                                    self.lhs_max_row_length,
+                                                    len(str(self.rhs_max_row_number)),
+                                                    self.rhs_max_row_length)
+
+        super(SpoolingHorizontalReporter, self).report_detail_heading()
+
+        with self._spool:
+            self._spool.seek(0)
+            for mark, lhs_fact, lhs_row_width, rhs_fact, rhs_row_width, value_difference_result in self._spooled_records():
+                if mark == Mark.LHS_ONLY:
+                    output.write_line(self.template.lhs_only_description(lhs_fact, lhs_row_width))
+                elif mark == Mark.RHS_ONLY:
+                    output.write_line(self.template.rhs_only_description(rhs_fact, rhs_row_width))
+                else:
+                    output.write_line(self.template.both_description(lhs_fact, rhs_fact, value_difference_result, lhs_row_width, rhs_row_width))
+
+    def _spooled_records(self):
+
+        while True:
+            try:
+                mark, lhs_row_number, lhs_row_text, lhs_row_width, rhs_row_number, rhs_row_text, rhs_row_width, different_column_indices = pickle.load(self._spool)
+            except EOFError:
+                return
+
+            yield (mark,
+                   LhsFact(lhs_row_number, lhs_row_text, None), lhs_row_width,
+                   RhsFact(rhs_row_number, rhs_row_text, None), rhs_row_width,
+                   ValueDifferenceDetector.ValueDifferenceResult(different_column_indices))
+
+    def _spool_record(self, mark, lhs_row_number, lhs_row_text, lhs_row_width, rhs_row_number, rhs_row_text, rhs_row_width, different_column_indices):
+        pickle.dump((mark, lhs_row_number, lhs_row_text, lhs_row_width, rhs_row_number, rhs_row_text, rhs_row_width, different_column_indices),
+                    self._spool, pickle.HIGHEST_PROTOCOL)
+
+
+    # --- size information for padding ---
+
+    def consider_size_info_for_padding(self, size_info_for_padding):
+        """ For the rows measured elsewhere, such as in worker processes. """
+
+        self.lhs_max_row_number = max(self.lhs_max_row_number, size_info_for_padding.lhs_max_row_number)
+        self.lhs_max_row_length = max(self.lhs_max_row_length, size_info_for_padding.lhs_max_row_length)
+        self.rhs_max_row_number = max(self.rhs_max_row_number, size_info_for_padding.rhs_max_row_number)
+        self.rhs_max_row_length = max(self.rhs_max_row_length, size_info_for_padding.rhs_max_row_length)
+
+    def _measure_lhs(self, lhs_fact):
+        """ Returns the string of the row and its width, to be spooled and laid out without measuring again. """
+
+        lhs_row_text = str(lhs_fact.lhs_row)
+        lhs_row_width = UnicodeSupport.string_length_considering_east_asian_characters_of(lhs_row_text)
+        self.lhs_max_row_number = max(self.lhs_max_row_number, lhs_fact.lhs_row_number)
+        self.lhs_max_row_length = max(self.lhs_max_row_length, lhs_row_width)
+        return lhs_row_text, lhs_row_width
+
+    def _measure_rhs(self, rhs_fact):
+        """ Returns the string of the row and its width, to be spooled and laid out without measuring again. """
+
+        rhs_row_text = str(rhs_fact.rhs_row)
+        rhs_row_width = UnicodeSupport.string_length_considering_east_asian_characters_of(rhs_row_text)
+        self.rhs_max_row_number = max(self.rhs_max_row_number, rhs_fact.rhs_row_number)
+        self.rhs_max_row_length = max(self.rhs_max_row_length, rhs_row_width)
+        return rhs_row_text, rhs_row_width
+
+
+    # --- report each cases ---
+
+    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+
+        lhs_row_text, lhs_row_width = self._measure_lhs(lhs_fact)
+        self._spool_record(Mark.LHS_ONLY, lhs_fact.lhs_row_number, lhs_row_text, lhs_row_width, None, None, None, None)
+
+    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+
+        lhs_row_text, lhs_row_width = self._measure_lhs(lhs_fact)
+        rhs_row_text, rhs_row_width = self._measure_rhs(rhs_fact)
+
+        if (self.cxt.shows_difference_only and value_difference_result.has_difference) or self.cxt.shows_all_lines:
+            mark = Mark.HAS_DIFF if value_difference_result.has_difference else Mark.NON_DIFF
+            self._spool_record(mark, lhs_fact.lhs_row_number, lhs_row_text, lhs_row_width, rhs_fact.rhs_row_number, rhs_row_text, rhs_row_width,
+                               value_difference_result.different_column_indices)
+
+    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+
+        rhs_row_text, rhs_row_width = self._measure_rhs(rhs_fact)
+        self._spool_record(Mark.RHS_ONLY, None, None, None, rhs_fact.rhs_row_number, rhs_row_text, rhs_row_width, None)
+
+
+class VerticalReporter(DetailReporter):
+
+    class Template:
+
+        LHS_MARK = 'L'
+        RHS_MARK = 'R'
+        PREFIX_of_DIFF_COLUMNS = '@'
+
+        def __init__(self):
+            pass
+
+
+        # --- heading-related description ---
+
+        @classmethod
+        def division_string(cls):
+            return '-' * 80
+
+        @classmethod
+        def file_name_description(cls, mark, file_name):
+            return f'{mark} {file_name}'
+
+
+        # --- left-hand side related description ---
+
+        @classmethod
+        def lhs_only_description(cls, lhs_fact):
+            return f'{Mark.LHS_ONLY} {cls.LHS_MARK} {str(lhs_fact.lhs_row_number)} {str(lhs_fact.lhs_row)}'
+
+
+        # --- right-hand side related description ---
+
+        @classmethod
+        def rhs_only_description(cls, rhs_fact):
+            return f'{Mark.RHS_ONLY} {cls.RHS_MARK} {str(rhs_fact.rhs_row_number)} {str(rhs_fact.rhs_row)}'
+
+
+        # --- both sides related description ---
+
+        @classmethod
+        def both_description_heading(cls, value_difference_result):
+
+            if value_difference_result.has_difference:
+                return f'{Mark.HAS_DIFF} {cls.PREFIX_of_DIFF_COLUMNS} {str(value_difference_result.different_column_indices)}'
+            else:
+                return Mark.NON_DIFF_EXPRESSLY
+
+        @classmethod
+        def both_description_lhs(cls, lhs_fact, row_number_length):
+            return f'  {cls.LHS_MARK} {str(lhs_fact.lhs_row_number).rjust(row_number_length)} {str(lhs_fact.lhs_row)}'
+
+        @classmethod
+        def both_description_rhs(cls, rhs_fact, row_number_length):
+            return f'  {cls.RHS_MARK} {str(rhs_fact.rhs_row_number).rjust(row_number_length)} {str(rhs_fact.rhs_row)}'
+
+
+
+    def __init__(self, context, _):
+
+        super(VerticalReporter, self).__init__(context)
+        self.cxt = context
+        self.template = VerticalReporter.Template()
+
+
+    # --- report heading related ---
+
+    def _report_file_name(self):
+
+        output.write_line(self.template.division_string())
+        output.write_line(self.template.file_name_description(self.template.LHS_MARK, os.path.basename(self.cxt.lhs_file_name)))
+        output.write_line(self.template.file_name_description(self.template.RHS_MARK, os.path.basename(self.cxt.rhs_file_name)))
+        output.write_line(self.template.division_string())
+
+
+    # --- report each cases ---
+
+    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+
+        if self.cxt.shows_details:
+            output.write_line(self.template.lhs_only_description(lhs_fact))
+
+    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+
+        if (self.cxt.shows_difference_only and value_difference_result.has_difference) or self.cxt.shows_all_lines:
+
+            row_number_length = max(len(str(lhs_fact.lhs_row_number)), len(str(rhs_fact.rhs_row_number)))
+
+            output.write_line(self.template.both_description_heading(value_difference_result))
+            output.write_line(self.template.both_description_lhs(lhs_fact, row_number_length))
+            output.write_line(self.template.both_description_rhs(rhs_fact, row_number_length))
+
+    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+
+        if self.cxt.shows_details:
+            output.write_line(self.template.rhs_only_description(rhs_fact))
+
+
+class RecordReporter(DetailReporter):
+    """
+    Notes
+    -----
+    Base of the reporters of a machine-readable record for each line to be reported, as soon as it is matched.
+        * kind: DIFF-MARK, or '=' for the same lines
+        * lhs_row_number, rhs_row_number: row numbers, or None on the side where the row does not exist
+        * key: values of the matching key columns in the order of -k, as they are in the row
+        * different_column_indices: column indices with difference, empty unless the kind is '!'
+
+    There is nothing to pad, so the size information of the rows is not needed.
+    """
+
+    def __init__(self, context, _):
+
+        super().__init__(context)
+        self._matching_key_indices = context.matching_key_codec.matching_key_indices
+
+    def report_detail_heading(self):
+        pass
+
+    def _report_file_name(self):
+        pass
+
+    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+        self._report_record(Mark.LHS_ONLY, lhs_fact.lhs_row_number, None, self._key_of(lhs_fact.lhs_row), [])
+
+    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+
+        if (self.cxt.shows_difference_only and value_difference_result.has_difference) or self.cxt.shows_all_lines:
+            kind = Mark.HAS_DIFF if value_difference_result.has_difference else Mark.NON_DIFF_EXPRESSLY
+            self._report_record(kind, lhs_fact.lhs_row_number, rhs_fact.rhs_row_number, self._key_of(lhs_fact.lhs_row), value_difference_result.different_column_indices)
+
+    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+        self._report_record(Mark.RHS_ONLY, None, rhs_fact.rhs_row_number, self._key_of(rhs_fact.rhs_row), [])
+
+    def _key_of(self, row):
+        return [row[index] for index in self._matching_key_indices]
+
+    @abc.abstractmethod
+    def _report_record(self, kind, lhs_row_number, rhs_row_number, key, different_column_indices):
+        raise NotImplementedError()
+
+
+class JsonLinesReporter(RecordReporter):
+
+    def _report_record(self, kind, lhs_row_number, rhs_row_number, key, different_column_indices):
+
+        output.write_line(json.dumps({
+            'kind': kind,
+            'lhs_row_number': lhs_row_number,
+            'rhs_row_number': rhs_row_number,
+            'key': key,
+            'different_column_indices': list(different_column_indices),
+        }, ensure_ascii=False))
+
+
+class CsvRecordReporter(RecordReporter):
+    """ A column for each matching key column, named after its index. Column indices with difference are separated by spaces. """
+
+    def __init__(self, context, scan_result):
+
+        super().__init__(context, scan_result)
+        self._csv_writer = csv.writer(self, lineterminator='')
+
+    def write(self, record):
+        """ Called by csv.writer with each record. """
+        output.write_line(record)
+
+    def report_detail_heading(self):
+        self._csv_writer.writerow(['kind', 'lhs_row_number', 'rhs_row_number'] + [f'key{index}' for index in self._matching_key_indices] + ['different_column_indices'])
+
+    def _report_record(self, kind, lhs_row_number, rhs_row_number, key, different_column_indices):
+        self._csv_writer.writerow([kind, lhs_row_number, rhs_row_number] + key + [' '.join(map(str, different_column_indices))])
+
+
+class CountReporter:
+
+    class RowNumberRuns:
+        """ Row numbers in the order of addition, kept as runs of consecutive numbers in arrays. """
+
+        def __init__(self):
+
+            self._starts = array.array('q')
+            self._lengths = array.array('q')
+            self._next_row_number = None
+
+        def append(self, row_number):
+
+            if row_number == self._next_row_number:
+                self._lengths[-1] += 1
+            else:
+                self._starts.append(row_number)
+                self._lengths.append(1)
+
+            self._next_row_number = row_number + 1
+
+        def __iter__(self):
+
+            for start, length in zip(self._starts, self._lengths):
+                yield from range(start, start + length)
+
+
+    class RowNumberPairRuns:
+        """ Pairs of row numbers kept as runs of pairs where both are consecutive. A row number on the left-hand side appears only once. """
+
+        def __init__(self):
+
+            self._lhs_starts = array.array('q')
+            self._rhs_starts = array.array('q')
+            self._lengths = array.array('q')
+            self._next_lhs_row_number = None
+            self._next_rhs_row_number = None
+
+        def append(self, lhs_row_number, rhs_row_number):
+
+            if lhs_row_number == self._next_lhs_row_number and rhs_row_number == self._next_rhs_row_number:
+                self._lengths[-1] += 1
+            else:
+                self._lhs_starts.append(lhs_row_number)
+                self._rhs_starts.append(rhs_row_number)
+                self._lengths.append(1)
+
+            self._next_lhs_row_number = lhs_row_number + 1
+            self._next_rhs_row_number = rhs_row_number + 1
+
+        def sorted_by_lhs_row_number(self):
+            """ Runs do not overlap on the left-hand side, so sorting the runs sorts the pairs. They are already sorted with the sort-merge. """
+
+            run_indices = range(len(self._lengths))
+            if any(self._lhs_starts[i - 1] > self._lhs_starts[i] for i in range(1, len(self._lengths))):
+                run_indices = sorted(run_indices, key=self._lhs_starts.__getitem__)
+
+            for i in run_indices:
+                lhs_start, rhs_start = self._lhs_starts[i], self._rhs_starts[i]
+                for offset in range(self._lengths[i]):
+                    yield lhs_start + offset, rhs_start + offset
+
+
+    class Counter:
+
+        def __init__(self, collects_row_numbers=True):
+
+            self.number_of_same_lines = 0
+            self.number_of_lhs_only = 0
+            self.number_of_rhs_only = 0
+            self.number_of_differences = 0
+
+            self.collects_row_numbers = collects_row_numbers
+            self.row_numbers_for_lhs_only = CountReporter.RowNumberRuns()
+            self.row_numbers_for_rhs_only = CountReporter.RowNumberRuns()
+            self.row_numbers_for_differences = CountReporter.RowNumberPairRuns()
+
+            self._max_digit = None
+
+        def _increment_same_lines(self):
+            self.number_of_same_lines += 1
+
+        def _increment_lhs_only(self):
+            self.number_of_lhs_only += 1
+
+        def _increment_rhs_only(self):
+            self.number_of_rhs_only += 1
+
+        def _increment_differences(self):
+            self.number_of_differences += 1
+
+        def _add_row_number_for_lhs_only(self, row_number):
+            self.row_numbers_for_lhs_only.append(row_number)
+
+        def _add_row_number_for_rhs_only(self, row_number):
+            self.row_numbers_for_rhs_only.append(row_number)
+
+        def _add_row_number_for_differences(self, lhs_row_number, rhs_row_number):
+            self.row_numbers_for_differences.append(lhs_row_number, rhs_row_number)
+
+
+        def count_for_case_of_existed_only_on_lhs(self, row_number):
+            self._increment_lhs_only()
+            if self.collects_row_numbers:
+                self._add_row_number_for_lhs_only(row_number)
+
+        def count_for_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+
+            if value_difference_result.has_difference:
+                self._increment_differences()
+                if self.collects_row_numbers:
+                    self._add_row_number_for_differences(lhs_fact.lhs_row_number, rhs_fact.rhs_row_number)
+            else:
+                self._increment_same_lines()
+
+        def count_for_case_of_existed_only_on_rhs(self, row_number):
+            self._increment_rhs_only()
+            if self.collects_row_numbers:
+                self._add_row_number_for_rhs_only(row_number)
+
+        def count_for_cases_of_same_lines(self, number_of_same_lines):
+            self.number_of_same_lines += number_of_same_lines
+
+        @property
+        def number_of_all_differences(self):
+            return self.number_of_lhs_only + self.number_of_rhs_only + self.number_of_differences
+
+        @property
+        def sorted_row_numbers_for_differences(self):
+            return self.row_numbers_for_differences.sorted_by_lhs_row_number()
+
+
+        @property
+        def max_digit(self):
+
+            if self._max_digit is not None:
+                return self._max_digit
+
+            self._max_digit = max(
+                len(str(self.number_of_same_lines)),
+                len(str(self.number_of_lhs_only)),
+                len(str(self.number_of_rhs_only)),
+                len(str(self.number_of_differences)),
+            )
+            return self._max_digit
+
+
+    ROW_NUMBERS_PER_WRITE = 10000
+
+    def __init__(self, shows_count, shows_row_numbers=True):
+        """ Row numbers are not collected unless they are reported. """
+
+        self.shows_count = shows_count
+        self.shows_row_numbers = shows_row_numbers
+        self.counter = self.Counter(collects_row_numbers=shows_count and shows_row_numbers)
+
+
+    def _func_of_right_justified_number(self):
+        return lambda number: str(number).rjust(self.counter.max_digit)
+
+    @spacing_before(1)
+    def report_count(self):
+
+        if not self.shows_count:
+            return
+
+        output.write_line('● Count & Row number')
+
+        rjust = self._func_of_right_justified_number()
+        output.write_line('same lines           : {}'.format(rjust(self.counter.number_of_same_lines)))
+
+        if not self.shows_row_numbers:
+            output.write_line('left side only    ({}): {}'.format(Mark.LHS_ONLY, rjust(self.counter.number_of_lhs_only)))
+            output.write_line('right side only   ({}): {}'.format(Mark.RHS_ONLY, rjust(self.counter.number_of_rhs_only)))
+            output.write_line('with differences  ({}): {}'.format(Mark.HAS_DIFF, rjust(self.counter.number_of_differences)))
+            return
+
+        output.write('left side only    ({}): {} :-- Row Numbers      -->: '.format(Mark.LHS_ONLY, rjust(self.counter.number_of_lhs_only)))
+        self._write_list_of(map(str, self.counter.row_numbers_for_lhs_only))
+        output.write('right side only   ({}): {} :-- Row Numbers      -->: '.format(Mark.RHS_ONLY, rjust(self.counter.number_of_rhs_only)))
+        self._write_list_of(map(str, self.counter.row_numbers_for_rhs_only))
+        output.write('with differences  ({}): {} :-- Row Number Pairs -->: '.format(Mark.HAS_DIFF, rjust(self.counter.number_of_differences)))
+        self._write_list_of(f'({lhs_row_number}, {rhs_row_number})' for lhs_row_number, rhs_row_number in self.counter.sorted_row_numbers_for_differences)
+
+    @classmethod
+    def _write_list_of(cls, strings):
+        """ Written as str() of the list does, a part at a time, not to build the whole string of a long list. """
+
+        output.write('[')
+
+        separator = ''
+        for part in iter(lambda: list(itertools.islice(strings, cls.ROW_NUMBERS_PER_WRITE)), []):
+            output.write(separator + ', '.join(part))
+            separator = ', '
+
+        output.write_line(']')
+
+
+class UnicodeSupport:
+    """
+    Notes
+    -----
+    The length of a string is its display width, where East Asian Fullwidth, Wide and Ambiguous characters take two columns.
+        * An ASCII string, as most of CSV data is, is measured by len()
+        * The width of any other character is looked up once, and kept in a table by character
+    """
+
+    class WidthTable(dict):
+
+        def __missing__(self, character):
+            width = self[character] = 2 if unicodedata.east_asian_width(character) in 'FWA' else 1
+            return width
+
+    WIDTH_BY_CHARACTER = WidthTable()
+
+    # str.isascii() is available since Python 3.7
+    if hasattr(str, 'isascii'):
+        is_ascii = staticmethod(str.isascii)
+    else:
+        is_ascii = staticmethod(lambda text: not text or max(text) < '\x80')
+
+    @classmethod
+    def left_justified(cls, value, length, width=None):
+        """ The width can be given if it has been measured already. """
+
+        if width is None:
+            width = cls.string_length_considering_east_asian_characters_of(value)
+        return f"{value}{' ' * (length - width)}"
+
+    @classmethod
+    def right_justified(cls, value, length):
+        return f"{' ' * (length - cls.string_length_considering_east_asian_characters_of(value))}{value}"
+
+    @classmethod
+    def string_length_considering_east_asian_characters_of(cls, text):
+
+        if cls.is_ascii(text):
+            return len(text)
+        return sum(map(cls.WIDTH_BY_CHARACTER.__getitem__, text))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#  CSV Reading
+# ----------------------------------------------------------------------------------------------------------------------
+
+class CompressedFile:
+    """
+    Notes
+    -----
+    CSV files compressed with gzip, bzip2 or xz are detected by their magic numbers, not by their file extensions,
+    and are decompressed while being read, without being decompressed to a temporary file.
+        * Seeking back to the beginning, as sniffing does, decompresses again only as far as it was read
+        * Byte offsets in the file are those of the compressed data, so features reading in the middle of a file are not available
+    """
+
+    MAGIC_NUMBERS_BY_MODULE_NAME = {
+        'gzip': (b'\x1f\x8b',),
+        'bz2': tuple(b'BZh' + bytes([level]) + block_magic for level in b'123456789' for block_magic in (b'1AY&SY', b'\x17rE8P\x90')),
+        'lzma': (b'\xfd7zXZ\x00',),
+    }
+    SIZE_OF_MAGIC_NUMBER = 10
+
+    @classmethod
+    def compression_of(cls, file_path):
+        """ Returns the name of the module to decompress the file with, or None if it is not compressed or can not be read. """
+
+        # The head of a pipe is not peeked at, since it can not be read again
+        if not os.path.isfile(file_path):
+            return None
+
+        try:
+            with open(file_path, mode='rb') as file:
+                head = file.read(cls.SIZE_OF_MAGIC_NUMBER)
+        except OSError:
+            return None
+
+        return next((module_name for module_name, magic_numbers in cls.MAGIC_NUMBERS_BY_MODULE_NAME.items() if head.startswith(magic_numbers)), None)
+
+    @classmethod
+    def open_text(cls, file_path, encoding):
+
+        compression = cls.compression_of(file_path)
+        if compression is None:
+            return open(file_path, mode='r', encoding=encoding)
+
+        return importlib.import_module(compression).open(file_path, mode='rt', encoding=encoding)
+
+
+class RewindableStream(io.TextIOBase):
+    """
+    Notes
+    -----
+    Text stream of a pipe, which can be rewound to the beginning while recording what has been read.
+        * The record is kept in memory, and spilled to a temporary file beyond MEMORY_LIMIT characters,
+          so only the sniffing sample is kept unless the whole pipe has to be read twice (e.g. pre-scanning for a horizontal report)
+        * Rewinding replays the record, and then continues reading the pipe
+        * Once recording is stopped, the record is discarded as soon as it has been replayed, and the stream can no longer be rewound
+    """
+
+    MEMORY_LIMIT = 1024 * 1024
+
+    def __init__(self, stream, temp_dir):
+
+        self._stream = stream
+        self._temp_dir = temp_dir
+        self._record = io.StringIO()
+        self._recorded_size = 0
+        self._is_recording = True
+        self._is_replaying = False
+
+    @classmethod
+    def is_pipe(cls, file_path):
+
+        try:
+            mode = os.stat(file_path).st_mode
+        except OSError:
+            return False
+
+        return stat.S_ISFIFO(mode) or stat.S_ISCHR(mode)
+
+    @classmethod
+    def of(cls, stream, temp_dir):
+        """ Wraps the stream only if it is not seekable. """
+        return stream if stream.seekable() else cls(stream, temp_dir)
+
+    @classmethod
+    def stop_recording_of(cls, stream):
+
+        if isinstance(stream, cls):
+            stream.stop_recording()
+
+    def stop_recording(self):
+
+        self._is_recording = False
+        if not self._is_replaying:
+            self._discard_record()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._is_recording
+
+    def seek(self, offset, whence=io.SEEK_SET):
+
+        if not self._is_recording or offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('a pipe can be rewound only to the beginning while recording.')
+
+        self._record.seek(0)
+        self._is_replaying = True
+        return 0
+
+    def readline(self, size=-1):
+
+        if self._is_replaying:
+
+            line = self._record.readline()
+            if line.endswith('\n'):
+                return line
+
+            # The record may end in the middle of a line, e.g. after reading the sniffing sample
+            self._finish_replaying()
+            return line + self._recorded(self._stream.readline())
+
+        return self._recorded(self._stream.readline())
+
+    def read(self, size=-1):
+
+        size = -1 if size is None else size
+
+        if self._is_replaying:
+
+            text = self._record.read(size)
+            if 0 <= size == len(text):
+                return text
+
+            self._finish_replaying()
+            return text + self._recorded(self._stream.read(size - len(text) if size >= 0 else -1))
+
+        return self._recorded(self._stream.read(size))
+
+    def close(self):
+
+        self._discard_record()
+        self._stream.close()
+        super(RewindableStream, self).close()
+
+    def _recorded(self, text):
+
+        if not self._is_recording:
+            return text
+
+        self._record.write(text)
+        self._recorded_size += len(text)
+
+        if self._recorded_size > self.MEMORY_LIMIT and isinstance(self._record, io.StringIO):
+            self._spill()
+
+        return text
+
+    def _spill(self):
+
+        spool = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='', prefix='csvdiff3-pipe-', dir=self._temp_dir)
+        spool.write(self._record.getvalue())
+        self._record = spool
+        logger.debug(f'the record of a pipe was spilled to a temporary file. [recorded_size={self._recorded_size}]')
+
+    def _finish_replaying(self):
+
+        self._is_replaying = False
+        if self._is_recording:
+            self._record.seek(0, io.SEEK_END)
+        else:
+            self._discard_record()
+
+    def _discard_record(self):
+
+        if self._record is not None:
+            self._record.close()
+            self._record = None
+
+
+class ByteComparison:
+    """
+    Notes
+    -----
+    Files in the same ASCII compatible encoding are read in latin-1, which maps each byte to the character of the same code,
+    so that rows are parsed, matched and compared on their bytes without decoding multibyte characters.
+        * Equal bytes in the same encoding are equal text, so the same differences are detected
+        * Rows are decoded in the text encoding only to be reported, or measured for the horizontal layout
+        * Matching keys are compared in the order of bytes, so non-ASCII keys should be sorted in that order (e.g. by `LC_ALL=C sort`)
+        * The characters of the dialect should not be a trailing byte of a multibyte character (e.g. a backslash in Shift_JIS),
+          and stateful encodings such as ISO-2022-JP switch the meaning of ASCII bytes, so they are not applicable
+    """
+
+    ENCODING = 'latin-1'
+
+    SAFE_CHARACTERS = '\r\n\t ,;"\''
+    STATEFUL_ENCODING_PREFIXES = ('iso2022', 'utf_7', 'hz')
+
+    @classmethod
+    def is_applicable(cls, encoding, other_encoding):
+
+        try:
+            name = codecs.lookup(encoding).name
+            other_name = codecs.lookup(other_encoding).name
+            encodes_as_ascii = cls.SAFE_CHARACTERS.encode(encoding) == cls.SAFE_CHARACTERS.encode('ascii')
+        except (LookupError, UnicodeError):
+            return False
+
+        return name == other_name and encodes_as_ascii and not name.replace('-', '_').startswith(cls.STATEFUL_ENCODING_PREFIXES)
+
+    @classmethod
+    def verify_dialect(cls, dialect, file_name):
+
+        characters = [dialect.delimiter, dialect.quotechar or '']
+        if dialect.escapechar or any(character not in cls.SAFE_CHARACTERS for character in characters):
+            logger.error(f'--compare-bytes is not available for the dialect of {file_name}, since its characters may be a part of a multibyte character.'
+                         f' [delimiter={dialect.delimiter!r}, quotechar={dialect.quotechar!r}, escapechar={dialect.escapechar!r}]')
+            sys.exit(1)
+
+    @classmethod
+    def values_as_read(cls, values, text_encoding, option_name):
+        """ Values given in text (e.g. --key-from) are converted as the rows read on their bytes are. """
+
+        try:
+            return [value.encode(text_encoding).decode(cls.ENCODING) for value in values]
+        except (LookupError, UnicodeError) as e:
+            logger.error(f'{option_name} can not be encoded in the encoding of the CSV files. [{option_name}={values}, encoding={text_encoding}, description={e}]')
+            sys.exit(1)
+
+    @classmethod
+    def row_decoder_for(cls, context, file_arrangement):
+
+        if not context.compares_bytes:
+            return lambda row: row
+
+        text_encoding = getattr(context, 'text_encoding' + file_arrangement)
+
+        def decode_row(row):
+            return [value.encode(cls.ENCODING).decode(text_encoding) for value in row]
+
+        return decode_row
+
+
+class FileArrangement(type):
+
+    LHS = '_for_lhs'
+    RHS = '_for_rhs'
+
+
+class CsvDialectFixer:
+
+    DIALECT_ATTRIBUTES = ('delimiter', 'doublequote', 'escapechar', 'lineterminator', 'quotechar', 'quoting', 'skipinitialspace')
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def fixed_dialect(cls, context, csv_file, file_arrangement):
+
+        if context.forces_individual_specs:
+            dialect, adjusted_context = cls._dialect_from_context(context, file_arrangement)
+        else:
+            dialect, adjusted_context = cls._try_sniffing(context, csv_file, file_arrangement)
+
+        splits_rows_simply = cls._looks_simple(context, csv_file, dialect)
+        logger.debug(f'splits_rows_simply{file_arrangement}={splits_rows_simply}')
+
+        setattr(adjusted_context, "splits_rows_simply" + file_arrangement, splits_rows_simply)
+        return dialect, adjusted_context
+
+    @classmethod
+    def _looks_simple(cls, context, csv_file, dialect):
+        """
+        Rows are split simply if the sample has no quote character (so no line feed in a field), no escape character,
+        and no space to be skipped after the delimiter. csv.reader is faster for those.
+        """
+
+        try:
+            sample = csv_file.read(int(context.sniffing_size))
+        finally:
+            csv_file.seek(0)
+
+        special_strings = (dialect.quotechar, dialect.escapechar, dialect.delimiter + ' ' if dialect.skipinitialspace else None)
+        return not any(special_string and special_string in sample for special_string in special_strings)
+
+
+    @classmethod
+    def picklable_dialect(cls, dialect):
+        """ The sniffed dialect is a local class, so copy it to be handed over to a worker process. """
+
+        picklable = csv.excel()
+        for name in cls.DIALECT_ATTRIBUTES:
+            setattr(picklable, name, getattr(dialect, name))
+
+        return picklable
+
+    @classmethod
+    def are_equivalent(cls, dialect, other_dialect):
+        return all(getattr(dialect, name) == getattr(other_dialect, name) for name in cls.DIALECT_ATTRIBUTES)
+
+    @classmethod
+    def _dialect_from_context(cls, context, file_arrangement):
+
+        dialect = csv.excel()
+        dialect.delimiter = getattr(context, "column_separator" + file_arrangement)
+        dialect.lineterminator = getattr(context, "line_separator" + file_arrangement)
+        dialect.quotechar = getattr(context, "quote_char" + file_arrangement)
+        dialect.skipinitialspace = getattr(context, "skips_space_after_column_separator" + file_arrangement)
+
+        return dialect, context
+
+    @classmethod
+    def _try_sniffing(cls, context, csv_file, file_arrangement):
+
+        try:
+            return cls._sniff(context, csv_file, file_arrangement)
+
+        except csv.Error as e:
+
+            logger.warning(f'Sniffing failed. Generated a dialect from context instead. [type={type(e)}, args={str(e.args)}, message={traceback.format_exception_only(type(e), e)}]')
+            return cls._dialect_from_context(context, file_arrangement)
+
+        finally:
+            csv_file.seek(0)
+
+    @classmethod
+    def _sniff(cls, context, csv_file, file_arrangement):
+
+        sample = csv_file.read(context.sniffing_size)
+        sniffer = csv.Sniffer()
+        dialect = sniffer.sniff(sample)
+        has_header = sniffer.has_header(sample)
+
+        adjusted_context = cls._adjust_context_with(dialect, has_header, context, file_arrangement)
+
+        return dialect, adjusted_context
+
+    @classmethod
+    def _adjust_context_with(cls, dialect, has_header, context, file_arrangement):
+
+        setattr(context, "column_separator" + file_arrangement, dialect.delimiter)
+        setattr(context, "line_separator" + file_arrangement, dialect.lineterminator)
+        setattr(context, "quote_char" + file_arrangement, dialect.quotechar)
+        setattr(context, "skips_space_after_column_separator" + file_arrangement, dialect.skipinitialspace)
+        context.first_row_is_header = has_header if context.header is None else (True if context.header == 'y' else False)
+
+        return context
+
+
+def show_dialect_for_debugging(dialect, context, message, file_arrangement):
+
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    logger.debug(f'---{message}---')
+    logger.debug(f'sniffing dialect={dialect}')
+    logger.debug(f'sniffing dialect csv.excel={isinstance(dialect, csv.excel)}')
+    logger.debug(f'sniffing dialect csv.excel_tab={isinstance(dialect, csv.excel_tab)}')
+    logger.debug(f'sniffing dialect csv.unix_dialect={isinstance(dialect, csv.unix_dialect)}')
+    logger.debug(f'sniffing dialect.delimiter={context.display_string_for_column_separator(dialect.delimiter)}')
+    logger.debug(f'sniffing dialect.doublequote={dialect.doublequote}')
+    logger.debug(f'sniffing dialect.escapechar={dialect.escapechar}')
+    logger.debug(f'sniffing dialect.lineterminator={context.display_string_for_line_separator(dialect.lineterminator, file_arrangement)}')
+    logger.debug(f'sniffing dialect.quotechar={dialect.quotechar}')
+    logger.debug(f'sniffing dialect.quoting={dialect.quoting}')
+    logger.debug(f'sniffing dialect.skipinitialspace={dialect.skipinitialspace}')
+
 
-        elapsed_time_ = time.perf_counter() - start_
-        logger.debug(f'PreScanner#scan() elapsed_time:{elapsed_time_}[sec]')
-        return PreScanner.ScanResult.for_deeply(number_of_columns,
-                                                lhs_max_row_number, lhs_max_row_length, rhs_max_row_number, rhs_max_row_length)
+
+class RowBoundary:
+    """
+    Notes
+    -----
+    Byte-level access to the rows of a CSV file memory-mapped, to start reading at a row without reading from the beginning.
+        * A row ends with a line end (LF, CRLF or CR, as universal newlines) that is not in a quoted field. It is decided by the parity of quote characters
+        * From an arbitrary byte offset, the next row start is resynchronized speculatively.
+          The first quote character whose role is unambiguous (opening or closing) tells whether the offset is in a quoted field.
+          If there is no quote character nearby, the offset is regarded as not in a quoted field.
+        * Rows are found on the mapped bytes, and decoded only when their contents (e.g. the matching keys) are needed
+
+    Available only with ASCII compatible encodings (Shift_JIS and EUC-JP included) and dialects without escapechar.
+    Close it after use, or use it as a context manager.
+
+    The access to the mapped bytes is hinted to the kernel: 'random' for the probes of binary search and resynchronization,
+    not to read ahead around each probe, and 'sequential' for the scans from the front to the back, to read ahead.
+    """
+
+    ADVICE_NAME_BY_ACCESS = {
+        'random': 'MADV_RANDOM',
+        'sequential': 'MADV_SEQUENTIAL',
+    }
+
+    WINDOW_SIZE = 64 * 1024
+    MAX_WINDOW_SIZE = 16 * WINDOW_SIZE
+    LOOK_BEHIND_SIZE = 1024
+    LINEAR_SEARCH_SIZE = 4 * 1024
+    RECORDS_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, file_path, encoding, dialect, first_row_is_header, matching_key_codec, access='random'):
+
+        self.file_path = file_path
+        self.encoding = encoding
+        self.dialect = dialect
+        self.matching_key_codec = matching_key_codec
+        self.size = os.path.getsize(file_path)
+
+        delimiter = dialect.delimiter.encode(encoding)
+        self._quote = dialect.quotechar.encode(encoding) if dialect.quotechar and dialect.quoting != csv.QUOTE_NONE else b''
+        self._bytes_before_opening_quote = b'\n\r' + delimiter + (b' ' if dialect.skipinitialspace else b'')
+        self._bytes_after_closing_quote = b'\n\r' + delimiter
+
+        self._mapped = self._map(file_path, self.size)
+        self.advise(access)
+
+        self.data_start = next(self.record_spans_from(0), (0, 0))[1] if first_row_is_header else 0
+
+    @staticmethod
+    def _map(file_path, size):
+        """ An empty file can not be mapped, and has no bytes anyway. """
+
+        if size == 0:
+            return b''
+
+        with open(file_path, mode='rb') as csv_file:
+            return mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def advise(self, access, start=0, end=None):
+        """ Hint the access to the bytes between start and end. Nothing is done where madvise is not available (e.g. Windows, Python 3.7 or earlier). """
+
+        advice = getattr(mmap, self.ADVICE_NAME_BY_ACCESS[access], None)
+        if advice is None or not hasattr(self._mapped, 'madvise'):
+            return
+
+        start -= start % mmap.PAGESIZE
+        end = self.size if end is None else min(end, self.size)
+        if start < end:
+            self._mapped.madvise(advice, start, end - start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    def close(self):
+
+        if isinstance(self._mapped, mmap.mmap):
+            self._mapped.close()
 
     @classmethod
-    def _scan_lightly(cls, csv_reader):
-        """
-        Notes
-        -----
-        Purpose of light pre-scanning
-            * Determine the number of columns for value difference detection
+    def is_applicable(cls, encoding, dialect):
 
-        Vertical reports do not require size information for formatting.
+        characters = '\r\n\t ,;"\'' + dialect.delimiter + (dialect.quotechar or '')
+        try:
+            return not dialect.escapechar and characters.encode(encoding) == characters.encode('ascii')
+        except (LookupError, UnicodeError):
+            return False
+
+    def record_spans_from(self, offset, end=None):
+        """ Generate (start offset, end offset) of the rows from offset, which must be a row start. Nothing is decoded. """
+
+        for start, record_end, _ in self.raw_records_from(offset, end):
+            yield start, record_end
+
+    def raw_records_from(self, offset, end=None):
+        """
+        Generate (start offset, end offset, bytes) of the rows from offset, which must be a row start. Nothing is decoded.
+        The bytes are split into lines in blocks by bytes.splitlines(), which splits at LF, CRLF and CR as universal newlines do.
+        A row continues to the next line while it is in a quoted field.
         """
 
-        lhs_fact = csv_reader.read_lhs()
-        rhs_fact = csv_reader.read_rhs()
+        mapped, quote, size = self._mapped, self._quote, self.size
+        end = size if end is None else min(end, size)
 
-        return PreScanner.ScanResult.for_lightly(cls._determine_number_of_columns_from(lhs_fact, rhs_fact))
+        block_size = self.RECORDS_BLOCK_SIZE
+        position = offset
+        while position < end:
 
-    @classmethod
-    def _determine_number_of_columns_from(cls, lhs_fact, rhs_fact):
+            block_end = min(size, position + block_size)
+            lines = mapped[position:block_end].splitlines(keepends=True)
+            if block_end < size:
+                # The last line may continue beyond the block, and a CR at its end may be followed by LF. It is read again in the next block.
+                lines.pop()
 
-        number_of_columns = 0
-        if lhs_fact.lhs_row:
-            number_of_columns = len(lhs_fact.lhs_row)
-        elif rhs_fact.rhs_row:
-            number_of_columns = len(rhs_fact.rhs_row)
+            block_start = position
+            record = b''
+            in_quotes = False
+            for line in lines:
 
-        return number_of_columns
+                record += line
+                if quote:
+                    in_quotes ^= line.count(quote) % 2 == 1
+                    if in_quotes:
+                        continue
 
+                yield position, position + len(record), record
+                position += len(record)
+                if position >= end:
+                    return
+                record = b''
 
+            # A row longer than the block is read again in a larger block
+            block_size = self.RECORDS_BLOCK_SIZE if position > block_start else block_size * 2
 
-class Mark(type):
+    @staticmethod
+    def _line_ends_in(buffer, position, stop):
+        """
+        Generate the offsets just after the line ends from position, as universal newlines: LF, CRLF, or CR alone.
+        The next LF and the next CR are searched for only once each, so that a file without CR is not searched over for it again and again.
+        """
 
-    LHS_ONLY = '<'
-    RHS_ONLY = '>'
-    HAS_DIFF = '!'
-    NON_DIFF = ' '
-    NON_DIFF_EXPRESSLY = '='
+        next_line_feed = buffer.find(b'\n', position, stop)
+        next_carriage_return = buffer.find(b'\r', position, stop)
 
+        while next_line_feed >= 0 or next_carriage_return >= 0:
 
-class HeadingReporter:
+            if next_carriage_return < 0 or 0 <= next_line_feed < next_carriage_return or next_line_feed == next_carriage_return + 1:
+                line_end = next_line_feed + 1
+            else:
+                line_end = next_carriage_return + 1
+            yield line_end
 
-    def __init__(self, context):
-        self.cxt = context
+            if 0 <= next_line_feed < line_end:
+                next_line_feed = buffer.find(b'\n', line_end, stop)
+            if 0 <= next_carriage_return < line_end:
+                next_carriage_return = buffer.find(b'\r', line_end, stop)
 
+    def records_from(self, offset, end=None):
+        """ Generate (start offset, end offset, row) of the rows from offset, which must be a row start. """
 
-    def report_heading(self):
+        for start, record_end, record in self.raw_records_from(offset, end):
+            yield start, record_end, self.row_of(record)
 
-        self._report_title()
+    def number_of_records_between(self, start, end):
 
-        if self.cxt.shows_context_from_arguments:
-            self._report_context()
+        self.advise('sequential', start, end)
+        return sum(1 for _ in self.record_spans_from(start, end))
 
-    @classmethod
-    @spacing_before(1)
-    def _report_title(cls):
-        print('============ Report ============')
+    def row_of(self, record):
+        """ Decode and parse as the text mode with universal newlines does. """
 
-    @spacing_before(1)
-    def _report_context(self):
+        text = record.decode(self.encoding).replace('\r\n', '\n').replace('\r', '\n')
+        return next(csv.reader([text], self.dialect), [])
 
-        print('● Context')
-        print(f'File Path on the Left-Hand Side: {self.cxt.lhs_file_path}')
-        print(f'File Path on the Right-Hand Side : {self.cxt.rhs_file_path}')
-        print(f'Matching Key Indices: {self.cxt.matching_key_codec.matching_key_info_list}')
-        print(f'Matching Key Is Unique?: {self.cxt.key_should_be_unique}')
-        print(f'Column Indices to Ignore: {self.cxt.column_indices_to_ignore}')
-        print(f'with Header?: {self.cxt.first_row_is_header}')
-        print(f'Report Style: {"Vertical" if self.cxt.reports_in_vertical_style else "Two facing (Horizontal)"}')
-        print(f'Show Count?: {self.cxt.shows_count}')
-        print(f'Show Difference Only?: {self.cxt.shows_difference_only}')
-        print(f'Show All?: {self.cxt.shows_all_lines}')
-        print(f'Show Context?: {self.cxt.shows_context_from_arguments}')
-        print(f'File Encoding for Left-Hand Side: {self.cxt.encoding_for_lhs}')
-        print(f'File Encoding for Right-Hand Side: {self.cxt.encoding_for_rhs}')
-        print(f'CSV Sniffing Size: {self.cxt.sniffing_size}')
-        print('--- csv analysis conditions ---')
-        print(f'Forces Individual Specified Conditions?: {self.cxt.forces_individual_specs}')
-        print(f'column_separator_for_lhs: {self.cxt.display_string_for_column_separator(self.cxt.column_separator_for_lhs)}')
-        print(f'column_separator_for_rhs: {self.cxt.display_string_for_column_separator(self.cxt.column_separator_for_rhs)}')
-        print(f'line_separator_for_lhs: {self.cxt.display_string_for_line_separator(self.cxt.line_separator_for_lhs, FileArrangement.LHS)}')
-        print(f'line_separator_for_rhs: {self.cxt.display_string_for_line_separator(self.cxt.line_separator_for_rhs, FileArrangement.RHS)}')
-        print(f'quote_char_for_lhs: {self.cxt.quote_char_for_lhs}')
-        print(f'quote_char_for_rhs: {self.cxt.quote_char_for_rhs}')
-        print(f'skips_space_after_column_separator_for_lhs: {self.cxt.skips_space_after_column_separator_for_lhs}')
-        print(f'skips_space_after_column_separator_for_rhs: {self.cxt.skips_space_after_column_separator_for_rhs}')
+    def key_at(self, offset):
+        return self.matching_key_codec.managed_key_for(next(self.records_from(offset))[2])
 
+    def next_record_start(self, offset):
+        """ Start offset of the first row at or after offset. It is the file size if there is no more row. """
 
-class DetailReporter:
+        if offset <= self.data_start:
+            return self.data_start
 
-    __metaclass__ = abc.ABCMeta
+        # Look behind a little for a quote character to tell, and for the line end just before offset
+        base = max(self.data_start, offset - 1 - self.LOOK_BEHIND_SIZE)
+        minimum_line_feed_position = offset - 1 - base
 
-    def __init__(self, context):
-        self.cxt = context
+        window_size = self.WINDOW_SIZE
+        while True:
+            window = self._mapped[base:base + window_size]
+            is_last = base + window_size >= self.size
 
+            record_start = self._record_start_in(window, minimum_line_feed_position,
+                                                 starts_at_row=base == self.data_start,
+                                                 decisive=is_last or len(window) >= self.MAX_WINDOW_SIZE)
+            if record_start is not None:
+                record_start = base + record_start
+                # CR at the end of the window may be followed by LF beyond it
+                if self._mapped[record_start - 1:record_start] == b'\r' and self._mapped[record_start:record_start + 1] == b'\n':
+                    record_start += 1
+                return min(record_start, self.size)
+            if is_last:
+                return self.size
 
-    def report_detail_heading(self):
+            window_size += self.WINDOW_SIZE
 
-        if not self.cxt.shows_details:
-            return
+    def _record_start_in(self, window, minimum_line_feed_position, starts_at_row, decisive):
 
-        self._report_content_heading()
-        self._report_file_name()
+        if not self._quote or self._quote not in window:
+            return next(self._line_ends_in(window, minimum_line_feed_position, len(window)), None)
 
-    @spacing_before(1)
-    def _report_content_heading(self):
-        if self.cxt.shows_difference_only:
-            print('● Differences')
-        elif self.cxt.shows_all_lines:
-            print('● All')
-        else:
-            pass
+        in_quotes = False if starts_at_row else self._in_quotes_at_beginning_of(window)
+        if in_quotes is None:
+            if not decisive:
+                return None
+            in_quotes = False
 
-    @abc.abstractmethod
-    def _report_file_name(self):
-        raise NotImplementedError()
+        position = 0
+        for line_end in self._line_ends_in(window, 0, len(window)):
 
+            in_quotes ^= window.count(self._quote, position, line_end) % 2 == 1
+            if not in_quotes and line_end - 1 >= minimum_line_feed_position:
+                return line_end
 
-    @abc.abstractmethod
-    def report_case_of_existed_only_on_lhs(self, lhs_fact):
-        raise NotImplementedError()
+            position = line_end
 
-    @abc.abstractmethod
-    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
-        raise NotImplementedError()
+        return None
 
-    @abc.abstractmethod
-    def report_case_of_existed_only_on_rhs(self, rhs_fact):
-        raise NotImplementedError()
+    def _in_quotes_at_beginning_of(self, window):
 
+        quote_position = window.find(self._quote, 1)
+        while 0 < quote_position < len(window) - 1:
 
-    class Factory:
+            before = window[quote_position - 1:quote_position]
+            after = window[quote_position + 1:quote_position + 2]
+            odd_quotes_before = window.count(self._quote, 0, quote_position) % 2 == 1
 
-        def __init__(self):
-            pass
+            if before in self._bytes_before_opening_quote and after not in self._bytes_after_closing_quote + self._quote:
+                return odd_quotes_before
 
-        @staticmethod
-        def reporter_for(context, scan_result):
+            if before not in self._bytes_before_opening_quote + self._quote and after in self._bytes_after_closing_quote:
+                return not odd_quotes_before
 
-            if context.reports_in_vertical_style:
-                return VerticalReporter(context, scan_result)
+            quote_position = window.find(self._quote, quote_position + 1)
+
+        return None
+
+    def lower_bound(self, key, low=None):
+        """ Start offset of the first row whose matching key is not less than key. It is the file size if there is no such row. """
+        return self._first_record_start_not_before(lambda row_key: row_key < key, low)
+
+    def upper_bound(self, key, low=None):
+        """ Start offset of the first row whose matching key is greater than key. It is the file size if there is no such row. """
+        return self._first_record_start_not_before(lambda row_key: row_key <= key, low)
+
+    def _first_record_start_not_before(self, is_before, low=None):
+        """ Search from low, which is a row start, if specified. """
+
+        low, high = max(self.data_start, low or 0), self.size
+        while high - low > self.LINEAR_SEARCH_SIZE:
+
+            record_start = self.next_record_start((low + high) // 2)
+            if record_start >= high:
+                break
+
+            if is_before(self.key_at(record_start)):
+                low = record_start
             else:
-                return HorizontalReporter(context, scan_result)
+                high = record_start
 
+        for start, _, row in self.records_from(low, high):
+            if not is_before(self.matching_key_codec.managed_key_for(row)):
+                return start
 
-class HorizontalReporter(DetailReporter):
+        return high
 
-    class Template:
+    def sampled_keys(self, number_of_samples):
 
-        DIFFERENT_COLUMN_GUIDE = 'Column indices with difference'
-        PREFIX_of_DIFF_COLUMNS = '  @ '
+        sampled_keys = []
+        for i in range(number_of_samples):
+            record_start = self.next_record_start(self.data_start + (self.size - self.data_start) * i // number_of_samples)
+            if record_start < self.size:
+                sampled_keys.append(self.key_at(record_start))
 
-        def __init__(self, lhs_max_row_number_length, lhs_max_row_length, rhs_max_row_number_length, rhs_max_row_length):
+        return sampled_keys
 
-            self.lhs_max_row_number_length = lhs_max_row_number_length
-            self.lhs_filler_length = 1
-            self.lhs_max_row_length = lhs_max_row_length
-            self.diff_mark_filler_length_in_front = 2
-            self.diff_mark_length = 1
-            self.diff_mark_filler_length_in_rear = 2
-            self.rhs_max_row_number_length = rhs_max_row_number_length
-            self.rhs_filler_length = 1
-            self.rhs_max_row_length = rhs_max_row_length
-            self.prefix_length_for_diff_columns_displays = len(self.PREFIX_of_DIFF_COLUMNS)
 
-            self.lhs_length = self.lhs_max_row_number_length + self.lhs_filler_length + self.lhs_max_row_length
-            self.diff_mark_length = self.diff_mark_filler_length_in_front + self.diff_mark_length + self.diff_mark_filler_length_in_rear
-            self.rhs_length = self.rhs_max_row_number_length + self.rhs_filler_length + self.rhs_max_row_length
+class ByteRange(io.RawIOBase):
+    """ Read-only raw stream of [start, end) of a file. """
 
+    BUFFER_SIZE = 1024 * 1024
 
-        # --- heading-related description ---
+    def __init__(self, file_path, start, end):
 
-        def division_string(self):
-            return '-' * (self.lhs_length + self.diff_mark_length + self.rhs_length + self.prefix_length_for_diff_columns_displays + len(self.DIFFERENT_COLUMN_GUIDE))
+        super(ByteRange, self).__init__()
+        self._file = open(file_path, mode='rb', buffering=0)
+        self._start = start
+        self._end = end
+        self._position = start
+        self._file.seek(start)
 
-        def file_name_description(self, lhs_file_name, rhs_file_name):
+    @classmethod
+    def text_stream(cls, file_path, start, end, encoding):
+        """ Text stream with universal newlines, as open() with mode='r' does. """
+        return io.TextIOWrapper(io.BufferedReader(cls(file_path, start, end), buffer_size=cls.BUFFER_SIZE), encoding=encoding)
 
-            lhs_file_name = UnicodeSupport.left_justified(lhs_file_name, self.lhs_length)
-            diff_mark_spacing = ' ' * self.diff_mark_length
-            rhs_file_name = UnicodeSupport.left_justified(rhs_file_name, self.rhs_length)
-            prefix_length_spacing = ' ' * self.prefix_length_for_diff_columns_displays
-            return f'{lhs_file_name}{diff_mark_spacing}{rhs_file_name}{prefix_length_spacing}{self.DIFFERENT_COLUMN_GUIDE}'
+    def readable(self):
+        return True
 
+    def seekable(self):
+        return True
 
-        # --- left-hand side related description ---
+    def readinto(self, buffer):
 
-        def lhs_only_description(self, lhs_fact):
+        size = min(len(buffer), self._end - self._position)
+        if size <= 0:
+            return 0
 
-            lhs = self._lhs_description(lhs_fact)
-            diff_mark_area = (' ' * self.diff_mark_filler_length_in_front) + Mark.LHS_ONLY + (' ' * self.diff_mark_filler_length_in_rear)
-            return f'{lhs}{diff_mark_area}'
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._position += read
+        return read
 
-        def _lhs_description(self, lhs_fact):
+    def seek(self, offset, whence=io.SEEK_SET):
 
-            lhs_row_number = UnicodeSupport.right_justified(str(lhs_fact.lhs_row_number), self.lhs_max_row_number_length)
-            spacing = ' ' * self.lhs_filler_length
-            lhs_row = UnicodeSupport.left_justified(str(lhs_fact.lhs_row), self.lhs_max_row_length)
-            return f'{lhs_row_number}{spacing}{lhs_row}'
+        position = {io.SEEK_SET: self._start, io.SEEK_CUR: self._position, io.SEEK_END: self._end}[whence] + offset
+        self._position = min(max(position, self._start), self._end)
+        self._file.seek(self._position)
+        return self._position - self._start
 
-        def _lhs_empty_description(self):
-            return ' ' * (self.lhs_max_row_number_length + self.lhs_filler_length + self.lhs_max_row_length)
+    def tell(self):
+        return self._position - self._start
 
+    def close(self):
+        self._file.close()
+        super(ByteRange, self).close()
 
-        # --- right-hand side related description ---
 
-        def rhs_only_description(self, rhs_fact):
+class ExternalSorter:
+    """
+    Notes
+    -----
+    Out-of-core merge sort of rows in the ordering of MatchingKeyCodec.
+        * Rows are accumulated up to the memory budget, then sorted and spilled to a temporary directory as a sorted run
+        * The sorted runs are merged in k-way when read
+        * If there are more runs than MERGE_FAN_IN, they are merged into longer runs in passes beforehand,
+          so that no more than MERGE_FAN_IN runs are open at once
+        * If all rows fit in the memory budget, nothing is spilled
 
-            empty_lhs = self._lhs_empty_description()
-            diff_mark_area = (' ' * self.diff_mark_filler_length_in_front) + Mark.RHS_ONLY + (' ' * self.diff_mark_filler_length_in_rear)
-            rhs = self._rhs_description(rhs_fact)
-            return f'{empty_lhs}{diff_mark_area}{rhs}'
+    Rows with the same matching key keep their original order, because the row number is the second sort key.
+    """
 
-        def _rhs_description(self, rhs_fact):
+    BATCH_SIZE = 1024
+    OVERHEAD_PER_COLUMN = 64
+    MERGE_FAN_IN = 64
 
-            rhs_row_number = UnicodeSupport.right_justified(str(rhs_fact.rhs_row_number), self.rhs_max_row_number_length)
-            spacing = ' ' * self.rhs_filler_length
-            rhs_row = UnicodeSupport.left_justified(str(rhs_fact.rhs_row), self.rhs_max_row_length)
-            return f'{rhs_row_number}{spacing}{rhs_row}'
+    def __init__(self, matching_key_codec, memory_budget, temp_dir):
 
+        self.matching_key_codec = matching_key_codec
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
 
-        # --- both sides related description ---
+        self.has_sorted = False
+        self._in_memory_run = []
+        self._run_paths = []
+        self._number_of_written_runs = 0
+        self._work_dir = None
 
-        def both_description(self, lhs_fact, rhs_fact, value_difference_result):
+    @classmethod
+    def for_context(cls, context):
+        return cls(context.matching_key_codec, context.sort_memory_budget, context.temp_dir)
 
-            lhs = self._lhs_description(lhs_fact)
-            diff_mark = Mark.HAS_DIFF if value_difference_result.has_difference else Mark.NON_DIFF
-            diff_mark_area = (' ' * self.diff_mark_filler_length_in_front) + diff_mark + (' ' * self.diff_mark_filler_length_in_rear)
-            rhs = self._rhs_description(rhs_fact)
-            prefix_of_diff_columns = self.PREFIX_of_DIFF_COLUMNS if value_difference_result.has_difference else ''
-            different_columns = str(value_difference_result.different_column_indices) if value_difference_result.has_difference else ''
-            return f'{lhs}{diff_mark_area}{rhs}{prefix_of_diff_columns}{different_columns}'
+    def sort(self, numbered_rows):
 
+        run, run_size = [], 0
 
-    def __init__(self, context, scan_result):
+        for row_number, row in numbered_rows:
 
-        super(HorizontalReporter, self).__init__(context)
-        self.cxt = context
+            run.append((self.matching_key_codec.managed_key_for(row, row_number), row_number, row))
+            run_size += sum(map(len, row)) + self.OVERHEAD_PER_COLUMN * len(row)
 
-        if context.needs_size_info_for_padding:
-            size_info = scan_result.size_info_for_padding
-            self.template = HorizontalReporter.Template(len(str(size_info.lhs_max_row_number)),
-                                                        size_info.lhs_max_row_length,
-                                                        len(str(size_info.rhs_max_row_number)),
-                                                        size_info.rhs_max_row_length)
-        else:
-            self.template = None
+            if run_size >= self.memory_budget:
+                self._spill(run)
+                run, run_size = [], 0
 
+        if not self._run_paths:
+            run.sort()
+            self._in_memory_run = run
+        elif run:
+            self._spill(run)
 
-    # --- report heading related ---
+        logger.debug(f'ExternalSorter#sort() number_of_spilled_runs={len(self._run_paths)}')
+        self._merge_runs_within_fan_in()
+        self.has_sorted = True
 
-    def _report_file_name(self):
+    def sorted_records(self):
+        """ Records are tuples of (managed key, row number, row). """
 
-        print(self.template.division_string())
-        print(self.template.file_name_description(os.path.basename(self.cxt.lhs_file_name), os.path.basename(self.cxt.rhs_file_name)))
-        print(self.template.division_string())
+        if not self._run_paths:
+            return iter(self._in_memory_run)
 
+        return heapq.merge(*[self._read_run(run_path) for run_path in self._run_paths])
 
-    # --- report each cases ---
+    def close(self):
 
-    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
 
-        if self.cxt.shows_details:
-            print(self.template.lhs_only_description(lhs_fact))
+    def _spill(self, run):
+        run.sort()
+        self._write_run(iter(run))
 
-    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+    def _merge_runs_within_fan_in(self):
+        """ The oldest runs are merged first, so that each pass merges runs of similar lengths. """
 
-        if (self.cxt.shows_difference_only and value_difference_result.has_difference) or self.cxt.shows_all_lines:
-            print(self.template.both_description(lhs_fact, rhs_fact, value_difference_result))
+        while len(self._run_paths) > self.MERGE_FAN_IN:
 
-    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+            run_paths, self._run_paths = self._run_paths[:self.MERGE_FAN_IN], self._run_paths[self.MERGE_FAN_IN:]
+            self._write_run(heapq.merge(*[self._read_run(run_path) for run_path in run_paths]))
 
-        if self.cxt.shows_details:
-            print(self.template.rhs_only_description(rhs_fact))
+            for run_path in run_paths:
+                os.remove(run_path)
 
+        logger.debug(f'ExternalSorter#_merge_runs_within_fan_in() number_of_runs={len(self._run_paths)}, number_of_written_runs={self._number_of_written_runs}')
 
-class VerticalReporter(DetailReporter):
+    def _write_run(self, records):
 
-    class Template:
+        if self._work_dir is None:
+            self._work_dir = tempfile.mkdtemp(prefix='csvdiff3-sort-', dir=self.temp_dir)
 
-        LHS_MARK = 'L'
-        RHS_MARK = 'R'
-        PREFIX_of_DIFF_COLUMNS = '@'
+        run_path = os.path.join(self._work_dir, f'run-{self._number_of_written_runs}')
+        self._number_of_written_runs += 1
 
-        def __init__(self):
-            pass
+        with open(run_path, mode='wb') as run_file:
+            for batch in iter(lambda: list(itertools.islice(records, self.BATCH_SIZE)), []):
+                pickle.dump(batch, run_file, pickle.HIGHEST_PROTOCOL)
 
+        self._run_paths.append(run_path)
 
-        # --- heading-related description ---
+    @classmethod
+    def _read_run(cls, run_path):
 
-        @classmethod
-        def division_string(cls):
-            return '-' * 80
+        with open(run_path, mode='rb') as run_file:
+            while True:
+                try:
+                    batch = pickle.load(run_file)
+                except EOFError:
+                    return
+                yield from batch
 
-        @classmethod
-        def file_name_description(cls, mark, file_name):
-            return f'{mark} {file_name}'
 
+class LhsFact:
+    """ The row may be deferred (None) by the CSV state, which then parses it from the raw record on the first access. """
 
-        # --- left-hand side related description ---
+    __slots__ = ('lhs_row_number', '_lhs_row', 'lhs_key', 'lhs_raw_record', '_lhs_csv_state')
 
-        @classmethod
-        def lhs_only_description(cls, lhs_fact):
-            return f'{Mark.LHS_ONLY} {cls.LHS_MARK} {str(lhs_fact.lhs_row_number)} {str(lhs_fact.lhs_row)}'
+    def __init__(self, lhs_row_number, lhs_row, lhs_key, lhs_raw_record=None, lhs_csv_state=None):
 
+        self.lhs_row_number = lhs_row_number
+        self._lhs_row = lhs_row
+        self.lhs_key = lhs_key
+        self.lhs_raw_record = lhs_raw_record
+        self._lhs_csv_state = lhs_csv_state
 
-        # --- right-hand side related description ---
+    # Read into again for the next row by CsvReader.refill_lhs(), instead of allocating another fact
+    refill = __init__
 
-        @classmethod
-        def rhs_only_description(cls, rhs_fact):
-            return f'{Mark.RHS_ONLY} {cls.RHS_MARK} {str(rhs_fact.rhs_row_number)} {str(rhs_fact.rhs_row)}'
+    @property
+    def lhs_row(self):
 
+        lhs_row = self._lhs_row
+        if lhs_row is None:
+            lhs_row = self._lhs_row = self._lhs_csv_state.row_of_raw_record(self.lhs_raw_record)
+        return lhs_row
 
-        # --- both sides related description ---
+    @property
+    def number_of_lhs_columns(self):
+        """ Counted on the raw record without parsing it, if the row is deferred. """
 
-        @classmethod
-        def both_description_heading(cls, value_difference_result):
+        if self._lhs_row is None:
+            return self._lhs_csv_state.number_of_columns_of_raw_record(self.lhs_raw_record)
+        return len(self._lhs_row)
 
-            if value_difference_result.has_difference:
-                return f'{Mark.HAS_DIFF} {cls.PREFIX_of_DIFF_COLUMNS} {str(value_difference_result.different_column_indices)}'
-            else:
-                return Mark.NON_DIFF_EXPRESSLY
 
-        @classmethod
-        def both_description_lhs(cls, lhs_fact, row_number_length):
-            return f'  {cls.LHS_MARK} {str(lhs_fact.lhs_row_number).rjust(row_number_length)} {str(lhs_fact.lhs_row)}'
+class RhsFact:
+    """ The row may be deferred (None) by the CSV state, which then parses it from the raw record on the first access. """
 
-        @classmethod
-        def both_description_rhs(cls, rhs_fact, row_number_length):
-            return f'  {cls.RHS_MARK} {str(rhs_fact.rhs_row_number).rjust(row_number_length)} {str(rhs_fact.rhs_row)}'
+    __slots__ = ('rhs_row_number', '_rhs_row', 'rhs_key', 'rhs_raw_record', '_rhs_csv_state')
+
+    def __init__(self, rhs_row_number, rhs_row, rhs_key, rhs_raw_record=None, rhs_csv_state=None):
+
+        self.rhs_row_number = rhs_row_number
+        self._rhs_row = rhs_row
+        self.rhs_key = rhs_key
+        self.rhs_raw_record = rhs_raw_record
+        self._rhs_csv_state = rhs_csv_state
+
+    # Read into again for the next row by CsvReader.refill_rhs(), instead of allocating another fact
+    refill = __init__
+
+    @property
+    def rhs_row(self):
+
+        rhs_row = self._rhs_row
+        if rhs_row is None:
+            rhs_row = self._rhs_row = self._rhs_csv_state.row_of_raw_record(self.rhs_raw_record)
+        return rhs_row
+
+    @property
+    def number_of_rhs_columns(self):
+        """ Counted on the raw record without parsing it, if the row is deferred. """
+
+        if self._rhs_row is None:
+            return self._rhs_csv_state.number_of_columns_of_raw_record(self.rhs_raw_record)
+        return len(self._rhs_row)
+
+
+class CsvReader:
+
+    class State:
+
+        # Measured on the same rows keyed on the first column: 5-10% slower with 2 and 4 columns, even with 6 and 10,
+        # 10-15% faster with 20 and more than twice as fast with 200
+        MIN_COLUMNS_AFTER_KEYS_TO_DEFER = 15
+
+        def __init__(self, csv_file, dialect, file_name, first_row_is_header, keeps_raw_records=False, splits_rows_simply=False, matching_key_codec=None):
+
+            self._csv_file = csv_file
+            self._dialect = dialect
+            self._file_name = file_name
+            self._first_row_is_header = first_row_is_header
+
+            self._splits_rows_simply = splits_rows_simply
+            self._keeps_raw_records = keeps_raw_records
+            self._raw_lines_of_current_row = []
 
+            # The raw records are compared before the columns are, so the rows split simply are split only when needed
+            self._defers_rows = keeps_raw_records and splits_rows_simply and matching_key_codec is not None
+            self._matching_key_codec = matching_key_codec
+            self._key_of_current_row = None
 
+            self._start_offset = 0
+            self._row_number_before_start = 0
 
-    def __init__(self, context, _):
+            self._csv_reader = self._new_csv_reader()
+            self._row_number = 0
+            self._previous_key = ""
 
-        super(VerticalReporter, self).__init__(context)
-        self.cxt = context
-        self.template = VerticalReporter.Template()
+        def _new_csv_reader(self):
 
+            lines = self._raw_lines() if self._keeps_raw_records else iter(self._csv_file)
 
-    # --- report heading related ---
+            if self._defers_rows:
+                return self._deferred_rows(lines)
+            if self._splits_rows_simply:
+                return self._simply_split_rows(lines)
 
-    def _report_file_name(self):
+            return csv.reader(lines, self._dialect)
 
-        print(self.template.division_string())
-        print(self.template.file_name_description(self.template.LHS_MARK, os.path.basename(self.cxt.lhs_file_name)))
-        print(self.template.file_name_description(self.template.RHS_MARK, os.path.basename(self.cxt.rhs_file_name)))
-        print(self.template.division_string())
+        def _simply_split_rows(self, lines):
+            """
+            Split by str.split the lines without any character csv.reader treats specially,
+            that is the quote character, the escape character, CR and the space to be skipped after the delimiter.
+            The rest are parsed by csv.reader, with the following lines for quoted fields spanning multiple lines.
+            """
 
+            dialect = self._dialect
+            delimiter = dialect.delimiter
 
-    # --- report each cases ---
+            # CR stands in for the characters not to be looked for, since CR is looked for anyway
+            quote_character = dialect.quotechar or '\r'
+            escape_character = dialect.escapechar or '\r'
+            initial_space = delimiter + ' ' if dialect.skipinitialspace else '\r'
+            leading_space = ' ' if dialect.skipinitialspace else '\r'
 
-    def report_case_of_existed_only_on_lhs(self, lhs_fact):
+            for line in lines:
 
-        if self.cxt.shows_details:
-            print(self.template.lhs_only_description(lhs_fact))
+                if quote_character in line or escape_character in line or '\r' in line or initial_space in line or line.startswith(leading_space):
+                    yield next(csv.reader(itertools.chain([line], lines), dialect))
+                    continue
 
-    def report_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+                if line[-1:] == '\n':
+                    line = line[:-1]
 
-        if (self.cxt.shows_difference_only and value_difference_result.has_difference) or self.cxt.shows_all_lines:
+                yield line.split(delimiter) if line else []
 
-            row_number_length = max(len(str(lhs_fact.lhs_row_number)), len(str(rhs_fact.rhs_row_number)))
+        def _deferred_rows(self, lines):
+            """
+            Generate the rows as _simply_split_rows() does, or None for the deferred rows.
+            For a line to be split simply, only the columns up to the last matching key are split off to build the matching key.
+            The row itself is deferred, and split only when it is compared column by column or reported, as the rows of MappedState are.
 
-            print(self.template.both_description_heading(value_difference_result))
-            print(self.template.both_description_lhs(lhs_fact, row_number_length))
-            print(self.template.both_description_rhs(rhs_fact, row_number_length))
+            Deferring costs more than it saves for narrow rows, so the rows are deferred only if the first row
+            (the header or the first line) has MIN_COLUMNS_AFTER_KEYS_TO_DEFER columns or more after the last matching key.
+            Otherwise the rows are generated by _simply_split_rows(), and their keys are built by the key_for() bound as usual.
+            """
 
-    def report_case_of_existed_only_on_rhs(self, rhs_fact):
+            if self.is_at_header:
+                for header in itertools.islice(self._simply_split_rows(lines), 1):
+                    number_of_columns = len(header)
+                    yield header
+            else:
+                first_line = next(lines, '')
+                number_of_columns = first_line.count(self._dialect.delimiter) + 1
+                lines = itertools.chain([first_line] if first_line else [], lines)
 
-        if self.cxt.shows_details:
-            print(self.template.rhs_only_description(rhs_fact))
+            managed_key_for = self._matching_key_codec.managed_key_for
+            number_of_key_values = max(self._matching_key_codec.matching_key_indices) + 1
 
+            if number_of_columns - number_of_key_values < self.MIN_COLUMNS_AFTER_KEYS_TO_DEFER:
+                self.key_for = managed_key_for
+                yield from self._simply_split_rows(lines)
+                return
 
-class CountReporter:
+            self.key_for = lambda row, row_number=None: self._key_of_current_row
 
-    class Counter:
+            dialect = self._dialect
+            delimiter = dialect.delimiter
 
-        def __init__(self):
+            # Same as _simply_split_rows()
+            quote_character = dialect.quotechar or '\r'
+            escape_character = dialect.escapechar or '\r'
+            initial_space = delimiter + ' ' if dialect.skipinitialspace else '\r'
+            leading_space = ' ' if dialect.skipinitialspace else '\r'
 
-            self.number_of_same_lines = 0
-            self.number_of_lhs_only = 0
-            self.number_of_rhs_only = 0
-            self.number_of_differences = 0
+            for line in lines:
 
-            self.row_numbers_for_lhs_only = []
-            self.row_numbers_for_rhs_only = []
-            self.row_numbers_for_differences = {}
+                if quote_character in line or escape_character in line or '\r' in line or initial_space in line or line.startswith(leading_space):
+                    row = next(csv.reader(itertools.chain([line], lines), dialect))
+                    self._key_of_current_row = managed_key_for(row, self._row_number + 1)
+                    yield row
+                    continue
 
-            self._max_digit = None
+                if line[-1:] == '\n':
+                    line = line[:-1]
 
-        def _increment_same_lines(self):
-            self.number_of_same_lines += 1
+                values = line.split(delimiter, number_of_key_values) if line else []
+                if len(values) < number_of_key_values:
+                    # Split as a whole, and left to managed_key_for() to report the columns lacking
+                    self._key_of_current_row = managed_key_for(values, self._row_number + 1)
+                    yield values
+                else:
+                    self._key_of_current_row = managed_key_for(values[:number_of_key_values], self._row_number + 1)
+                    yield None
 
-        def _increment_lhs_only(self):
-            self.number_of_lhs_only += 1
+        def row_of_raw_record(self, raw_record):
+            """ Only for the raw records of the deferred rows, which are split by the delimiter as they are. """
 
-        def _increment_rhs_only(self):
-            self.number_of_rhs_only += 1
+            if raw_record[-1:] == '\n':
+                raw_record = raw_record[:-1]
 
-        def _increment_differences(self):
-            self.number_of_differences += 1
+            return raw_record.split(self._dialect.delimiter)
 
-        def _add_row_number_for_lhs_only(self, row_number):
-            self.row_numbers_for_lhs_only.append(row_number)
+        def number_of_columns_of_raw_record(self, raw_record):
+            """ Only for the raw records of the deferred rows, which are split by the delimiter as they are. """
+            return raw_record.count(self._dialect.delimiter) + 1
 
-        def _add_row_number_for_rhs_only(self, row_number):
-            self.row_numbers_for_rhs_only.append(row_number)
+        def _raw_lines(self):
+            """ csv.reader takes lines only as many as the current row needs, so the lines taken so far are the raw record of the current row. """
 
-        def _add_row_number_for_differences(self, lhs_row_number, rhs_row_number):
-            self.row_numbers_for_differences[lhs_row_number] = rhs_row_number
+            raw_lines_of_current_row = self._raw_lines_of_current_row
+            for line in self._csv_file:
+                raw_lines_of_current_row.append(line)
+                yield line
 
+        def take_raw_record(self):
+            """ Raw text of the current row with universal newlines, if the raw records are kept. Otherwise None. """
 
-        def count_for_case_of_existed_only_on_lhs(self, row_number):
-            self._increment_lhs_only()
-            self._add_row_number_for_lhs_only(row_number)
+            if not self._keeps_raw_records:
+                return None
 
-        def count_for_case_of_existed_on_both_sides(self, lhs_fact, rhs_fact, value_difference_result):
+            raw_record = ''.join(self._raw_lines_of_current_row)
+            self._raw_lines_of_current_row.clear()
+            return raw_record
 
-            if value_difference_result.has_difference:
-                self._increment_differences()
-                self._add_row_number_for_differences(lhs_fact.lhs_row_number, rhs_fact.rhs_row_number)
-            else:
-                self._increment_same_lines()
+        def open_at(self, offset, row_number, end=None):
+            """
+            Start reading at the row starting at the byte offset (e.g. an entry of SparseKeyIndex) as the row number. reset() returns there.
+            The stream given is expected to end at the byte offset end, if any.
+            """
 
-        def count_for_case_of_existed_only_on_rhs(self, row_number):
-            self._increment_rhs_only()
-            self._add_row_number_for_rhs_only(row_number)
+            self._start_offset = offset
+            self._row_number_before_start = row_number - 1
+            self.reset()
 
-        @property
-        def sorted_row_numbers_for_differences(self):
-            return sorted(self.row_numbers_for_differences.items(), key=lambda x: x[0])
+        def reset(self):
 
+            self._csv_file.seek(self._start_offset)
+            self._raw_lines_of_current_row.clear()
+            self._csv_reader = self._new_csv_reader()
+            self._row_number = self._row_number_before_start
+            self._previous_key = ""
 
-        @property
-        def max_digit(self):
+        def close(self):
+            pass
 
-            if self._max_digit is not None:
-                return self._max_digit
+        def bind_matching_key_codec(self, matching_key_codec):
+            """ The deferred rows are bound to the keys built by _deferred_rows() instead. """
+            self.key_for = matching_key_codec.managed_key_for
 
-            self._max_digit = max(
-                len(str(self.number_of_same_lines)),
-                len(str(self.number_of_lhs_only)),
-                len(str(self.number_of_rhs_only)),
-                len(str(self.number_of_differences)),
-            )
-            return self._max_digit
+        def increment_row_number(self):
 
+            if self._previous_key == MatchingKeyCodec.END_of_KEY:
+                return
 
-    def __init__(self, shows_count):
-        self.shows_count = shows_count
-        self.counter = self.Counter()
+            self._row_number += 1
 
+        def key_changed(self, new_key):
 
-    def _func_of_right_justified_number(self):
-        return lambda number: str(number).rjust(self.counter.max_digit)
+            if self._is_header():
+                return
 
-    @spacing_before(1)
-    def report_count(self):
+            self._previous_key = new_key
 
-        if not self.shows_count:
-            return
+        def _is_header(self):
+            return self.row_number == 0 and self._first_row_is_header
 
-        print('● Count & Row number')
+        @property
+        def is_at_header(self):
+            return self._is_header()
 
-        rjust = self._func_of_right_justified_number()
-        print('same lines           : {}'.format(rjust(self.counter.number_of_same_lines)))
-        print('left side only    ({}): {} :-- Row Numbers      -->: {}'.format(Mark.LHS_ONLY, rjust(self.counter.number_of_lhs_only), self.counter.row_numbers_for_lhs_only))
-        print('right side only   ({}): {} :-- Row Numbers      -->: {}'.format(Mark.RHS_ONLY, rjust(self.counter.number_of_rhs_only), self.counter.row_numbers_for_rhs_only))
-        print('with differences  ({}): {} :-- Row Number Pairs -->: {}'.format(Mark.HAS_DIFF, rjust(self.counter.number_of_differences), self.counter.sorted_row_numbers_for_differences))
+        @property
+        def csv_reader(self):
+            return self._csv_reader
 
+        @property
+        def dialect(self):
+            return self._dialect
 
-class UnicodeSupport:
+        @property
+        def file_name(self):
+            return self._file_name
 
-    @classmethod
-    def left_justified(cls, value, length):
-        return f"{value}{' ' * (length - cls.string_length_considering_east_asian_characters_of(value))}"
+        @property
+        def row_number(self):
+            return self._row_number
 
-    @classmethod
-    def right_justified(cls, value, length):
-        return f"{' ' * (length - cls.string_length_considering_east_asian_characters_of(value))}{value}"
+        @property
+        def row_number_of_current_row(self):
+            return self._row_number
 
-    @staticmethod
-    def string_length_considering_east_asian_characters_of(text):
-        return functools.reduce(lambda counting, c: counting + (2 if unicodedata.east_asian_width(c) in 'FWA' else 1),
-                                text, 0)
+        @property
+        def previous_key(self):
+            return self._previous_key
 
 
-# ----------------------------------------------------------------------------------------------------------------------
-#  CSV Reading
-# ----------------------------------------------------------------------------------------------------------------------
+    class SortedState(State):
+        """
+        Notes
+        -----
+        State for the external-sort engine.
+            * The header is read first as it is, and the rest are read in the order of the matching keys
+            * The original row number in the file is kept for each row
+            * The rows are sorted only once. reset() reads the sorted runs again.
+        """
 
-class FileArrangement(type):
+        def __init__(self, csv_file, dialect, file_name, first_row_is_header, external_sorter):
 
-    LHS = '_for_lhs'
-    RHS = '_for_rhs'
+            self._external_sorter = external_sorter
+            self._row_number_of_current_row = 0
+            super(CsvReader.SortedState, self).__init__(csv_file, dialect, file_name, first_row_is_header)
 
+        def _new_csv_reader(self):
+            return self._sorted_rows()
 
-class CsvDialectFixer:
+        def _sorted_rows(self):
 
-    def __init__(self):
-        pass
+            raw_csv_reader = csv.reader(self._csv_file, self._dialect)
 
-    @classmethod
-    def fixed_dialect(cls, context, csv_file, file_arrangement):
+            number_of_header_rows = 0
+            if self._first_row_is_header:
+                header = next(raw_csv_reader, None)
+                if header is None:
+                    return
+                number_of_header_rows = 1
+                self._row_number_of_current_row = 1
+                yield header
 
-        if context.forces_individual_specs:
-            return cls._dialect_from_context(context, file_arrangement)
-        else:
-            return cls._try_sniffing(context, csv_file, file_arrangement)
+            if not self._external_sorter.has_sorted:
+                self._external_sorter.sort(enumerate(raw_csv_reader, start=number_of_header_rows + 1))
 
+            for _, row_number, row in self._external_sorter.sorted_records():
+                self._row_number_of_current_row = row_number
+                yield row
 
-    @classmethod
-    def _dialect_from_context(cls, context, file_arrangement):
+        def close(self):
+            self._external_sorter.close()
 
-        dialect = csv.excel()
-        dialect.delimiter = getattr(context, "column_separator" + file_arrangement)
-        dialect.lineterminator = getattr(context, "line_separator" + file_arrangement)
-        dialect.quotechar = getattr(context, "quote_char" + file_arrangement)
-        dialect.skipinitialspace = getattr(context, "skips_space_after_column_separator" + file_arrangement)
+        @property
+        def row_number_of_current_row(self):
+            return self._row_number_of_current_row
 
-        return dialect, context
 
-    @classmethod
-    def _try_sniffing(cls, context, csv_file, file_arrangement):
+    class ChunkParsedState(State):
+        """
+        Notes
+        -----
+        State that parses the file in chunks on worker processes, since parsing a large file is CPU-bound.
+            * The file is split into chunks of about CHUNK_SIZE bytes at the row boundaries found by RowBoundary,
+              where line feeds in quoted fields are not regarded as the ends of rows
+            * Each chunk is parsed and its matching keys are built on a worker process, and they come back in the order of the file
+            * Only a few chunks per process are parsed ahead, so memory consumption stays bounded
+            * The header is parsed on this process
+        """
 
-        try:
-            return cls._sniff(context, csv_file, file_arrangement)
+        CHUNK_SIZE = 4 * 1024 * 1024
+        CHUNKS_AHEAD_PER_PROCESS = 2
 
-        except csv.Error as e:
+        def __init__(self, csv_file, dialect, file_name, first_row_is_header, splits_rows_simply, file_path, encoding, matching_key_codec, executor, number_of_processes):
 
-            logger.warning(f'Sniffing failed. Generated a dialect from context instead. [type={type(e)}, args={str(e.args)}, message={traceback.format_exception_only(type(e), e)}]')
-            return cls._dialect_from_context(context, file_arrangement)
+            self._file_path = file_path
+            self._encoding = encoding
+            self._executor = executor
+            self._number_of_processes = number_of_processes
+            super(CsvReader.ChunkParsedState, self).__init__(csv_file, dialect, file_name, first_row_is_header, splits_rows_simply=splits_rows_simply,
+                                                             matching_key_codec=matching_key_codec)
 
-        finally:
-            csv_file.seek(0)
+        @classmethod
+        def is_applicable(cls, context, encoding, dialect):
+            return context.number_of_parse_processes > 0 and context.matching_engine != 'external-sort' and RowBoundary.is_applicable(encoding, dialect)
 
-    @classmethod
-    def _sniff(cls, context, csv_file, file_arrangement):
+        def _new_csv_reader(self):
+            return self._parsed_rows()
 
-        sample = csv_file.read(context.sniffing_size)
-        sniffer = csv.Sniffer()
-        dialect = sniffer.sniff(sample)
-        has_header = sniffer.has_header(sample)
+        def _chunks(self):
+            """ Returns the header row if any, and the byte ranges of the chunks. """
 
-        adjusted_context = cls._adjust_context_with(dialect, has_header, context, file_arrangement)
+            with RowBoundary(self._file_path, self._encoding, self._dialect, self._first_row_is_header, self._matching_key_codec, access='sequential') as row_boundary:
 
-        return dialect, adjusted_context
+                header = [row for _, _, row in row_boundary.records_from(0, row_boundary.data_start)]
 
-    @classmethod
-    def _adjust_context_with(cls, dialect, has_header, context, file_arrangement):
+                chunks = []
+                start = row_boundary.data_start
+                while start < row_boundary.size:
+                    end = row_boundary.next_record_start(start + self.CHUNK_SIZE)
+                    chunks.append((start, end))
+                    start = end
 
-        setattr(context, "column_separator" + file_arrangement, dialect.delimiter)
-        setattr(context, "line_separator" + file_arrangement, dialect.lineterminator)
-        setattr(context, "quote_char" + file_arrangement, dialect.quotechar)
-        setattr(context, "skips_space_after_column_separator" + file_arrangement, dialect.skipinitialspace)
-        context.first_row_is_header = has_header if context.header is None else (True if context.header == 'y' else False)
+            return header, chunks
 
-        return context
+        def _parsed_rows(self):
 
+            header, chunks = self._chunks()
+            yield from header
 
-def show_dialect_for_debugging(dialect, context, message, file_arrangement):
+            dialect = CsvDialectFixer.picklable_dialect(self._dialect)
+            chunks = iter(chunks)
 
-    logger.debug(f'---{message}---')
-    logger.debug(f'sniffing dialect={dialect}')
-    logger.debug(f'sniffing dialect csv.excel={isinstance(dialect, csv.excel)}')
-    logger.debug(f'sniffing dialect csv.excel_tab={isinstance(dialect, csv.excel_tab)}')
-    logger.debug(f'sniffing dialect csv.unix_dialect={isinstance(dialect, csv.unix_dialect)}')
-    logger.debug(f'sniffing dialect.delimiter={context.display_string_for_column_separator(dialect.delimiter)}')
-    logger.debug(f'sniffing dialect.doublequote={dialect.doublequote}')
-    logger.debug(f'sniffing dialect.escapechar={dialect.escapechar}')
-    logger.debug(f'sniffing dialect.lineterminator={context.display_string_for_line_separator(dialect.lineterminator, file_arrangement)}')
-    logger.debug(f'sniffing dialect.quotechar={dialect.quotechar}')
-    logger.debug(f'sniffing dialect.quoting={dialect.quoting}')
-    logger.debug(f'sniffing dialect.skipinitialspace={dialect.skipinitialspace}')
+            def submit_next_chunk():
+                for start, end in itertools.islice(chunks, 1):
+                    futures.append(self._executor.submit(parse_one_chunk, self._file_path, self._encoding, dialect, self._splits_rows_simply,
+                                                         self._matching_key_codec, start, end))
 
+            futures = collections.deque()
+            try:
+                for _ in range(self._number_of_processes * self.CHUNKS_AHEAD_PER_PROCESS):
+                    submit_next_chunk()
 
+                while futures:
 
-class LhsFact:
+                    rows, keys = futures.popleft().result()
+                    submit_next_chunk()
 
-    def __init__(self, lhs_row_number, lhs_row, lhs_key):
+                    for row, key in zip(rows, keys):
+                        self._key_of_current_row = key
+                        yield row
+            finally:
+                for future in futures:
+                    future.cancel()
 
-        logger.debug(f'LhsFact 生成 lhs_row_number={lhs_row_number}, lhs_row={lhs_row}, lhs_key={lhs_key}')
+        def bind_matching_key_codec(self, matching_key_codec):
+            self.key_for = lambda row, row_number=None: self._key_of_current_row
 
-        self.lhs_row_number = lhs_row_number
-        self.lhs_row = lhs_row
-        self.lhs_key = lhs_key
 
+    class MappedState(State):
+        """
+        Notes
+        -----
+        State that reads the rows over the memory-mapped bytes of a local file (--memory-map), instead of decoding the whole file as a text stream.
+            * The rows are found by RowBoundary, with the sequential access hinted from the offset to read from
+            * For a row without any character csv.reader treats specially (as CsvReader.State._simply_split_rows looks for),
+              only the bytes of the columns up to the last matching key are sliced out and decoded to build the matching key.
+              The row itself is deferred, and decoded and parsed only when it is compared column by column or reported.
+              Its raw record (bytes) is kept for that, and compared before the columns are, as the raw records of State are
+            * The other rows (the header included) are parsed as a whole at once, as RowBoundary does
+            * reset() and open_at() only move the offset to read from, without opening or seeking a stream
+
+        Available where RowBoundary is, except for the external-sort engine, which reads through the rows once to sort them anyway.
+        """
 
-class RhsFact:
+        def __init__(self, csv_file, dialect, file_name, first_row_is_header, keeps_raw_records, file_path, encoding, matching_key_codec):
 
-    def __init__(self, rhs_row_number, rhs_row, rhs_key):
+            self._row_boundary = RowBoundary(file_path, encoding, dialect, False, matching_key_codec, access='sequential')
+            self._encoding = encoding
+            self._number_of_key_values = max(matching_key_codec.matching_key_indices) + 1
 
-        logger.debug(f'RhsFact 生成 rhs_row_number={rhs_row_number}, rhs_row={rhs_row}, rhs_key={rhs_key}')
+            self._delimiter = dialect.delimiter.encode(encoding)
+            self._quote = dialect.quotechar.encode(encoding) if dialect.quotechar and dialect.quoting != csv.QUOTE_NONE else b''
+            self._initial_space = self._delimiter + b' ' if dialect.skipinitialspace else b''
+            # Unquoted values are converted (e.g. into float) or made None with the other quoting styles
+            self._splits_rows = dialect.quoting in (csv.QUOTE_MINIMAL, csv.QUOTE_ALL, csv.QUOTE_NONE)
 
-        self.rhs_row_number = rhs_row_number
-        self.rhs_row = rhs_row
-        self.rhs_key = rhs_key
+            self._end_offset = None
+            self._raw_record_of_current_row = None
+            super(CsvReader.MappedState, self).__init__(csv_file, dialect, file_name, first_row_is_header, keeps_raw_records, matching_key_codec=matching_key_codec)
 
+        @classmethod
+        def is_applicable(cls, context, encoding, dialect):
+            return context.maps_files and context.matching_engine != 'external-sort' and RowBoundary.is_applicable(encoding, dialect)
 
-class CsvReader:
+        def _new_csv_reader(self):
+            return self._mapped_rows()
 
-    class State:
+        def _mapped_rows(self):
+            """ Generate the rows, or None for the deferred rows. """
 
-        def __init__(self, csv_file, dialect, file_name, first_row_is_header):
+            row_boundary = self._row_boundary
+            row_boundary.advise('sequential', self._start_offset, self._end_offset)
+            records = row_boundary.raw_records_from(self._start_offset, self._end_offset)
+            keeps_raw_records = self._keeps_raw_records
 
-            self._csv_file = csv_file
-            self._dialect = dialect
-            self._file_name = file_name
-            self._first_row_is_header = first_row_is_header
+            if self.is_at_header:
+                for _, _, record in itertools.islice(records, 1):
+                    self._raw_record_of_current_row = record if keeps_raw_records else None
+                    yield row_boundary.row_of(record)
 
-            self._csv_reader = csv.reader(csv_file, dialect)
-            self._row_number = 0
-            self._previous_key = ""
+            managed_key_for = self._matching_key_codec.managed_key_for
+            encoding, delimiter, quote, initial_space = self._encoding, self._delimiter, self._quote, self._initial_space
+            number_of_key_values = self._number_of_key_values if self._splits_rows else sys.maxsize
 
-        def reset(self):
+            for _, _, record in records:
 
-            self._csv_file.seek(0)
-            self._csv_reader = csv.reader(self._csv_file, self._dialect)
-            self._row_number = 0
-            self._previous_key = ""
+                # A row ends with only one line end, and CR is not a part of an unquoted value, so the line end is stripped by rstrip()
+                content = record.rstrip(b'\r\n')
+                if (quote and quote in content) or (initial_space and (initial_space in content or content[:1] == b' ')):
+                    values = ()
+                else:
+                    values = content.split(delimiter, number_of_key_values) if content else ()
 
-        def increment_row_number(self):
+                if len(values) < number_of_key_values:
+                    row = row_boundary.row_of(record)
+                    self._raw_record_of_current_row = record if keeps_raw_records else None
+                    self._key_of_current_row = managed_key_for(row, self._row_number + 1)
+                    yield row
+                else:
+                    self._raw_record_of_current_row = record
+                    self._key_of_current_row = managed_key_for([value.decode(encoding) for value in values[:number_of_key_values]], self._row_number + 1)
+                    yield None
 
-            if self._previous_key == MatchingKeyCodec.END_of_KEY:
-                return
+        def row_of_raw_record(self, raw_record):
+            return self._row_boundary.row_of(raw_record)
 
-            self._row_number += 1
+        def number_of_columns_of_raw_record(self, raw_record):
+            """ Only for the raw records of the deferred rows, which are split by the delimiter as they are. """
+            return raw_record.rstrip(b'\r\n').count(self._delimiter) + 1
 
-        def key_changed(self, new_key):
+        def take_raw_record(self):
+            """ Bytes of the current row. It is kept for the deferred rows even if the raw records are not kept, to parse them later. """
 
-            if self._is_header():
-                return
+            raw_record = self._raw_record_of_current_row
+            self._raw_record_of_current_row = None
+            return raw_record
 
-            self._previous_key = new_key
+        def open_at(self, offset, row_number, end=None):
 
-        def _is_header(self):
-            return self.row_number == 0 and self._first_row_is_header
+            self._end_offset = end
+            super(CsvReader.MappedState, self).open_at(offset, row_number)
 
-        @property
-        def csv_reader(self):
-            return self._csv_reader
+        def reset(self):
 
-        @property
-        def file_name(self):
-            return self._file_name
+            self._csv_reader = self._new_csv_reader()
+            self._raw_record_of_current_row = None
+            self._row_number = self._row_number_before_start
+            self._previous_key = ""
 
-        @property
-        def row_number(self):
-            return self._row_number
+        def close(self):
+            self._row_boundary.close()
 
-        @property
-        def previous_key(self):
-            return self._previous_key
+        def bind_matching_key_codec(self, matching_key_codec):
+            self.key_for = lambda row, row_number=None: self._key_of_current_row
 
 
     def __init__(self, lhs_csv, rhs_csv, lhs_dialect, rhs_dialect, context):
@@ -1299,16 +4311,64 @@ class CsvReader:
         show_dialect_for_debugging(lhs_dialect, context, '左CSV', FileArrangement.LHS)
         show_dialect_for_debugging(rhs_dialect, context, '右CSV', FileArrangement.RHS)
 
-        self.lhs_csv_state = CsvReader.State(lhs_csv, lhs_dialect, context.lhs_file_name, context.first_row_is_header)
-        self.rhs_csv_state = CsvReader.State(rhs_csv, rhs_dialect, context.rhs_file_name, context.first_row_is_header)
+        parses_lhs_in_chunks = CsvReader.ChunkParsedState.is_applicable(context, context.encoding_for_lhs, lhs_dialect)
+        parses_rhs_in_chunks = CsvReader.ChunkParsedState.is_applicable(context, context.encoding_for_rhs, rhs_dialect)
+        self._parse_executor = None
+        if parses_lhs_in_chunks or parses_rhs_in_chunks:
+            self._parse_executor = concurrent.futures.ProcessPoolExecutor(max_workers=context.number_of_parse_processes)
+
+        maps_lhs_file = not parses_lhs_in_chunks and CsvReader.MappedState.is_applicable(context, context.encoding_for_lhs, lhs_dialect)
+        maps_rhs_file = not parses_rhs_in_chunks and CsvReader.MappedState.is_applicable(context, context.encoding_for_rhs, rhs_dialect)
+
+        # The same raw text is parsed into the same row only with the same dialects.
+        # Raw records are not kept for the engines that keep facts aside, not to double their memory consumption, nor for the rows parsed in chunks.
+        # The raw records of mapped files are bytes, which are the same text only in the same encoding.
+        are_comparable_raw_records = maps_lhs_file == maps_rhs_file and (not maps_lhs_file or self._are_same_encodings(context.encoding_for_lhs, context.encoding_for_rhs))
+        parses_in_chunks = parses_lhs_in_chunks or parses_rhs_in_chunks
+        self.keeps_raw_records = context.matching_engine == 'sort-merge' and CsvDialectFixer.are_equivalent(lhs_dialect, rhs_dialect) and not parses_in_chunks and are_comparable_raw_records
+
+        self.lhs_csv_state = self._state_for(lhs_csv, lhs_dialect, context, FileArrangement.LHS, context.lhs_file_name, context.lhs_file_path, parses_lhs_in_chunks, maps_lhs_file)
+        self.rhs_csv_state = self._state_for(rhs_csv, rhs_dialect, context, FileArrangement.RHS, context.rhs_file_name, context.rhs_file_path, parses_rhs_in_chunks, maps_rhs_file)
+
+        self.lhs_csv_state.bind_matching_key_codec(context.matching_key_codec)
+        self.rhs_csv_state.bind_matching_key_codec(context.matching_key_codec)
+
+        self.decode_lhs_row = ByteComparison.row_decoder_for(context, FileArrangement.LHS)
+        self.decode_rhs_row = ByteComparison.row_decoder_for(context, FileArrangement.RHS)
+
         self.cxt = context
 
         self.skip_header()
 
+    def _state_for(self, csv_file, dialect, context, file_arrangement, file_name, file_path, parses_in_chunks, maps_file):
+
+        encoding = getattr(context, 'encoding' + file_arrangement)
+        splits_rows_simply = getattr(context, 'splits_rows_simply' + file_arrangement)
+
+        if context.matching_engine == 'external-sort':
+            return CsvReader.SortedState(csv_file, dialect, file_name, context.first_row_is_header, ExternalSorter.for_context(context))
+        if parses_in_chunks:
+            return CsvReader.ChunkParsedState(csv_file, dialect, file_name, context.first_row_is_header, splits_rows_simply,
+                                              file_path, encoding, context.matching_key_codec, self._parse_executor, context.number_of_parse_processes)
+        if maps_file:
+            return CsvReader.MappedState(csv_file, dialect, file_name, context.first_row_is_header, self.keeps_raw_records,
+                                         file_path, encoding, context.matching_key_codec)
+
+        return CsvReader.State(csv_file, dialect, file_name, context.first_row_is_header, self.keeps_raw_records, splits_rows_simply, context.matching_key_codec)
+
+    @staticmethod
+    def _are_same_encodings(encoding, other_encoding):
+
+        try:
+            return codecs.lookup(encoding).name == codecs.lookup(other_encoding).name
+        except LookupError:
+            return False
+
     def skip_header(self):
 
-        if self.cxt.first_row_is_header:
+        if self.lhs_csv_state.is_at_header:
             _ = self.read_lhs()
+        if self.rhs_csv_state.is_at_header:
             _ = self.read_rhs()
 
     def reset(self):
@@ -1317,17 +4377,57 @@ class CsvReader:
         self.rhs_csv_state.reset()
         self.skip_header()
 
+    def close(self):
+
+        self.lhs_csv_state.close()
+        self.rhs_csv_state.close()
+
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown()
+
     def read_lhs(self):
 
         lhs_row, lhs_key = self._read_csv(self.lhs_csv_state)
         self.lhs_csv_state.increment_row_number()
-        return LhsFact(self.lhs_csv_state.row_number, lhs_row, lhs_key)
+        return LhsFact(self.lhs_csv_state.row_number_of_current_row, lhs_row, lhs_key, self.lhs_csv_state.take_raw_record(), self.lhs_csv_state)
+
+    def refill_lhs(self, lhs_fact):
+        """ Read the next row into the fact given, as read_lhs() does into a new one. """
+
+        lhs_row, lhs_key = self._read_csv(self.lhs_csv_state)
+        self.lhs_csv_state.increment_row_number()
+        lhs_fact.refill(self.lhs_csv_state.row_number_of_current_row, lhs_row, lhs_key, self.lhs_csv_state.take_raw_record(), self.lhs_csv_state)
+        return lhs_fact
 
     def read_rhs(self):
 
         rhs_row, rhs_key = self._read_csv(self.rhs_csv_state)
         self.rhs_csv_state.increment_row_number()
-        return RhsFact(self.rhs_csv_state.row_number, rhs_row, rhs_key)
+        return RhsFact(self.rhs_csv_state.row_number_of_current_row, rhs_row, rhs_key, self.rhs_csv_state.take_raw_record(), self.rhs_csv_state)
+
+    def refill_rhs(self, rhs_fact):
+        """ Read the next row into the fact given, as read_rhs() does into a new one. """
+
+        rhs_row, rhs_key = self._read_csv(self.rhs_csv_state)
+        self.rhs_csv_state.increment_row_number()
+        rhs_fact.refill(self.rhs_csv_state.row_number_of_current_row, rhs_row, rhs_key, self.rhs_csv_state.take_raw_record(), self.rhs_csv_state)
+        return rhs_fact
+
+    def decoded_lhs_fact(self, lhs_fact):
+        """ The fact with the row decoded in the text encoding, if rows are compared on bytes. Otherwise the fact itself. """
+
+        if not self.cxt.compares_bytes:
+            return lhs_fact
+
+        return LhsFact(lhs_fact.lhs_row_number, self.decode_lhs_row(lhs_fact.lhs_row), lhs_fact.lhs_key)
+
+    def decoded_rhs_fact(self, rhs_fact):
+        """ The fact with the row decoded in the text encoding, if rows are compared on bytes. Otherwise the fact itself. """
+
+        if not self.cxt.compares_bytes:
+            return rhs_fact
+
+        return RhsFact(rhs_fact.rhs_row_number, self.decode_rhs_row(rhs_fact.rhs_row), rhs_fact.rhs_key)
 
     def _read_csv(self, csv_state):
 
@@ -1337,7 +4437,10 @@ class CsvReader:
             csv_state.key_changed(MatchingKeyCodec.END_of_KEY)
             return [], MatchingKeyCodec.END_of_KEY
 
-        new_key = self.cxt.matching_key_codec.managed_key_for(row)
+        if csv_state.is_at_header:
+            return row, None
+
+        new_key = csv_state.key_for(row, csv_state.row_number + 1)
         self._detect_key_violation(new_key, csv_state)
 
         csv_state.key_changed(new_key)
@@ -1346,7 +4449,7 @@ class CsvReader:
 
     def _detect_key_violation(self, new_key, csv_state):
 
-        if csv_state.previous_key == '':
+        if csv_state.previous_key == '' or self.cxt.matching_engine == 'hash-join':
             return
 
         if new_key < csv_state.previous_key:
@@ -1361,6 +4464,15 @@ class CsvReader:
             exit(1)
 
 
+def parse_one_chunk(file_path, encoding, dialect, splits_rows_simply, matching_key_codec, start, end):
+    """ Entry point of a worker process of CsvReader.ChunkParsedState. Parse the rows in the byte range as CsvReader.State does, and build their matching keys. """
+
+    with ByteRange.text_stream(file_path, start, end, encoding) as csv_file:
+        rows = list(CsvReader.State(csv_file, dialect, file_path, False, splits_rows_simply=splits_rows_simply).csv_reader)
+
+    return rows, list(map(matching_key_codec.managed_key_for, rows))
+
+
 if __name__ == '__main__':
 
     main()
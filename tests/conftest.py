@@ -13,15 +13,31 @@ def args():
         "encoding": "",
         "encoding_for_lhs": "utf8",
         "encoding_for_rhs": "utf8",
+        "compare_bytes": False,
         "matching_keys": [MatchingKeyInfo('0')],
         "unique_key": False,
         "ignore_columns": [],
+        "key_from": None,
+        "key_to": None,
+        "matching_engine": "sort-merge",
+        "sort_memory_budget": 256,
+        "partitions": 1,
+        "read_ahead": 0,
+        "parse_processes": 0,
+        "memory_map": False,
+        "temp_dir": None,
         "vertical_style": False,
         "show_count": False,
         "show_difference_only": False,
         "show_all_lines": False,
+        "without_row_numbers": False,
+        "quiet": False,
+        "max_differences": 0,
         "show_context_from_arguments": False,
+        "single_pass": False,
         "sniffing_size": 4096,
+        "pre_scan_cache": False,
+        "parallel_pre_scan": False,
         "force_individual_specs": False,
         "header": None,
         "column_separator": None,
@@ -36,6 +52,11 @@ def args():
         "quote_char_for_rhs": '"',
         "no_skip_space_after_column_separator_for_lhs": False,
         "no_skip_space_after_column_separator_for_rhs": False,
+        "output_format": "text",
+        "output_file": None,
+        "flush_interval": 0,
+        "log_level": "ERROR",
+        "log_file": None,
     })
 
 @pytest.fixture(scope='function')
@@ -0,0 +1,72 @@
+import pytest
+
+from src.csvdiff3.csvdiff import CountReporter, output
+
+
+@pytest.mark.parametrize(
+    "row_numbers",
+    [
+        pytest.param([],                         id='empty'),
+        pytest.param([3],                        id='one'),
+        pytest.param([2, 3, 4, 8, 9, 12],        id='runs'),
+        pytest.param([9, 10, 2, 3, 11],          id='out of order'),
+    ],
+)
+def test_row_number_runs(row_numbers):
+
+    sut = CountReporter.RowNumberRuns()
+    for row_number in row_numbers:
+        sut.append(row_number)
+
+    assert list(sut) == row_numbers
+
+
+@pytest.mark.parametrize(
+    "pairs",
+    [
+        pytest.param([],                                         id='empty'),
+        pytest.param([(2, 3), (4, 4), (5, 5)],                   id='runs'),
+        pytest.param([(2, 2), (3, 4), (4, 5)],                   id='broken on rhs'),
+        pytest.param([(7, 1), (8, 2), (2, 3), (3, 4), (5, 9)],   id='out of order on lhs'),
+    ],
+)
+def test_row_number_pair_runs(pairs):
+
+    sut = CountReporter.RowNumberPairRuns()
+    for lhs_row_number, rhs_row_number in pairs:
+        sut.append(lhs_row_number, rhs_row_number)
+
+    assert list(sut.sorted_by_lhs_row_number()) == sorted(pairs)
+
+
+def test_row_numbers_are_not_collected_unless_reported():
+
+    sut = CountReporter(shows_count=True, shows_row_numbers=False)
+    sut.counter.count_for_case_of_existed_only_on_lhs(2)
+    sut.counter.count_for_case_of_existed_only_on_rhs(3)
+
+    assert sut.counter.number_of_lhs_only == 1
+    assert sut.counter.number_of_rhs_only == 1
+    assert list(sut.counter.row_numbers_for_lhs_only) == []
+    assert list(sut.counter.row_numbers_for_rhs_only) == []
+
+
+@pytest.mark.parametrize(
+    "row_numbers",
+    [
+        pytest.param([],                 id='empty'),
+        pytest.param([1, 2, 3, 7],       id='less than a write'),
+        pytest.param(list(range(1, 26)), id='more than a write'),
+    ],
+)
+def test_list_is_written_as_str_of_list(capsysbinary, monkeypatch, row_numbers):
+
+    monkeypatch.setattr(CountReporter, 'ROW_NUMBERS_PER_WRITE', 10)
+
+    output.open()
+    try:
+        CountReporter._write_list_of(map(str, row_numbers))
+    finally:
+        output.close()
+
+    assert capsysbinary.readouterr().out.decode() == str(row_numbers) + '\n'
@@ -0,0 +1,196 @@
+import concurrent.futures
+import csv
+import io
+
+import pytest
+
+from src.csvdiff3.csvdiff import CsvReader, MatchingKeyCodec, MatchingKeyInfo
+
+
+def test_state_takes_raw_record_of_each_row():
+
+    csv_file = io.StringIO('key-1,"value\nwith line feed"\nkey-2,value\n')
+    sut = CsvReader.State(csv_file, csv.excel(), 'sorted.csv', False, keeps_raw_records=True)
+
+    assert next(sut.csv_reader) == ['key-1', 'value\nwith line feed']
+    assert sut.take_raw_record() == 'key-1,"value\nwith line feed"\n'
+
+    assert next(sut.csv_reader) == ['key-2', 'value']
+    assert sut.take_raw_record() == 'key-2,value\n'
+
+def test_state_does_not_take_raw_record_unless_kept():
+
+    sut = CsvReader.State(io.StringIO('key-1,value\n'), csv.excel(), 'sorted.csv', False)
+
+    assert next(sut.csv_reader) == ['key-1', 'value']
+    assert sut.take_raw_record() is None
+
+@pytest.mark.parametrize('skips_initial_space', [False, True])
+@pytest.mark.parametrize('text', [
+    'key-1,value-1,value-2\nkey-2,value-1,value-2\n',
+    'key-1,value-1\n\nkey-2,value-1',
+    'key-1,"value with\nline feed",value-2\nkey-2,value-1,value-2\n',
+    'key-1,"value, with comma"\nkey-2,value""\n',
+    'key-1, value-1,  value-2\n key-2,value-1\n',
+    'key-1,value-1\r\nkey-2,value-2\r\n',
+    ',,\n,\n',
+])
+def test_state_splits_rows_simply_as_csv_reader_does(skips_initial_space, text):
+
+    dialect = csv.excel()
+    dialect.skipinitialspace = skips_initial_space
+
+    sut = CsvReader.State(io.StringIO(text, newline=None), dialect, 'sorted.csv', False, keeps_raw_records=True, splits_rows_simply=True)
+
+    assert list(sut.csv_reader) == list(csv.reader(io.StringIO(text, newline=None), dialect))
+
+def deferring_state(text, dialect, first_row_is_header=False):
+
+    matching_key_codec = MatchingKeyCodec([MatchingKeyInfo('1'), MatchingKeyInfo('0')])
+    sut = CsvReader.State(io.StringIO(text, newline=None), dialect, 'sorted.csv', first_row_is_header, keeps_raw_records=True, splits_rows_simply=True,
+                          matching_key_codec=matching_key_codec)
+    sut.bind_matching_key_codec(matching_key_codec)
+    return sut, matching_key_codec
+
+@pytest.mark.parametrize('skips_initial_space', [False, True])
+@pytest.mark.parametrize('text', [
+    'key-1,value-1,value-2\nkey-2,value-1,value-2\n',
+    'key-1,"value with\nline feed",value-2\nkey-2,value-1,value-2\n',
+    'key-1,"value, with comma"\nkey-2,value""\n',
+    'key-1, value-1,  value-2\n key-2,value-1\n',
+    'key-1,value-1\r\nkey-2,value-2\r\n',
+    'key-1,value-1\rkey-2,"value\rwith CR"\rkey-3,値-3',
+    ',,\n,\n',
+])
+def test_state_defers_rows_split_simply_as_csv_reader_does(monkeypatch, skips_initial_space, text):
+
+    monkeypatch.setattr(CsvReader.State, 'MIN_COLUMNS_AFTER_KEYS_TO_DEFER', 0)
+    dialect = csv.excel()
+    dialect.skipinitialspace = skips_initial_space
+
+    sut, matching_key_codec = deferring_state(text, dialect)
+    rows_and_keys = rows_and_keys_of(sut)
+
+    expected_rows = list(csv.reader(io.StringIO(text, newline=None), dialect))
+    assert [row for row, _ in rows_and_keys] == expected_rows
+    assert [key for _, key in rows_and_keys] == [matching_key_codec.managed_key_for(row) for row in expected_rows]
+
+@pytest.mark.parametrize('number_of_values, defers', [(15, True), (14, False)])
+def test_state_defers_rows_only_as_wide_as_the_header(number_of_values, defers):
+    """ The matching keys take 2 columns, so the rows are deferred with 15 columns or more after them. """
+
+    values = ','.join(f'value-{i}' for i in range(number_of_values))
+    header = ','.join(f'head{i}' for i in range(number_of_values + 2))
+    sut, _ = deferring_state(f'{header}\nkey-1,key-2,{values}\nkey-3,"key-4",{values}\n', csv.excel(), first_row_is_header=True)
+
+    assert next(sut.csv_reader) == header.split(',')
+    sut.take_raw_record()
+    sut.increment_row_number()
+
+    row = next(sut.csv_reader)
+    assert (row is None) == defers
+    assert sut.key_for(row) == MatchingKeyCodec([MatchingKeyInfo('1'), MatchingKeyInfo('0')]).managed_key_for(['key-1', 'key-2'])
+
+    raw_record = sut.take_raw_record()
+    assert raw_record == f'key-1,key-2,{values}\n'
+    if defers:
+        assert sut.row_of_raw_record(raw_record) == ['key-1', 'key-2'] + values.split(',')
+        assert sut.number_of_columns_of_raw_record(raw_record) == number_of_values + 2
+
+    assert next(sut.csv_reader) == ['key-3', 'key-4'] + values.split(',')
+
+@pytest.mark.parametrize('chunk_size', [1, 16, 4 * 1024 * 1024])
+def test_chunk_parsed_state_reads_rows_and_keys_in_order(tmpdir, monkeypatch, chunk_size):
+
+    text = 'head1,head2\nkey-1,"value with\nline feed"\nkey-2,"value, with comma"\r\nkey-3,"value with\r\nCRLF"\nkey-4,value\n'
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(text.encode('utf8'))
+
+    monkeypatch.setattr(CsvReader.ChunkParsedState, 'CHUNK_SIZE', chunk_size)
+    matching_key_codec = MatchingKeyCodec([MatchingKeyInfo('0')])
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        sut = CsvReader.ChunkParsedState(io.StringIO(), csv.excel(), 'sorted.csv', True, False, csv_file.strpath, 'utf8', matching_key_codec, executor, 2)
+        sut.bind_matching_key_codec(matching_key_codec)
+
+        rows_and_keys = []
+        for row in sut.csv_reader:
+            rows_and_keys.append((row, sut.key_for(row)))
+
+    expected_rows = list(csv.reader(io.StringIO(text, newline=None)))
+    assert [row for row, _ in rows_and_keys] == expected_rows
+    assert [key for _, key in rows_and_keys[1:]] == [matching_key_codec.managed_key_for(row) for row in expected_rows[1:]]
+
+def mapped_state(tmpdir, text, dialect, first_row_is_header=False):
+
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(text.encode('utf8'))
+
+    matching_key_codec = MatchingKeyCodec([MatchingKeyInfo('1'), MatchingKeyInfo('0')])
+    sut = CsvReader.MappedState(io.StringIO(), dialect, 'sorted.csv', first_row_is_header, False, csv_file.strpath, 'utf8', matching_key_codec)
+    sut.bind_matching_key_codec(matching_key_codec)
+    return sut, matching_key_codec
+
+def rows_and_keys_of(sut):
+    """ The deferred rows are parsed from their raw records, as the facts do. """
+
+    rows_and_keys = []
+    for row in sut.csv_reader:
+        raw_record = sut.take_raw_record()
+        rows_and_keys.append((row if row is not None else sut.row_of_raw_record(raw_record), sut.key_for(row)))
+
+    return rows_and_keys
+
+@pytest.mark.parametrize('skips_initial_space', [False, True])
+@pytest.mark.parametrize('text', [
+    'key-1,value-1,value-2\nkey-2,value-1,value-2\n',
+    'key-1,"value with\nline feed",value-2\nkey-2,value-1,value-2\n',
+    'key-1,"value, with comma"\nkey-2,value""\n',
+    'key-1, value-1,  value-2\n key-2,value-1\n',
+    'key-1,value-1\r\nkey-2,value-2\r\n',
+    'key-1,value-1\rkey-2,"value\rwith CR"\rkey-3,値-3',
+    ',,\n,\n',
+])
+def test_mapped_state_reads_rows_and_keys_as_csv_reader_does(tmpdir, skips_initial_space, text):
+
+    dialect = csv.excel()
+    dialect.skipinitialspace = skips_initial_space
+
+    sut, matching_key_codec = mapped_state(tmpdir, text, dialect)
+    rows_and_keys = rows_and_keys_of(sut)
+    sut.close()
+
+    expected_rows = list(csv.reader(io.StringIO(text, newline=None), dialect))
+    assert [row for row, _ in rows_and_keys] == expected_rows
+    assert [key for _, key in rows_and_keys] == [matching_key_codec.managed_key_for(row) for row in expected_rows]
+
+def test_mapped_state_defers_only_rows_split_by_delimiter(tmpdir):
+
+    sut, _ = mapped_state(tmpdir, 'head1,head2\nkey-1,value-1\nkey-2,"value-2"\nkey-3,value-3,value-4\n', csv.excel(), first_row_is_header=True)
+
+    assert next(sut.csv_reader) == ['head1', 'head2']
+    sut.increment_row_number()
+
+    assert next(sut.csv_reader) is None
+    assert sut.take_raw_record() == b'key-1,value-1\n'
+    assert sut.number_of_columns_of_raw_record(b'key-1,value-1\n') == 2
+
+    assert next(sut.csv_reader) == ['key-2', 'value-2']
+    assert sut.take_raw_record() is None
+
+    assert next(sut.csv_reader) is None
+    assert sut.number_of_columns_of_raw_record(sut.take_raw_record()) == 3
+    sut.close()
+
+def test_mapped_state_rewinds_to_the_offset_opened_at(tmpdir):
+
+    text = 'head1,head2\nkey-1,value-1\nkey-2,value-2\nkey-3,value-3\n'
+    sut, _ = mapped_state(tmpdir, text, csv.excel(), first_row_is_header=True)
+
+    sut.open_at(text.index('key-2'), 2, text.index('key-3'))
+    assert [row for row, _ in rows_and_keys_of(sut)] == [['key-2', 'value-2']]
+
+    sut.reset()
+    assert sut.row_number == 1
+    assert [row for row, _ in rows_and_keys_of(sut)] == [['key-2', 'value-2']]
+    sut.close()
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from src.csvdiff3.csvdiff import ExternalSorter, MatchingKeyCodec, MatchingKeyInfo
+
+
+@pytest.mark.parametrize(
+    "memory_budget, merge_fan_in",
+    [
+        pytest.param(1024 * 1024, 64, id='in memory'),
+        pytest.param(1,           64, id='spilled within fan-in'),
+        pytest.param(1,           2,  id='merged in passes'),
+        pytest.param(1,           3,  id='merged in passes with a remainder'),
+    ],
+)
+def test_sorted_records(tmpdir, monkeypatch, memory_budget, merge_fan_in):
+
+    monkeypatch.setattr(ExternalSorter, 'MERGE_FAN_IN', merge_fan_in)
+
+    keys = [f'key{i % 20:02d}' for i in range(50)]
+    random.Random(0).shuffle(keys)
+    numbered_rows = [(row_number, [key, f'value{row_number}']) for row_number, key in enumerate(keys, start=2)]
+
+    sut = ExternalSorter(MatchingKeyCodec([MatchingKeyInfo('0')]), memory_budget, tmpdir.strpath)
+    try:
+        sut.sort(iter(numbered_rows))
+        assert len(sut._run_paths) <= merge_fan_in
+
+        records = list(sut.sorted_records())
+    finally:
+        sut.close()
+
+    assert [(row_number, row) for _, row_number, row in records] == sorted(numbered_rows, key=lambda numbered_row: (numbered_row[1][0], numbered_row[0]))
+    assert tmpdir.listdir() == []
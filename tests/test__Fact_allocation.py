@@ -0,0 +1,116 @@
+import csv
+import io
+import tracemalloc
+
+import pytest
+
+from src.csvdiff3.csvdiff import CsvReader, LhsFact, RhsFact, ValueDifferenceDetector, context_from_arguments, perform_key_matching
+
+
+NUMBER_OF_ROWS = 10000
+
+
+def objects_and_bytes_per_row(make_fact):
+    """ Allocation benchmark: traced blocks (objects) and bytes retained for each fact. The row number int is included. """
+
+    row, key = ['key-1', 'value-1'], '..key-1..'
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        facts = [make_fact(1000 + i, row, key) for i in range(NUMBER_OF_ROWS)]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    differences = after.compare_to(before, 'filename')
+    number_of_objects = sum(difference.count_diff for difference in differences)
+    number_of_bytes = sum(difference.size_diff for difference in differences)
+
+    assert len(facts) == NUMBER_OF_ROWS
+    return number_of_objects / NUMBER_OF_ROWS, number_of_bytes / NUMBER_OF_ROWS
+
+
+@pytest.mark.parametrize('fact_class', [LhsFact, RhsFact])
+def test_fact_has_no_instance_dict(fact_class):
+    assert not hasattr(fact_class(2, ['key-1'], '..key-1..'), '__dict__')
+
+class FactWithInstanceDict:
+    """ Baseline: the shape of the facts before __slots__. """
+
+    def __init__(self, row_number, row, key, raw_record=None):
+
+        self.row_number = row_number
+        self.row = row
+        self.key = key
+        self.raw_record = raw_record
+
+
+@pytest.mark.parametrize('fact_class', [LhsFact, RhsFact])
+def test_fact_allocates_less_than_with_instance_dict(fact_class):
+
+    objects_per_row, bytes_per_row = objects_and_bytes_per_row(fact_class)
+    baseline_objects_per_row, baseline_bytes_per_row = objects_and_bytes_per_row(FactWithInstanceDict)
+
+    # An instance dict is one more object per row before Python 3.11, and more bytes on any
+    assert objects_per_row <= baseline_objects_per_row
+    assert bytes_per_row < baseline_bytes_per_row
+
+def test_value_difference_result_has_no_instance_dict():
+    assert not hasattr(ValueDifferenceDetector.ValueDifferenceResult([1]), '__dict__')
+
+
+class ReaderAllocatingFacts:
+    """ Baseline: the reader allocating a fact for each row, as the sort-merge loop did before it read the rows into the same facts. """
+
+    def __init__(self, csv_reader):
+        self._csv_reader = csv_reader
+
+    def refill_lhs(self, _):
+        return self._csv_reader.read_lhs()
+
+    def refill_rhs(self, _):
+        return self._csv_reader.read_rhs()
+
+
+def objects_per_row_in_matching(lhs, rhs, reader_for):
+    """
+    Allocation benchmark of perform_key_matching: traced blocks (objects) per row on each side.
+    The callbacks keep what they are given, the row numbers, rows and keys included, so that every fact allocated for a row is counted.
+    """
+
+    text = ''.join(f'key-{i:06d},value-{i}\n' for i in range(NUMBER_OF_ROWS))
+    lhs.write('')
+    rhs.write('')
+
+    context = context_from_arguments([lhs.strpath, rhs.strpath, '--log-level', 'ERROR'])
+    context.first_row_is_header = False
+    csv_reader = CsvReader(io.StringIO(text), io.StringIO(text), csv.excel(), csv.excel(), context)
+
+    kept = []
+
+    def existed_on_both_sides(lhs_fact, rhs_fact):
+        kept.extend((lhs_fact, lhs_fact.lhs_row_number, lhs_fact.lhs_row, lhs_fact.lhs_key))
+        kept.extend((rhs_fact, rhs_fact.rhs_row_number, rhs_fact.rhs_row, rhs_fact.rhs_key))
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        perform_key_matching(reader_for(csv_reader), None, existed_on_both_sides, None)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        csv_reader.close()
+
+    differences = after.compare_to(before, 'filename')
+    assert len(kept) == NUMBER_OF_ROWS * 8
+    return sum(difference.count_diff for difference in differences) / (NUMBER_OF_ROWS * 2)
+
+
+def test_matching_allocates_less_than_with_a_fact_for_each_row(lhs, rhs):
+
+    objects_per_row = objects_per_row_in_matching(lhs, rhs, lambda csv_reader: csv_reader)
+    baseline_objects_per_row = objects_per_row_in_matching(lhs, rhs, ReaderAllocatingFacts)
+
+    # A fact for each row on each side is not allocated
+    assert objects_per_row <= baseline_objects_per_row - 0.9
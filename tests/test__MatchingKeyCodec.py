@@ -51,3 +51,28 @@ def test_decode(managed_key, expected):
 
 
 
+@pytest.mark.parametrize(
+    "matching_key_infos, row, expected_managed_key",
+    [
+        pytest.param([MatchingKeyInfo('0:int')],                        ['12', 'value1', 'value2'],         (12,),                  id='encode 1 int key'),
+        pytest.param([MatchingKeyInfo('0:int'), MatchingKeyInfo('2')],  ['12', 'value1', 'key2'],           (12, 'key2'),           id='encode 1 int key and 1 key without type'),
+        pytest.param([MatchingKeyInfo('2:str'), MatchingKeyInfo('0:4')], ['12', 'value1', 'key2'],          ('key2', '0012'),       id='encode 1 str key and 1 padded key'),
+    ],
+)
+def test_encode_typed(matching_key_infos, row, expected_managed_key):
+
+    sut = MatchingKeyCodec(matching_key_infos)
+    assert sut.is_typed
+    assert sut.managed_key_for(row) == expected_managed_key
+    assert MatchingKeyCodec.decode_key(sut.managed_key_for(row)) == list(map(str, expected_managed_key))
+
+def test_end_of_key_is_greater_than_any_managed_key():
+
+    assert '..zzz..' < MatchingKeyCodec.END_of_KEY
+    assert (99999999,) < MatchingKeyCodec.END_of_KEY
+    assert MatchingKeyCodec.END_of_KEY > (99999999,)
+    assert MatchingKeyCodec.END_of_KEY == MatchingKeyCodec.END_of_KEY
+    assert MatchingKeyCodec.END_of_KEY != '..key1..'
+
+
+
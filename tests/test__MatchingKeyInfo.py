@@ -1,3 +1,6 @@
+import datetime
+import decimal
+
 import pytest
 
 from src.csvdiff3.csvdiff import MatchingKeyInfo
@@ -36,4 +39,45 @@ def test_matching_key_info(specified_matching_key, expected, row_and_expected_ma
     assert sut.key_for(row_and_expected_managed_key_pair.row) == row_and_expected_managed_key_pair.expected_managed_key
 
 
+@pytest.mark.parametrize(
+    "specified_matching_key, expected_key_type, row, expected_key_part",
+    [
+        pytest.param('0',         None,      ['key1', 'value1'],             'key1',                       id='no type'),
+        pytest.param('0:int',     'int',     ['12', 'value1'],               12,                           id='int'),
+        pytest.param('1:decimal', 'decimal', ['key1', '1.50'],               decimal.Decimal('1.5'),       id='decimal'),
+        pytest.param('0:date',    'date',    ['2021-09-21', 'value1'],       datetime.date(2021, 9, 21),   id='date'),
+        pytest.param('0:str',     'str',     ['key1', 'value1'],             'key1',                       id='str'),
+    ],
+)
+def test_typed_matching_key_info(specified_matching_key, expected_key_type, row, expected_key_part):
+
+    sut = MatchingKeyInfo(specified_matching_key)
+
+    assert sut.key_type == expected_key_type
+    assert sut.max_length == 0
+    assert sut.typed_key_function()(row) == expected_key_part
+
+
+@pytest.mark.parametrize(
+    "specified_matching_key",
+    [
+        pytest.param('0:8:int',       id='type after max length'),
+        pytest.param('0:int:8:9',     id='extra part'),
+        pytest.param('0:int:date',    id='two types'),
+    ],
+)
+def test_matching_key_info_with_unknown_parts(specified_matching_key):
+
+    with pytest.raises(SystemExit) as e:
+        MatchingKeyInfo(specified_matching_key)
+
+    assert e.value.code == 1
+
+
+@pytest.mark.parametrize("value", ['NaN', 'sNaN', 'Infinity', '-Inf'])
+def test_decimal_matching_key_should_be_finite(value):
+
+    sut = MatchingKeyInfo('0:decimal')
 
+    with pytest.raises(ValueError):
+        sut.typed_key_function()([value, 'value1'])
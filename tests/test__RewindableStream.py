@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+from src.csvdiff3.csvdiff import RewindableStream
+
+
+class Pipe(io.StringIO):
+
+    def seekable(self):
+        return False
+
+
+TEXT = 'head1,head2\nkey-1,value-1\nkey-2,value-2\nkey-3,value-3\n'
+
+
+@pytest.mark.parametrize('memory_limit', [4, 1024 * 1024])
+def test_rewinds_after_reading_a_sample_in_the_middle_of_a_line(monkeypatch, memory_limit):
+
+    monkeypatch.setattr(RewindableStream, 'MEMORY_LIMIT', memory_limit)
+    sut = RewindableStream.of(Pipe(TEXT), None)
+
+    assert sut.read(15) == TEXT[:15]
+    sut.seek(0)
+    assert sut.readline() == 'head1,head2\n'
+    assert sut.readline() == 'key-1,value-1\n'
+
+    sut.seek(0)
+    assert sut.read() == TEXT
+
+    sut.seek(0)
+    sut.stop_recording()
+    assert list(sut) == TEXT.splitlines(keepends=True)
+    assert not sut.seekable()
+
+def test_can_not_be_rewound_after_recording_is_stopped():
+
+    sut = RewindableStream.of(Pipe(TEXT), None)
+
+    assert sut.readline() == 'head1,head2\n'
+    sut.stop_recording()
+    assert sut.readline() == 'key-1,value-1\n'
+
+    with pytest.raises(io.UnsupportedOperation):
+        sut.seek(0)
+
+def test_seekable_stream_is_not_wrapped():
+
+    stream = io.StringIO(TEXT)
+    assert RewindableStream.of(stream, None) is stream
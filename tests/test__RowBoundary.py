@@ -0,0 +1,135 @@
+import csv
+
+import pytest
+
+from src.csvdiff3.csvdiff import RowBoundary, MatchingKeyCodec, MatchingKeyInfo
+
+
+CSV_TEXT = (
+    'head1,head2,head3\n'
+    'key-1,"value, with comma",plain\n'
+    'key-2,"value with\nline feed",plain\n'
+    'key-3,"value with ""quotes""\nand line feed",plain\n'
+    'key-4,plain,plain\n'
+)
+
+
+@pytest.fixture(scope='function')
+def boundary(tmpdir):
+
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(CSV_TEXT.encode('utf8'))
+
+    dialect = csv.excel()
+    return RowBoundary(csv_file.strpath, 'utf8', dialect, True, MatchingKeyCodec([MatchingKeyInfo('0')]))
+
+
+def row_starts():
+    return [CSV_TEXT.index(key) for key in ('key-1', 'key-2', 'key-3', 'key-4')]
+
+
+def test_records_from_data_start(boundary):
+
+    assert boundary.data_start == row_starts()[0]
+    assert [(start, row) for start, _, row in boundary.records_from(boundary.data_start)] == [
+        (row_starts()[0], ['key-1', 'value, with comma', 'plain']),
+        (row_starts()[1], ['key-2', 'value with\nline feed', 'plain']),
+        (row_starts()[2], ['key-3', 'value with "quotes"\nand line feed', 'plain']),
+        (row_starts()[3], ['key-4', 'plain', 'plain']),
+    ]
+
+@pytest.mark.parametrize('offset', range(len(CSV_TEXT) + 1))
+def test_next_record_start_from_any_offset(boundary, offset):
+    """ Line feeds in quoted fields are not regarded as row ends. """
+
+    expected = min([start for start in row_starts() if start >= offset] + [len(CSV_TEXT)])
+    assert boundary.next_record_start(offset) == expected
+
+@pytest.mark.parametrize('window_size', [4, 64 * 1024])
+@pytest.mark.parametrize('key, expected_row_index', [('..key-0..', 0), ('..key-2..', 1), ('..key-25..', 2), ('..key-4..', 3), ('..key-5..', 4)])
+def test_lower_bound(boundary, monkeypatch, window_size, key, expected_row_index):
+
+    monkeypatch.setattr(RowBoundary, 'WINDOW_SIZE', window_size)
+    monkeypatch.setattr(RowBoundary, 'LINEAR_SEARCH_SIZE', window_size)
+    assert boundary.lower_bound(key) == (row_starts() + [len(CSV_TEXT)])[expected_row_index]
+
+
+def test_record_spans_from_data_start(boundary):
+
+    assert list(boundary.record_spans_from(boundary.data_start)) == list(zip(row_starts(), row_starts()[1:] + [len(CSV_TEXT)]))
+    assert boundary.number_of_records_between(row_starts()[1], row_starts()[3]) == 2
+
+def test_empty_file_is_not_mapped(tmpdir):
+
+    csv_file = tmpdir.join('empty.csv')
+    csv_file.write_binary(b'')
+
+    with RowBoundary(csv_file.strpath, 'utf8', csv.excel(), False, MatchingKeyCodec([MatchingKeyInfo('0')])) as boundary:
+        assert boundary.size == 0
+        assert list(boundary.records_from(0)) == []
+        assert boundary.next_record_start(0) == 0
+
+
+@pytest.mark.parametrize("access", ['random', 'sequential'])
+def test_access_is_advised(tmpdir, monkeypatch, access):
+
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(CSV_TEXT.encode('utf8'))
+
+    advised = []
+    monkeypatch.setattr(RowBoundary, 'advise', lambda self, access, start=0, end=None: advised.append((access, start, end)))
+
+    with RowBoundary(csv_file.strpath, 'utf8', csv.excel(), True, MatchingKeyCodec([MatchingKeyInfo('0')]), access=access) as row_boundary:
+        assert advised == [(access, 0, None)]
+
+        row_boundary.number_of_records_between(row_boundary.data_start, row_boundary.size)
+        assert advised[-1] == ('sequential', row_boundary.data_start, row_boundary.size)
+
+
+def test_advise_on_part_of_the_file(boundary):
+
+    boundary.advise('random')
+    boundary.advise('sequential', row_starts()[1], row_starts()[3])
+    boundary.advise('sequential', boundary.size + 1)
+
+    assert [row for _, _, row in boundary.records_from(boundary.data_start)][3] == ['key-4', 'plain', 'plain']
+
+
+@pytest.mark.parametrize('line_separator', ['\r', '\r\n'])
+@pytest.mark.parametrize('window_size', [4, 64 * 1024])
+def test_rows_end_at_line_separator_other_than_lf(tmpdir, monkeypatch, line_separator, window_size):
+
+    monkeypatch.setattr(RowBoundary, 'WINDOW_SIZE', window_size)
+
+    csv_text = CSV_TEXT.replace('\n', line_separator)
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(csv_text.encode('utf8'))
+
+    with RowBoundary(csv_file.strpath, 'utf8', csv.excel(), True, MatchingKeyCodec([MatchingKeyInfo('0')])) as row_boundary:
+
+        starts = [csv_text.index(key) for key in ('key-1', 'key-2', 'key-3', 'key-4')]
+        assert [(start, row) for start, _, row in row_boundary.records_from(row_boundary.data_start)] == [
+            (starts[0], ['key-1', 'value, with comma', 'plain']),
+            (starts[1], ['key-2', 'value with\nline feed', 'plain']),
+            (starts[2], ['key-3', 'value with "quotes"\nand line feed', 'plain']),
+            (starts[3], ['key-4', 'plain', 'plain']),
+        ]
+        assert [row_boundary.next_record_start(starts[i] - len(line_separator) + 1) for i in (1, 3)] == [starts[1], starts[3]]
+        assert row_boundary.next_record_start(starts[3] + 1) == row_boundary.size
+
+@pytest.mark.parametrize('line_separator', ['\n', '\r', '\r\n'])
+@pytest.mark.parametrize('block_size', [1, 4, 1024 * 1024])
+def test_raw_records_are_split_in_blocks_of_any_size(tmpdir, monkeypatch, line_separator, block_size):
+    """ Rows longer than the block, rows in quotes across the blocks and CRLF across the blocks are split as in a single block. """
+
+    monkeypatch.setattr(RowBoundary, 'RECORDS_BLOCK_SIZE', block_size)
+
+    csv_text = CSV_TEXT.replace('\n', line_separator)
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(csv_text.encode('utf8'))
+
+    with RowBoundary(csv_file.strpath, 'utf8', csv.excel(), True, MatchingKeyCodec([MatchingKeyInfo('0')])) as row_boundary:
+
+        starts = [0] + [csv_text.index(key) for key in ('key-1', 'key-2', 'key-3', 'key-4')] + [len(csv_text)]
+        assert list(row_boundary.raw_records_from(0)) == [(start, end, csv_text[start:end].encode('utf8')) for start, end in zip(starts, starts[1:])]
+        assert [start for start, _, _ in row_boundary.raw_records_from(starts[1], starts[3])] == starts[1:3]
@@ -0,0 +1,100 @@
+import csv
+import os
+
+import pytest
+
+from src.csvdiff3.csvdiff import SparseKeyIndex, CsvReader, MatchingKeyCodec, MatchingKeyInfo
+
+
+CSV_TEXT = (
+    'head1,head2\n'
+    'key-1,"value\nwith line feed"\n'
+    'key-2,value\n'
+    'key-3,value\n'
+    'key-4,value\n'
+    'key-5,value\n'
+)
+
+
+@pytest.fixture(scope='function')
+def csv_path(tmpdir):
+
+    csv_file = tmpdir.join('sorted.csv')
+    csv_file.write_binary(CSV_TEXT.encode('utf8'))
+    return csv_file.strpath
+
+
+def build(csv_path, matching_keys='0', interval=2):
+    return SparseKeyIndex.build(csv_path, 'utf8', csv.excel(), True, MatchingKeyCodec(list(map(MatchingKeyInfo, matching_keys.split(',')))), interval)
+
+def load(csv_path, matching_keys='0'):
+    return SparseKeyIndex.load(csv_path, 'utf8', csv.excel(), True, MatchingKeyCodec(list(map(MatchingKeyInfo, matching_keys.split(',')))))
+
+
+def test_build_records_every_nth_row(csv_path):
+
+    sut = build(csv_path)
+
+    assert os.path.isfile(csv_path + SparseKeyIndex.SUFFIX)
+    assert sut.managed_keys == ['..key-1..', '..key-3..', '..key-5..']
+    assert sut.row_numbers == [2, 4, 6]
+    assert sut.offsets == [CSV_TEXT.index('key-1'), CSV_TEXT.index('key-3'), CSV_TEXT.index('key-5')]
+
+def test_load_returns_the_built_index(csv_path):
+
+    build(csv_path)
+    sut = load(csv_path)
+
+    assert sut.managed_keys == ['..key-1..', '..key-3..', '..key-5..']
+    assert sut.row_numbers == [2, 4, 6]
+
+def test_load_with_typed_keys(tmpdir):
+
+    csv_file = tmpdir.join('typed.csv')
+    csv_file.write('head1,head2\n9,a\n10,b\n11,c\n')
+
+    build(csv_file.strpath, matching_keys='0:int', interval=1)
+    sut = load(csv_file.strpath, matching_keys='0:int')
+
+    assert sut.managed_keys == [(9,), (10,), (11,)]
+
+def test_load_misses_without_index(csv_path):
+    assert load(csv_path) is None
+
+def test_load_misses_with_other_matching_keys(csv_path):
+
+    build(csv_path)
+    assert load(csv_path, matching_keys='1') is None
+
+def test_load_misses_after_the_file_changed(csv_path):
+
+    build(csv_path)
+    with open(csv_path, mode='a', encoding='utf8') as csv_file:
+        csv_file.write('key-6,value\n')
+
+    assert load(csv_path) is None
+
+@pytest.mark.parametrize('key, expected', [('..key-1..', None), ('..key-2..', (2, 'key-1')), ('..key-3..', (2, 'key-1')), ('..key-4..', (4, 'key-3')), ('..key-9..', (6, 'key-5'))])
+def test_entry_before(csv_path, key, expected):
+
+    if expected is None:
+        assert build(csv_path).entry_before(key) is None
+    else:
+        row_number, key_at_offset = expected
+        assert build(csv_path).entry_before(key) == (row_number, CSV_TEXT.index(key_at_offset))
+
+def test_state_opens_at_indexed_offset(csv_path):
+
+    row_number, offset = build(csv_path).entry_before('..key-4..')
+
+    with open(csv_path, mode='r', encoding='utf8') as csv_file:
+        sut = CsvReader.State(csv_file, csv.excel(), 'sorted.csv', True)
+        sut.open_at(offset, row_number)
+
+        assert not sut.is_at_header
+        assert next(sut.csv_reader) == ['key-3', 'value']
+        sut.increment_row_number()
+        assert sut.row_number == 4
+
+        sut.reset()
+        assert next(sut.csv_reader) == ['key-3', 'value']
@@ -0,0 +1,26 @@
+import pytest
+
+from src.csvdiff3.csvdiff import UnicodeSupport
+
+
+@pytest.mark.parametrize(
+    "text, expected_length",
+    [
+        pytest.param('',                                  0,  id='empty'),
+        pytest.param("['key1', 'value1']",                18, id='ascii'),
+        pytest.param('キー1',                              5,  id='wide'),
+        pytest.param('ｷｰ1',                               3,  id='halfwidth'),
+        pytest.param('α',                                 2,  id='ambiguous'),
+        pytest.param('ć',                                 1,  id='neutral'),
+        pytest.param("['key1', '値1', 'ｱ']",              20, id='mixed'),
+    ],
+)
+def test_string_length_considering_east_asian_characters(text, expected_length):
+    assert UnicodeSupport.string_length_considering_east_asian_characters_of(text) == expected_length
+
+
+def test_justification():
+
+    assert UnicodeSupport.left_justified('値1', 5) == '値1  '
+    assert UnicodeSupport.left_justified('値1', 5, width=3) == '値1  '
+    assert UnicodeSupport.right_justified('値1', 5) == '  値1'
@@ -1,6 +1,6 @@
 import pytest
 
-from src.csvdiff3.csvdiff import ValueDifferenceDetector
+from src.csvdiff3.csvdiff import ValueDifferenceDetector, LhsFact, RhsFact
 
 
 class Condition:
@@ -65,3 +65,52 @@ def test_value_difference_detector(condition, expected):
 
 
 
+
+
+@pytest.mark.parametrize(
+    "compares_raw_records, lhs_raw_record, rhs_raw_record, expected_different_column_indices",
+    [
+        pytest.param(True,  'key-1,value-1,value-2\n', 'key-1,value-1,value-2\n', [],     id='same raw records : columns are not compared'),
+        pytest.param(True,  'key-1,value-1,value-2\n', 'key-1,value-1,value-3\n', [2],    id='different raw records : columns are compared'),
+        pytest.param(True,  None,                       None,                       [2],    id='raw records not kept : columns are compared'),
+        pytest.param(False, 'key-1,value-1,value-2\n', 'key-1,value-1,value-2\n', [2],    id='raw records not comparable : columns are compared'),
+    ],
+)
+def test_value_difference_detector_with_raw_records(compares_raw_records, lhs_raw_record, rhs_raw_record, expected_different_column_indices):
+    """ Rows are made different from the raw records on purpose, to tell whether the columns are compared. """
+
+    sut = ValueDifferenceDetector(number_of_columns=3, matching_key_indices=[0], ignore_column_indices=[], compares_raw_records=compares_raw_records)
+
+    actual = sut.detect_difference_between_facts(LhsFact(2, ['key-1', 'value-1', 'value-2'], '..key-1..', lhs_raw_record),
+                                                 RhsFact(2, ['key-1', 'value-1', 'value-x'], '..key-1..', rhs_raw_record))
+
+    assert actual.different_column_indices == expected_different_column_indices
+
+def test_value_difference_detector_with_same_raw_records_lacking_columns():
+
+    sut = ValueDifferenceDetector(number_of_columns=3, matching_key_indices=[0], ignore_column_indices=[], compares_raw_records=True)
+
+    with pytest.raises(IndexError):
+        sut.detect_difference_between_facts(LhsFact(2, ['key-1', 'value-1'], '..key-1..', 'key-1,value-1\n'),
+                                            RhsFact(2, ['key-1', 'value-1'], '..key-1..', 'key-1,value-1\n'))
+
+def test_value_difference_detector_compares_target_columns_in_sorted_order():
+
+    sut = ValueDifferenceDetector(number_of_columns=12, matching_key_indices=[11, 0], ignore_column_indices=[5])
+
+    assert sut.target_column_indices == (1, 2, 3, 4, 6, 7, 8, 9, 10)
+
+    lhs = [str(i) for i in range(12)]
+    rhs = [str(i) for i in range(12)]
+    rhs[10], rhs[2], rhs[5] = 'x', 'x', 'x'
+    assert sut.detect_difference_between(lhs, rhs).different_column_indices == [2, 10]
+
+def test_value_difference_detector_allocates_no_result_for_same_rows():
+
+    sut = ValueDifferenceDetector(number_of_columns=3, matching_key_indices=[0], ignore_column_indices=[])
+    assert sut.detect_difference_between(['key-1', 'value-1', 'value-2'], ['key-1', 'value-1', 'value-2']) is ValueDifferenceDetector.NO_DIFFERENCE
+
+def test_value_difference_detector_without_target_columns():
+
+    sut = ValueDifferenceDetector(number_of_columns=2, matching_key_indices=[0], ignore_column_indices=[1])
+    assert not sut.detect_difference_between(['key-1', 'value-1'], ['key-1', 'value-x']).has_difference
@@ -42,4 +42,34 @@ def test_show_number_of_cases(lhs, rhs, capfd):
     ''')
 
 
+def test_show_number_of_cases_without_row_numbers(lhs, rhs, capfd):
 
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        1, value1-1, value2-1
+        2, value1-2, value2-2
+        3, value1-3, value2-3
+        4, value1-4, value2-4
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        1, value1-1, value2-1
+        2, value1-e, value2-2
+        4, value1-4, value2-e
+        5, value1-5, value2-5
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0', '--without-row-numbers']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''
+        ============ Report ============
+
+        ● Count & Row number
+        same lines           : 1
+        left side only    (<): 1
+        right side only   (>): 1
+        with differences  (!): 2
+    ''')
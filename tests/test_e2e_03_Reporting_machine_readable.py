@@ -0,0 +1,89 @@
+import sys
+import textwrap
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+LHS_TEXT = textwrap.dedent('''
+    head1, head2, head3, head4
+    key1-2, value1-2, key2-2, "value2-2, with comma"
+    key1-3, value1-3, key2-3, value2-3
+    key1-4, value1-4, key2-4, value2-4
+    key1-5, value1-5, key2-5, value2-5
+''').strip()
+
+RHS_TEXT = textwrap.dedent('''
+    head1, head2, head3, head4
+    key1-1, value1-1, key2-1, value2-1
+    key1-2, value1-3, key2-2, value2-z
+    key1-4, value1-4, key2-4, value2-4
+    key1-5, 値1-v, key2-5, value2-5
+''').strip()
+
+
+@pytest.fixture(autouse=True)
+def without_deep_pre_scanning(monkeypatch):
+    """ There is nothing to pad, so the rows need not be measured in advance. """
+
+    def fail(*_):
+        raise AssertionError('scanned deeply')
+
+    monkeypatch.setattr(csvdiff.PreScanner, '_scan_deeply', fail)
+
+
+def test_jsonl_reports_the_lines_with_difference(lhs, rhs, capfd):
+
+    lhs.write(LHS_TEXT)
+    rhs.write(RHS_TEXT)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0,2', '--output-format', 'jsonl']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''\
+        {"kind": ">", "lhs_row_number": null, "rhs_row_number": 2, "key": ["key1-1", "key2-1"], "different_column_indices": []}
+        {"kind": "!", "lhs_row_number": 2, "rhs_row_number": 3, "key": ["key1-2", "key2-2"], "different_column_indices": [1, 3]}
+        {"kind": "<", "lhs_row_number": 3, "rhs_row_number": null, "key": ["key1-3", "key2-3"], "different_column_indices": []}
+        {"kind": "!", "lhs_row_number": 5, "rhs_row_number": 5, "key": ["key1-5", "key2-5"], "different_column_indices": [1]}
+    ''')
+
+
+def test_jsonl_reports_all_lines(lhs, rhs, capfd):
+
+    lhs.write(LHS_TEXT)
+    rhs.write(RHS_TEXT)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0,2', '-ac', '--output-format', 'jsonl']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''\
+        {"kind": ">", "lhs_row_number": null, "rhs_row_number": 2, "key": ["key1-1", "key2-1"], "different_column_indices": []}
+        {"kind": "!", "lhs_row_number": 2, "rhs_row_number": 3, "key": ["key1-2", "key2-2"], "different_column_indices": [1, 3]}
+        {"kind": "<", "lhs_row_number": 3, "rhs_row_number": null, "key": ["key1-3", "key2-3"], "different_column_indices": []}
+        {"kind": "=", "lhs_row_number": 4, "rhs_row_number": 4, "key": ["key1-4", "key2-4"], "different_column_indices": []}
+        {"kind": "!", "lhs_row_number": 5, "rhs_row_number": 5, "key": ["key1-5", "key2-5"], "different_column_indices": [1]}
+    ''')
+
+
+def test_csv_reports_the_lines_with_difference(lhs, rhs, capfd):
+
+    lhs.write(LHS_TEXT)
+    rhs.write(RHS_TEXT)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0,2', '-dv', '--output-format', 'csv']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''\
+        kind,lhs_row_number,rhs_row_number,key0,key2,different_column_indices
+        >,,2,key1-1,key2-1,
+        !,2,3,key1-2,key2-2,1 3
+        <,3,,key1-3,key2-3,
+        !,5,5,key1-5,key2-5,1
+    ''')
@@ -0,0 +1,72 @@
+import bz2
+import gzip
+import lzma
+import os.path
+import sys
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+TEST_DATA_DIR = 'data/e2e_04_file_encoding'
+
+COMPRESSIONS = [
+    pytest.param(gzip.compress, id='gzip'),
+    pytest.param(bz2.compress,  id='bzip2'),
+    pytest.param(lzma.compress, id='xz'),
+]
+
+
+def write_as(compress, source_path, destination):
+    with open(source_path, mode='rb') as source:
+        destination.write_binary(compress(source.read()))
+
+
+@pytest.mark.parametrize('compress', COMPRESSIONS)
+@pytest.mark.parametrize('report_option', ['-ac', '-dv', '-c'])
+def test_compressed_files_are_reported_the_same_as_decompressed_ones(path_to_tests_dir, tmpdir, capfd, compress, report_option):
+    """ Only the left-hand side is compressed as well, to be compared with a plain file. """
+
+    lhs_source = os.path.join(path_to_tests_dir, TEST_DATA_DIR, 'left_Shift_JIS.csv')
+    rhs_source = os.path.join(path_to_tests_dir, TEST_DATA_DIR, 'right_Shift_JIS.csv')
+
+    sys.argv = ['csvdiff.py', lhs_source, rhs_source, report_option, '-e', 'Shift_JIS']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    both_dir = tmpdir.mkdir('both')
+    write_as(compress, lhs_source, both_dir.join('left_Shift_JIS.csv'))
+    write_as(compress, rhs_source, both_dir.join('right_Shift_JIS.csv'))
+
+    lhs_only_dir = tmpdir.mkdir('lhs_only')
+    write_as(compress, lhs_source, lhs_only_dir.join('left_Shift_JIS.csv'))
+
+    for lhs_csv, rhs_csv in [(both_dir.join('left_Shift_JIS.csv').strpath, both_dir.join('right_Shift_JIS.csv').strpath),
+                             (lhs_only_dir.join('left_Shift_JIS.csv').strpath, rhs_source)]:
+
+        sys.argv = ['csvdiff.py', lhs_csv, rhs_csv, report_option, '-e', 'Shift_JIS']
+        csvdiff.main()
+
+        out, err = capfd.readouterr()
+        assert err == ''
+        assert out == expected
+
+
+def test_compressed_file_is_not_available_with_key_range(path_to_tests_dir, tmpdir, capfd):
+
+    lhs_source = os.path.join(path_to_tests_dir, TEST_DATA_DIR, 'left_UTF-8.csv')
+    rhs_source = os.path.join(path_to_tests_dir, TEST_DATA_DIR, 'right_UTF-8.csv')
+
+    lhs_csv = tmpdir.join('left_UTF-8.csv.gz')
+    write_as(gzip.compress, lhs_source, lhs_csv)
+
+    sys.argv = ['csvdiff.py', lhs_csv.strpath, rhs_source, '-d', '--key-from', '3']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    out, err = capfd.readouterr()
+    assert str(err).find('are not available for compressed CSV files nor pipes.') > 0
+    assert out == ''
@@ -2,6 +2,8 @@ import os.path
 import sys
 import textwrap
 
+import pytest
+
 from src.csvdiff3 import csvdiff
 
 
@@ -107,3 +109,89 @@ def test_file_encoding_euc_jp(path_to_tests_dir, capfd):
 
 
 
+
+
+@pytest.mark.parametrize('encoding, file_suffix', [('utf8', 'UTF-8'), ('Shift_JIS', 'Shift_JIS'), ('EUC-JP', 'EUC-JP')])
+@pytest.mark.parametrize('report_options', [['-ac'], ['-dc'], ['-dv'], ['-c'], ['-a', '--single-pass']])
+def test_file_encoding_compared_on_bytes(path_to_tests_dir, capfd, encoding, file_suffix, report_options):
+    """ Only the rows to be reported are decoded, and they are reported the same as those decoded on reading. """
+
+    lhs_csv = os.path.join(path_to_tests_dir, TEST_DATA_DIR, f'left_{file_suffix}.csv')
+    rhs_csv = os.path.join(path_to_tests_dir, TEST_DATA_DIR, f'right_{file_suffix}.csv')
+
+    sys.argv = ['csvdiff.py', lhs_csv, rhs_csv, '-e', encoding] + report_options
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs_csv, rhs_csv, '-e', encoding, '--compare-bytes'] + report_options
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+
+@pytest.mark.parametrize('encoding_options', [
+    pytest.param(['--encoding-for-lhs', 'Shift_JIS', '--encoding-for-rhs', 'EUC-JP'], id='different encodings'),
+    pytest.param(['-e', 'utf-16'],                                                     id='not ASCII compatible'),
+    pytest.param(['-e', 'iso2022_jp'],                                                 id='stateful'),
+])
+def test_file_encoding_not_to_be_compared_on_bytes(path_to_tests_dir, capfd, encoding_options):
+
+    lhs_csv = os.path.join(path_to_tests_dir, TEST_DATA_DIR, 'left_Shift_JIS.csv')
+    rhs_csv = os.path.join(path_to_tests_dir, TEST_DATA_DIR, 'right_EUC-JP.csv')
+
+    sys.argv = ['csvdiff.py', lhs_csv, rhs_csv, '-d', '--compare-bytes'] + encoding_options
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    out, err = capfd.readouterr()
+    assert str(err).find('--compare-bytes is available only when both sides are in the same ASCII compatible encoding.') > 0
+    assert out == ''
+
+
+def test_file_encoding_compared_on_bytes_with_key_range(lhs, rhs, capfd):
+    """ Non-ASCII key bounds are converted as the rows read on their bytes are. """
+
+    def sorted_csv_bytes(values):
+        lines = ['head1, head2'] + [f'{key}, {value}' for key, value in values]
+        return '\n'.join(lines).encode('shift_jis')
+
+    keys = sorted(['あ', 'い', 'う', 'え', 'お'], key=lambda key: key.encode('shift_jis'))
+    lhs.write_binary(sorted_csv_bytes([(key, 'value') for key in keys]))
+    rhs.write_binary(sorted_csv_bytes([(key, 'value' if key != 'う' else 'changed') for key in keys]))
+
+    key_range = ['--key-from', 'い', '--key-to', 'え']
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-e', 'shift_jis', '-c'] + key_range
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+    assert 'same lines           : 2' in expected
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-e', 'shift_jis', '-c', '--compare-bytes'] + key_range
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+
+def test_file_encoding_compared_on_bytes_with_pre_scan_cache(lhs, rhs, capfd):
+    """ The widths measured in a text encoding are not reused for another one. """
+
+    lhs.write_binary('head1, head2\nkey1, 値1\nkey2, 値2\n'.encode('utf8'))
+    rhs.write_binary('head1, head2\nkey1, 値1\nkey2, 値e\n'.encode('utf8'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-a', '-e', 'latin-1', '--compare-bytes']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    for encoding in ('utf8', 'latin-1'):
+        sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-a', '-e', encoding, '--compare-bytes', '--pre-scan-cache']
+        csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out.endswith(expected)
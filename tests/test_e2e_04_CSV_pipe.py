@@ -0,0 +1,63 @@
+import os
+import sys
+import textwrap
+import threading
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+from src.csvdiff3.csvdiff import RewindableStream
+
+
+LHS_TEXT = textwrap.dedent('''
+    head1, head2, head3
+    key1-1, value1-1, value2-1
+    key1-2, "value1-2
+    with line feed", value2-2
+    key1-4, value1-4, value2-4
+''').strip()
+
+RHS_TEXT = textwrap.dedent('''
+    head1, head2, head3
+    key1-1, value1-1, value2-1
+    key1-2, "value1-2
+    with line feed", value2-e
+    key1-3, value1-3, value2-3
+''').strip()
+
+
+def pipe_of(text, tmpdir, name):
+    """ A named pipe written by another thread, as process substitution like <(zcat file.gz) gives. """
+
+    pipe_path = tmpdir.join(name).strpath
+    os.mkfifo(pipe_path)
+
+    def write():
+        with open(pipe_path, mode='w') as pipe:
+            pipe.write(text)
+
+    threading.Thread(target=write, daemon=True).start()
+    return pipe_path
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='named pipes are not available')
+@pytest.mark.parametrize('memory_limit', [8, 1024 * 1024])
+@pytest.mark.parametrize('report_option', ['-ac', '-dv', '-c'])
+def test_pipes_are_reported_the_same_as_files(lhs, rhs, tmpdir, capfd, monkeypatch, memory_limit, report_option):
+    """ A small memory limit spills the record of the pipes to temporary files. """
+
+    lhs.write(LHS_TEXT)
+    rhs.write(RHS_TEXT)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option]
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    monkeypatch.setattr(RewindableStream, 'MEMORY_LIMIT', memory_limit)
+    pipe_dir = tmpdir.mkdir('pipes')
+    sys.argv = ['csvdiff.py', pipe_of(LHS_TEXT, pipe_dir, 'left.csv'), pipe_of(RHS_TEXT, pipe_dir, 'right.csv'), report_option]
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
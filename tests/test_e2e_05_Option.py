@@ -1,3 +1,4 @@
+import os
 import sys
 import textwrap
 
@@ -92,3 +93,424 @@ def test_option_u_specified(lhs, rhs, capfd):
 
 
 
+@pytest.mark.parametrize('report_option', ['-d', '-a', '-dc'])
+def test_option_single_pass_reports_the_same_as_pre_scanning(lhs, rhs, capfd, report_option):
+    """ The single-pass horizontal report lays out the same report without pre-scanning the whole files. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3, head4, head5, head6
+        0001, value1-2, key2-2, 1002, 20210921T035902, value4-2
+        0001, value1-3, key2-3, 1003, 20210921T035904, value4-3
+        0102, value1-4, key2-1, 1004, 20210924T180521, value4-e
+        1003, value1-5, key2-1, 1005, 20210924T180528, value4-5
+        1003, 値1-6, key2-2, 1006, 20210923T143259, value4-6
+        1003, value1-7, key2-3, 1007, 20210923T143258, value4-7
+        1003, value1-e, key2-4, 1008, 20210923T143259, value4-8
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3, head4, head5, head6
+        0001, value1-1, key2-1, 1001, 20210921T035901, value4-1
+        0001, value1-2, key2-2, 1002, 20210921T035902, value4-2
+        0001, value1-3, key2-3, 1003, 20210921T035903, value4-3
+        0102, value1-4e, key2-1, 1044, 20210924T180529, value4-4
+        1003, 値1-6, key2-2, 1006, 20210923T143259, value4-6
+        1003, value1-8, key2-4, 1008, 20210923T143257, value4-e
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0,2', report_option]
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0,2', report_option, '--single-pass']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+def test_option_pre_scan_cache(lhs, rhs, capfd):
+    """ The pre-scanning result is reused while the file is unchanged, and is discarded once the file changes. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-2, value2-2
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-e, value2-2
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-d']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-d', '--pre-scan-cache']
+    csvdiff.main()
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected * 2
+    assert os.path.isfile(lhs.strpath + '.csvdiff3-prescan')
+    assert os.path.isfile(rhs.strpath + '.csvdiff3-prescan')
+
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-e, value2-2
+        key1-3, value1-3-with-longer-value, value2-3
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-d']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-d', '--pre-scan-cache']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+@pytest.mark.parametrize('report_option', ['-d', '-a'])
+def test_option_parallel_pre_scan_reports_the_same_as_sequential_pre_scan(lhs, rhs, capfd, report_option):
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-2, value2-2
+        key1-4, 値1-4, value2-4
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-e, value2-2
+        key1-3, value1-3-with-longer-value, value2-3
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option]
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option, '--parallel-pre-scan']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+def test_option_parallel_pre_scan_detects_not_unique_key_in_worker(lhs, rhs, capfd):
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-1, value1-2, value2-2
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-du', '--parallel-pre-scan']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    out, err = capfd.readouterr()
+    assert str(err).find('are not unique.') > 0
+    assert out == ''
+
+def test_option_k_with_types(lhs, rhs, capfd):
+    """ Typed matching keys are compared as the type, so numbers need no zero padding nor its max size. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        2, 2021-09-21, value1-1
+        12, 2021-09-21, value1-2
+        12, 2021-10-01, value1-3
+        103, 2021-09-21, value1-4
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        2, 2021-09-21, value1-1
+        12, 2021-10-01, value1-e
+        103, 2021-09-21, value1-4
+        1004, 2021-09-21, value1-5
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0:int,1:date']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''
+        ============ Report ============
+
+        ● Count & Row number
+        same lines           : 2
+        left side only    (<): 1 :-- Row Numbers      -->: [3]
+        right side only   (>): 1 :-- Row Numbers      -->: [5]
+        with differences  (!): 1 :-- Row Number Pairs -->: [(4, 3)]
+    ''')
+
+def test_option_k_with_type_not_convertible(lhs, rhs, capfd):
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        2, value1-1, value2-1
+        x12, value1-2, value2-2
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        2, value1-1, value2-1
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0:int']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('can not be converted into the specified type') > 0
+
+
+def test_option_log_level_and_log_file(lhs, rhs, capfd, tmpdir, monkeypatch):
+    """ No log file is written by default. With --log-file, the log of the specified level is written to it as well. """
+
+    monkeypatch.chdir(tmpdir)
+
+    lhs.write('head1, head2\nkey1-1, value1-1\n')
+    rhs.write('head1, head2\nkey1-1, value1-e\n')
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-c']
+    csvdiff.main()
+
+    _, err = capfd.readouterr()
+    assert err == ''
+    assert tmpdir.listdir(lambda path: path.ext == '.log') == []
+
+    log_file = tmpdir.join('debug.log')
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-c', '--log-level', 'DEBUG', '--log-file', log_file.strpath]
+    csvdiff.main()
+    csvdiff.configure()
+
+    _, err = capfd.readouterr()
+    assert 'DEBUG: matching_engine=sort-merge' in err
+    assert 'DEBUG: matching_engine=sort-merge' in log_file.read()
+
+@pytest.mark.parametrize('report_option', ['-d', '-a', '-dv', '-c'])
+def test_option_read_ahead_reports_the_same_as_reading_on_the_matching_thread(lhs, rhs, capfd, report_option):
+    """ Batches of 2 rows, so that rows are handed over across batches. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-2, value2-2
+        key1-4, value1-4, value2-4
+        key1-5, value1-5, value2-5
+        key1-6, value1-6, value2-6
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-e, value2-2
+        key1-3, value1-3, value2-3
+        key1-6, value1-6, value2-e
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option]
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option, '--read-ahead', '2']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+def test_option_read_ahead_detects_not_sorted_key_on_background_thread(lhs, rhs, capfd):
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-3, value1-3, value2-3
+        key1-2, value1-2, value2-2
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dv', '--read-ahead', '1']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('are not sorted.') > 0
+
+@pytest.mark.parametrize('report_option', ['-d', '-a', '-dv', '-c'])
+def test_option_parse_processes_reports_the_same_as_parsing_on_the_matching_process(lhs, rhs, capfd, monkeypatch, report_option):
+    """ Chunks of 1 byte are extended to the ends of rows, so that each row is a chunk. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, "value1-2
+        with line feed", value2-2
+        key1-4, value1-4, value2-4
+        key1-5, value1-5, value2-5
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, "value1-2
+        with line feed", value2-e
+        key1-3, value1-3, value2-3
+        key1-5, value1-5, value2-5
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option]
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    monkeypatch.setattr(csvdiff.CsvReader.ChunkParsedState, 'CHUNK_SIZE', 1)
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, report_option, '--parse-processes', '2']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+@pytest.mark.parametrize('line_separator', ['\r', '\r\n'])
+def test_option_parse_processes_with_line_separator_other_than_lf(lhs, rhs, capfd, monkeypatch, line_separator):
+    """ Chunks are extended to the line ends of universal newlines, as the rows read on the matching process are. """
+
+    lhs.write_binary('head1, head2\nkey1-1, value1-1\nkey1-2, "value1-2\nwith line feed"\nkey1-3, value1-3\n'.replace('\n', line_separator).encode('utf8'))
+    rhs.write_binary('head1, head2\nkey1-1, value1-1\nkey1-2, "value1-2\nwith line feed"\nkey1-3, value1-e\n'.replace('\n', line_separator).encode('utf8'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dc']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+    assert 'same lines           : 2' in expected
+
+    monkeypatch.setattr(csvdiff.CsvReader.ChunkParsedState, 'CHUNK_SIZE', 1)
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dc', '--parse-processes', '2']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+@pytest.mark.parametrize('parse_options', [[], ['--parse-processes', '2']])
+def test_option_parse_processes_reports_csv_error_without_traceback(lhs, rhs, capfd, parse_options):
+
+    lhs.write('head1, head2\nkey1-1, value1-1\nkey1-2, ' + 'v' * (1024 * 1024) + '\n')
+    rhs.write('head1, head2\nkey1-1, value1-1\n')
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-H', 'y'] + parse_options
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('The CSV data could not be parsed.') > 0
+    assert 'Traceback' not in err
+
+MEMORY_MAP_LHS_TEXT = (
+    'head1,head2,head3\n'
+    'key1-1,value1-1,value2-1\n'
+    'key1-2,"value1-2\nwith line feed",value2-2\n'
+    'key1-4,value1-4,value2-4\n'
+    'key1-5,value1-5,value2-5\n'
+    'key1-6,値1-6,value2-6\n'
+)
+MEMORY_MAP_RHS_TEXT = (
+    'head1,head2,head3\n'
+    'key1-1,value1-1,value2-1\n'
+    'key1-2,"value1-2\nwith line feed",value2-e\n'
+    'key1-3,value1-3,value2-3\n'
+    'key1-5,value1-5,value2-5\n'
+    'key1-6,値1-6,value2-e\n'
+)
+
+@pytest.mark.parametrize('other_options', [['-d'], ['-a'], ['-dv'], ['-c'], ['-dc', '--matching-engine', 'hash-join'], ['-ac', '--key-from', 'key1-2', '--key-to', 'key1-5']])
+@pytest.mark.parametrize('line_separator', ['\n', '\r', '\r\n'])
+def test_option_memory_map_reports_the_same_as_reading_text_streams(lhs, rhs, capfd, other_options, line_separator):
+
+    lhs.write_binary(MEMORY_MAP_LHS_TEXT.replace('\n', line_separator).encode('utf8'))
+    rhs.write_binary(MEMORY_MAP_RHS_TEXT.replace('\n', line_separator).encode('utf8'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-H', 'y'] + other_options
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+    assert 'Report' in expected
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-H', 'y', '--memory-map'] + other_options
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+@pytest.mark.parametrize('memory_map_options', [[], ['--memory-map']])
+def test_option_memory_map_detects_rows_lacking_columns_in_the_same_raw_records(lhs, rhs, capfd, memory_map_options):
+
+    lhs.write('head1,head2,head3\nkey1-1,value1-1,value2-1\nkey1-2,value1-2\n')
+    rhs.write('head1,head2,head3\nkey1-1,value1-1,value2-1\nkey1-2,value1-2\n')
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-H', 'y', '-c'] + memory_map_options
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('the number of columns in the row is not aligned') > 0
+
+def test_option_memory_map_in_different_encodings(lhs, rhs, capfd):
+    """ The same bytes in different encodings are not the same text, so the rows are compared on their values. """
+
+    lhs.write_binary('head1,head2\nkey1-1,\u00e9\n'.encode('latin-1'))
+    rhs.write_binary('head1,head2\nkey1-1,\u00e9\n'.encode('utf8'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-H', 'y', '-c', '--encoding-for-lhs', 'latin-1', '--encoding-for-rhs', 'utf8', '--memory-map']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert 'same lines           : 1' in out
+
+def test_option_output_file(lhs, rhs, capfd, tmpdir):
+    """ The report is written to the file in UTF-8, instead of the standard output. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, 値1-1, value2-1
+        key1-2, value1-2, value2-2
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, 値1-1, value2-e
+        key1-3, value1-3, value2-3
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-ac']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    output_file = tmpdir.join('report.txt')
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-ac', '--output-file', output_file.strpath, '--flush-interval', '0.001']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == ''
+    assert output_file.read_binary().decode('utf-8') == expected
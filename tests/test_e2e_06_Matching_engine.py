@@ -0,0 +1,188 @@
+import sys
+import textwrap
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+@pytest.mark.parametrize('spills_every_row', [False, True])
+def test_external_sort_with_unsorted_files(lhs, rhs, capfd, monkeypatch, spills_every_row):
+    """ Unsorted files are sorted by the matching keys in advance. The row numbers are those of the original files. """
+
+    if spills_every_row:
+        monkeypatch.setattr(csvdiff.ExternalSorter, 'OVERHEAD_PER_COLUMN', 1024 * 1024)
+        monkeypatch.setattr(csvdiff.ExternalSorter, 'MERGE_FAN_IN', 2)
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3, head4
+        1003, value1-5, key2-1, 1005
+        1, value1-3, key2-3, 1003
+        1003, value1-7, key2-3, 1007
+        102, value1-4, key2-1, 1004
+        1, value1-2, key2-2, 1002
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3, head4
+        102, value1-4e, key2-1, 1044
+        1, value1-2, key2-2, 1002
+        1, value1-1, key2-1, 1001
+        1, value1-3, key2-3, 1033
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0:4,2', '-dc', '--matching-engine', 'external-sort', '--sort-memory-budget', '1']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''
+        ============ Report ============
+
+        ● Differences
+        -----------------------------------------------------------------------------------------------------------------------
+        left.csv                                     right.csv                                   Column indices with difference
+        -----------------------------------------------------------------------------------------------------------------------
+                                                  >  4 ['1', 'value1-1', 'key2-1', '1001']   
+        3 ['1', 'value1-3', 'key2-3', '1003']     !  5 ['1', 'value1-3', 'key2-3', '1033']     @ [3]
+        5 ['102', 'value1-4', 'key2-1', '1004']   !  2 ['102', 'value1-4e', 'key2-1', '1044']  @ [1, 3]
+        2 ['1003', 'value1-5', 'key2-1', '1005']  <  
+        4 ['1003', 'value1-7', 'key2-3', '1007']  <  
+
+        ● Count & Row number
+        same lines           : 1
+        left side only    (<): 2 :-- Row Numbers      -->: [2, 4]
+        right side only   (>): 1 :-- Row Numbers      -->: [4]
+        with differences  (!): 2 :-- Row Number Pairs -->: [(3, 5), (5, 2)]
+    ''')
+
+@pytest.mark.parametrize('memory_budget', ['0', '-1'])
+def test_external_sort_with_invalid_memory_budget(lhs, rhs, capfd, memory_budget):
+
+    lhs.write('head1, head2\nkey1-1, value1-1\n')
+    rhs.write('head1, head2\nkey1-1, value1-1\n')
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '--matching-engine', 'external-sort', '--sort-memory-budget', memory_budget]
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('--sort-memory-budget should be 1 or more.') > 0
+
+def test_external_sort_detects_not_unique_key(lhs, rhs, capfd):
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-2, value1-2, value2-2
+        key1-1, value1-1, value2-1
+        key1-2, value1-3, value2-3
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-du', '--matching-engine', 'external-sort']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find("are not unique. [current_key=['key1-2'], previous_key=['key1-2']") > 0
+
+@pytest.mark.parametrize('lhs_tail', ['', '\n1, value1-9, key2-9, 1009, with a long tail to make the left side larger'])
+def test_hash_join_with_unsorted_files(lhs, rhs, capfd, lhs_tail):
+    """ Regardless of which side is kept in memory, the same facts are called back. """
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3, head4
+        1003, value1-5, key2-1, 1005
+        1, value1-3, key2-3, 1003
+        1003, value1-7, key2-3, 1007
+        102, value1-4, key2-1, 1004
+        1, value1-2, key2-2, 1002
+    ''').strip() + lhs_tail)
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3, head4
+        102, value1-4e, key2-1, 1044
+        1, value1-2, key2-2, 1002
+        1, value1-1, key2-1, 1001
+        1, value1-3, key2-3, 1033
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0,2', '-c', '--matching-engine', 'hash-join']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    if lhs_tail:
+        assert out == textwrap.dedent('''
+            ============ Report ============
+
+            ● Count & Row number
+            same lines           : 1
+            left side only    (<): 3 :-- Row Numbers      -->: [2, 4, 7]
+            right side only   (>): 1 :-- Row Numbers      -->: [4]
+            with differences  (!): 2 :-- Row Number Pairs -->: [(3, 5), (5, 2)]
+        ''')
+    else:
+        assert out == textwrap.dedent('''
+            ============ Report ============
+
+            ● Count & Row number
+            same lines           : 1
+            left side only    (<): 2 :-- Row Numbers      -->: [2, 4]
+            right side only   (>): 1 :-- Row Numbers      -->: [4]
+            with differences  (!): 2 :-- Row Number Pairs -->: [(3, 5), (5, 2)]
+        ''')
+
+def test_hash_join_detects_not_unique_key(lhs, rhs, capfd):
+
+    lhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-2, value1-2, value2-2
+        key1-1, value1-1, value2-1
+        key1-2, value1-3, value2-3
+    ''').strip())
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        key1-1, value1-1, value2-1
+        key1-2, value1-2, value2-2
+        key1-3, value1-3, value2-3
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-cu', '--matching-engine', 'hash-join']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find("are not unique. [current_key=['key1-2']") > 0
+
+
+@pytest.mark.parametrize('other_options', [['-d'], ['-a'], ['-dv'], ['-c'], ['-ac', '--key-from', 'key-2', '--key-to', 'key-5']])
+def test_sort_merge_reports_wide_rows_the_same_with_rows_deferred(lhs, rhs, capfd, monkeypatch, other_options):
+    """ The rows as wide as to be deferred are split only when their raw records differ, or to be reported. """
+
+    def row_of(key, *values):
+        return ','.join([key] + [f'{value}-{i}' for value in values for i in range(10)]) + '\n'
+
+    header = ','.join(f'head{i}' for i in range(21)) + '\n'
+    lhs.write(header + row_of('key-1', 'a', 'b') + row_of('key-2', 'a', 'b') + row_of('key-4', 'a', 'b') + row_of('key-5', 'a', 'b') + row_of('key-6', 'a', 'b'))
+    rhs.write(header + row_of('key-1', 'a', 'b') + row_of('key-2', 'a', 'e') + row_of('key-3', 'a', 'b') + row_of('key-5', 'a', 'b') + row_of('key-6', 'e', 'b'))
+
+    monkeypatch.setattr(csvdiff.CsvReader.State, 'MIN_COLUMNS_AFTER_KEYS_TO_DEFER', sys.maxsize)
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-H', 'y'] + other_options
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+    assert 'Report' in expected
+
+    monkeypatch.undo()
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
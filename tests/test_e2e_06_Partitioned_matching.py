@@ -0,0 +1,88 @@
+import sys
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+def sorted_csv_text(number_of_rows, modify):
+
+    lines = ['head1, head2, head3, head4']
+    for i in range(number_of_rows):
+        line = modify(i, f'key{i // 3:04d}, "value\n{i}", value2-{i:03d}, "say ""{i}"""')
+        if line is not None:
+            lines.append(line)
+
+    return '\n'.join(lines)
+
+def modify_lhs(i, line):
+    return None if i % 17 == 0 else line
+
+def modify_rhs(i, line):
+    if i % 23 == 0:
+        return None
+    if i % 11 == 0:
+        return line.replace('"say', '"shout')
+    return line
+
+
+@pytest.mark.parametrize('report_options', [['-c'], ['-dc'], ['-ac'], ['-vdc'], ['-d', '-u', '-k0,2']])
+def test_partitioned_matching_reports_the_same_as_sequential_matching(lhs, rhs, capfd, monkeypatch, report_options):
+
+    monkeypatch.setattr(csvdiff.KeyRangePartitioner, 'MIN_PARTITION_SIZE', 1)
+    monkeypatch.setattr(csvdiff.RowBoundary, 'WINDOW_SIZE', 64)
+    monkeypatch.setattr(csvdiff.RowBoundary, 'LINEAR_SEARCH_SIZE', 64)
+
+    lhs.write(sorted_csv_text(300, modify_lhs))
+    rhs.write(sorted_csv_text(300, modify_rhs))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath] + report_options
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '--partitions', '4'] + report_options
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+def test_partitioned_matching_detects_not_sorted_in_worker(lhs, rhs, capfd, monkeypatch):
+
+    monkeypatch.setattr(csvdiff.KeyRangePartitioner, 'MIN_PARTITION_SIZE', 1)
+
+    lhs.write(sorted_csv_text(100, lambda i, line: line.replace('key0020', 'key0001')))
+    rhs.write(sorted_csv_text(100, lambda i, line: line))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '--partitions', '2']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('are not sorted.') > 0
+
+
+@pytest.mark.parametrize('line_separator', ['\r', '\r\n'])
+def test_partitioned_matching_with_line_separator_other_than_lf(lhs, rhs, capfd, monkeypatch, line_separator):
+    """ Rows end at CR or CRLF as well, as they do with universal newlines. """
+
+    monkeypatch.setattr(csvdiff.KeyRangePartitioner, 'MIN_PARTITION_SIZE', 1)
+    monkeypatch.setattr(csvdiff.RowBoundary, 'WINDOW_SIZE', 64)
+    monkeypatch.setattr(csvdiff.RowBoundary, 'LINEAR_SEARCH_SIZE', 64)
+
+    lhs.write_binary(sorted_csv_text(300, modify_lhs).replace('\n', line_separator).encode('utf8'))
+    rhs.write_binary(sorted_csv_text(300, modify_rhs).replace('\n', line_separator).encode('utf8'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dc']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+    assert 'same lines           : 0' not in expected
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dc', '--partitions', '4']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
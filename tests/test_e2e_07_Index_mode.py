@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+def sorted_csv_text(number_of_rows):
+    return '\n'.join(['head1, head2'] + [f'key{i:04d}, value{i}' for i in range(number_of_rows)])
+
+
+def test_index_mode_writes_sidecar_index(lhs, capfd):
+
+    lhs.write(sorted_csv_text(25))
+
+    sys.argv = ['csvdiff.py', 'index', lhs.strpath, '--index-interval', '10']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == f'3 entries of every 10 rows were written to {lhs.strpath}.csvdiff3-index\n'
+    assert os.path.isfile(lhs.strpath + '.csvdiff3-index')
+
+def test_index_mode_with_the_options_for_csv_file(lhs, capfd):
+
+    lhs.write('key2-2\tkey1-1\tvalue\nkey2-1\tkey1-2\tvalue\n')
+
+    sys.argv = ['csvdiff.py', 'index', lhs.strpath, '-k', '1', '-H', 'n', '--index-interval', '1']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == f'2 entries of every 1 rows were written to {lhs.strpath}.csvdiff3-index\n'
+
+def test_index_mode_detects_not_sorted(lhs, capfd):
+
+    lhs.write('head1, head2\nkey0002, value\nkey0001, value\n')
+
+    sys.argv = ['csvdiff.py', 'index', lhs.strpath]
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+    assert not os.path.isfile(lhs.strpath + '.csvdiff3-index')
+
+def test_index_mode_with_invalid_interval(lhs, capfd):
+
+    lhs.write(sorted_csv_text(3))
+
+    sys.argv = ['csvdiff.py', 'index', lhs.strpath, '--index-interval', '0']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        pytest.param(['-k', '1', '-H', 'n', '--index-interval', '1', '{file}'],  id='options before the file'),
+        pytest.param(['-H', 'n', '{file}', '-k', '1', '--index-interval', '1'],  id='options around the file'),
+    ],
+)
+def test_index_mode_with_the_options_in_any_order(lhs, capfd, arguments):
+
+    lhs.write('key2-2\tkey1-1\tvalue\nkey2-1\tkey1-2\tvalue\n')
+
+    sys.argv = ['csvdiff.py', 'index'] + [argument.format(file=lhs.strpath) for argument in arguments]
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == f'2 entries of every 1 rows were written to {lhs.strpath}.csvdiff3-index\n'
+
+def test_index_mode_with_invalid_option_before_the_file(lhs, capfd):
+
+    lhs.write(sorted_csv_text(3))
+
+    sys.argv = ['csvdiff.py', 'index', '-k', 'x', lhs.strpath]
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code != 0
+    assert not os.path.isfile(lhs.strpath + '.csvdiff3-index')
@@ -0,0 +1,129 @@
+import sys
+import textwrap
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+def sorted_csv_text(modify):
+
+    lines = ['head1, head2, head3']
+    for i in range(40):
+        line = modify(i, f'key{i:04d}, "value\n{i}", v{i}')
+        if line is not None:
+            lines.append(line)
+
+    return '\n'.join(lines)
+
+def modify_rhs(i, line):
+    if i % 7 == 0:
+        return None
+    if i % 5 == 0:
+        return line.replace(f'v{i}', 'vx')
+    return line
+
+
+@pytest.mark.parametrize('window_size', [64, 64 * 1024])
+def test_key_range_from_and_to(lhs, rhs, capfd, monkeypatch, window_size):
+
+    monkeypatch.setattr(csvdiff.RowBoundary, 'WINDOW_SIZE', window_size)
+    monkeypatch.setattr(csvdiff.RowBoundary, 'LINEAR_SEARCH_SIZE', window_size)
+
+    lhs.write(sorted_csv_text(lambda i, line: line))
+    rhs.write(sorted_csv_text(modify_rhs))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-c', '--key-from', 'key0010', '--key-to', 'key0021']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''
+        ============ Report ============
+
+        ● Count & Row number
+        same lines           : 7
+        left side only    (<): 2 :-- Row Numbers      -->: [16, 23]
+        right side only   (>): 0 :-- Row Numbers      -->: []
+        with differences  (!): 3 :-- Row Number Pairs -->: [(12, 10), (17, 14), (22, 19)]
+    ''')
+
+@pytest.mark.parametrize('key_range, expected_count', [
+    (['--key-to', 'key0005'],   'same lines           : 4\nleft side only    (<): 1 :-- Row Numbers      -->: [2]\nright side only   (>): 0 :-- Row Numbers      -->: []\nwith differences  (!): 1 :-- Row Number Pairs -->: [(7, 6)]\n'),
+    (['--key-from', 'key0035'], 'same lines           : 4\nleft side only    (<): 1 :-- Row Numbers      -->: [37]\nright side only   (>): 0 :-- Row Numbers      -->: []\nwith differences  (!): 0 :-- Row Number Pairs -->: []\n'),
+    (['--key-from', 'key0100'], 'same lines           : 0\nleft side only    (<): 0 :-- Row Numbers      -->: []\nright side only   (>): 0 :-- Row Numbers      -->: []\nwith differences  (!): 0 :-- Row Number Pairs -->: []\n'),
+])
+def test_key_range_open_ended(lhs, rhs, capfd, key_range, expected_count):
+
+    lhs.write(sorted_csv_text(lambda i, line: line))
+    rhs.write(sorted_csv_text(modify_rhs))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-c'] + key_range
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out.endswith('● Count & Row number\n' + expected_count)
+
+@pytest.mark.parametrize('report_options', [['-dc'], ['-ac'], ['-vdc']])
+def test_key_range_with_index_reports_the_same_as_without_index(lhs, rhs, capfd, report_options):
+
+    lhs.write(sorted_csv_text(lambda i, line: line))
+    rhs.write(sorted_csv_text(modify_rhs))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '--key-from', 'key0012', '--key-to', 'key0030'] + report_options
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    for csv_file in (lhs, rhs):
+        sys.argv = ['csvdiff.py', 'index', csv_file.strpath, '--index-interval', '3']
+        csvdiff.main()
+    capfd.readouterr()
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '--key-from', 'key0012', '--key-to', 'key0030'] + report_options
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+@pytest.mark.parametrize('window_size', [64, 64 * 1024])
+@pytest.mark.parametrize('line_separator', ['\r', '\r\n'])
+def test_key_range_with_line_separator_other_than_lf(lhs, rhs, capfd, monkeypatch, window_size, line_separator):
+    """ The rows in the key range are found by the line ends of universal newlines. """
+
+    monkeypatch.setattr(csvdiff.RowBoundary, 'WINDOW_SIZE', window_size)
+    monkeypatch.setattr(csvdiff.RowBoundary, 'LINEAR_SEARCH_SIZE', window_size)
+
+    lhs.write(sorted_csv_text(lambda i, line: line))
+    rhs.write(sorted_csv_text(modify_rhs))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dc', '--key-from', 'key0010', '--key-to', 'key0021']
+    csvdiff.main()
+    expected, _ = capfd.readouterr()
+
+    lhs.write_binary(sorted_csv_text(lambda i, line: line).replace('\n', line_separator).encode('utf8'))
+    rhs.write_binary(sorted_csv_text(modify_rhs).replace('\n', line_separator).encode('utf8'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-dc', '--key-from', 'key0010', '--key-to', 'key0021']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == expected
+
+@pytest.mark.parametrize('options', [
+    ['--key-from', 'key0010', '--matching-engine', 'hash-join'],
+    ['--key-from', 'key0010,v1'],
+    ['--key-from', 'key0020', '--key-to', 'key0010'],
+])
+def test_key_range_with_invalid_options(lhs, rhs, capfd, options):
+
+    lhs.write(sorted_csv_text(lambda i, line: line))
+    rhs.write(sorted_csv_text(modify_rhs))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath] + options
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
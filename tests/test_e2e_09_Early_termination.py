@@ -0,0 +1,142 @@
+import sys
+import textwrap
+
+import pytest
+
+from src.csvdiff3 import csvdiff
+
+
+LHS = textwrap.dedent('''
+    head1, head2, head3
+    1, value1-1, value2-1
+    2, value1-2, value2-2
+    3, value1-3, value2-3
+    4, value1-4, value2-4
+    6, value1-6, value2-6
+''').strip()
+
+RHS = textwrap.dedent('''
+    head1, head2, head3
+    1, value1-1, value2-1
+    2, value1-e, value2-2
+    4, value1-4, value2-e
+    5, value1-5, value2-5
+    6, value1-6, value2-6
+''').strip()
+
+
+def test_max_differences_stops_matching(lhs, rhs, capfd):
+
+    lhs.write(LHS)
+    rhs.write(RHS)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0', '-dc', '--max-differences', '2']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    assert out == textwrap.dedent('''
+        ============ Report ============
+
+        ● Differences
+        -----------------------------------------------------------------------------------------------------
+        left.csv                            right.csv                          Column indices with difference
+        -----------------------------------------------------------------------------------------------------
+        3 ['2', 'value1-2', 'value2-2']  !  3 ['2', 'value1-e', 'value2-2']  @ [1]
+        4 ['3', 'value1-3', 'value2-3']  <  
+
+        ● Count & Row number
+        same lines           : 1
+        left side only    (<): 1 :-- Row Numbers      -->: [4]
+        right side only   (>): 0 :-- Row Numbers      -->: []
+        with differences  (!): 1 :-- Row Number Pairs -->: [(3, 3)]
+    ''')
+
+
+@pytest.mark.parametrize("matching_engine", ['sort-merge', 'hash-join', 'external-sort'])
+def test_max_differences_counts_up_to_the_limit(lhs, rhs, capfd, matching_engine):
+
+    lhs.write(LHS)
+    rhs.write(RHS)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0', '--matching-engine', matching_engine, '--max-differences', '3', '--without-row-numbers']
+    csvdiff.main()
+
+    out, err = capfd.readouterr()
+    assert err == ''
+    # Which differences are found first depends on the engine, so only the total is asserted
+    numbers_of_differences = [int(line.rsplit(':', 1)[1]) for line in out.splitlines()[-3:]]
+    assert sum(numbers_of_differences) == 3
+
+
+@pytest.mark.parametrize(
+    "lhs_data, rhs_data, expected_exit_status",
+    [
+        pytest.param(LHS, LHS, 0, id='same'),
+        pytest.param(LHS, RHS, 1, id='different'),
+    ],
+)
+def test_quiet_reports_nothing_and_exits_with_status(lhs, rhs, capfd, lhs_data, rhs_data, expected_exit_status):
+
+    lhs.write(lhs_data)
+    rhs.write(rhs_data)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0', '-q']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == expected_exit_status
+
+    out, err = capfd.readouterr()
+    assert out == ''
+    assert err == ''
+
+
+def test_quiet_exits_with_2_for_trouble(lhs, rhs, capfd):
+
+    lhs.write(LHS)
+    rhs.write(textwrap.dedent('''
+        head1, head2, head3
+        2, value1-2, value2-2
+        1, value1-1, value2-1
+    ''').strip())
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0', '-q', '--max-differences', '9']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 2
+
+    out, err = capfd.readouterr()
+    assert out == ''
+
+
+def test_quiet_exits_with_2_for_file_not_found(lhs, capfd):
+
+    lhs.write(LHS)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, lhs.strpath + '.not_found', '-k0', '-q']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 2
+
+
+def test_quiet_exits_with_2_for_decoding_error(lhs, rhs, capfd):
+
+    lhs.write(LHS)
+    rhs.write_binary(textwrap.dedent('''
+        head1, head2, head3
+        1, 値1-1, value2-1
+        2, 値1-2, value2-2
+    ''').strip().encode('shift_jis'))
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0', '-q', '-H', 'y']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 2
+
+    out, err = capfd.readouterr()
+    assert out == ''
+    assert 'UnicodeDecodeError' in err
@@ -1,3 +1,4 @@
+import socket
 import sys
 import textwrap
 
@@ -100,3 +101,21 @@ def test_specified_right_csv_file_path_is_directory(lhs, rhs, rhs_dir, capfd):
 
 
 
+
+def test_socket(lhs, tmpdir, capfd):
+    """ Only regular files, pipes and character devices are read. """
+
+    lhs.write('head1,head2\nkey1-1,value1-1\n')
+
+    socket_path = tmpdir.join('s').strpath
+    with socket.socket(socket.AF_UNIX) as rhs_socket:
+        rhs_socket.bind(socket_path)
+
+        sys.argv = ['csvdiff.py', lhs.strpath, socket_path, '-d']
+        with pytest.raises(SystemExit) as e:
+            csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find("rhs_file_path is not a file. It should be a regular file, a pipe or a character device.") > 0
@@ -1,3 +1,4 @@
+import io
 import sys
 import textwrap
 
@@ -108,3 +109,51 @@ def test_specified_out_of_range_index_for_matching_key_index_2(lhs, rhs, capfd):
 
 
 
+
+def test_specified_unknown_part_for_matching_key(lhs, rhs, capfd):
+
+    lhs.write('head1,head2\n1,value1-1\n')
+    rhs.write('head1,head2\n1,value1-1\n')
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0:8:int', '-d']
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find('MATCHING_KEY_INDICES should be INDEX[:TYPE][:MAX_LENGTH]') > 0
+    assert str(err).find('unknown parts=int') > 0
+
+@pytest.mark.parametrize('matching_engine', ['sort-merge', 'hash-join', 'external-sort'])
+@pytest.mark.parametrize('value', ['NaN', 'Infinity'])
+def test_not_finite_decimal_matching_key(lhs, rhs, capfd, matching_engine, value):
+
+    lhs.write(f'head1,head2\n1.5,value1-1\n{value},value1-2\n3,value1-3\n')
+    rhs.write('head1,head2\n1.5,value1-1\n2,value1-2\n3,value1-3\n')
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0:decimal', '-H', 'y', '-d', '--matching-engine', matching_engine]
+    with pytest.raises(SystemExit) as e:
+        csvdiff.main()
+
+    assert e.value.code == 1
+
+    _, err = capfd.readouterr()
+    assert str(err).find(f'row_number=3, row=[\'{value}\', \'value1-2\'], description=the decimal key should be a finite number. [value={value}]') > 0
+
+def test_error_is_written_after_the_reports_made_so_far(lhs, rhs, monkeypatch):
+    """ The standard output and the standard error are the same stream, as on a terminal. """
+
+    lhs.write('head1,head2\n1.5,value1-1\nNaN,value1-2\n')
+    rhs.write('head1,head2\n1.5,value1-1\n2,value1-2\n')
+
+    console = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', console)
+    monkeypatch.setattr(sys, 'stderr', console)
+
+    sys.argv = ['csvdiff.py', lhs.strpath, rhs.strpath, '-k0:decimal', '-H', 'y']
+    with pytest.raises(SystemExit):
+        csvdiff.main()
+
+    written = console.getvalue()
+    assert 0 <= written.find('Report') < written.find('ERROR: one of the matching keys can not be converted')